@@ -0,0 +1,137 @@
+"""
+rdm_builder と従来の二重ループの RDM 作成の比較
+
+1. 一致の確認: results/raw_results の結果ファイルと、仮想観察者のセッションについて、
+   各解析スクリプトで使っている組み合わせ（最大距離で正規化した平均・重み付き平均、
+   アンカーで揃えた重み付き平均）と正規化なしの平均が従来のループと 1e-12 以内で一致するか
+2. 速度: 刺激数とトライアル数を増やしたときの作成時間
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import time
+
+import numpy as np
+from scipy.spatial.distance import pdist, squareform
+
+from observer_simulator import make_design, random_space, simulate_session
+from rdm_builder import build_rdm
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RAW_RESULTS_DIR = os.path.join(BASE_DIR, "..", "results", "raw_results")
+ANCHOR_IDS = [0, 17]
+TOLERANCE = 1e-12
+SIZES = [(18, 7, 40), (18, 7, 400), (60, 10, 400), (150, 12, 1000)]  # (刺激数, 1トライアルの刺激数, トライアル数)
+
+# (normalize, weighting, anchor_ids) と、それを使っている解析スクリプト
+VARIANTS = [
+    ("max", None, None, "data_analyzer.py, data_analyzer2.py, dataana.py, dataana_eighteen_color_simple.py"),
+    ("max", "squared", None, "dataana_eight.py, dataana_eight_color.py"),
+    ("anchor", "squared", ANCHOR_IDS, "dataana_eighteen_color.py"),
+    (None, None, None, "(plain average)"),
+]
+
+
+def legacy_rdm(trials, num_items, normalize="max", weighting=None, anchor_ids=None):
+    """従来の解析スクリプトの二重ループ（比較用にそのまま残している）"""
+    sum_weighted_distances = np.zeros((num_items, num_items))
+    sum_weights = np.zeros((num_items, num_items))
+    for trial in trials:
+        items = trial["items"]
+        if len(items) < 2:
+            continue
+        ids = [item["id"] for item in items]
+        coords = np.array([[item["x"], item["y"]] for item in items])
+        dists_raw = squareform(pdist(coords))
+
+        anchor_dist = None
+        if normalize == "anchor" and anchor_ids[0] in ids and anchor_ids[1] in ids:
+            anchor_dist = dists_raw[ids.index(anchor_ids[0]), ids.index(anchor_ids[1])]
+        if normalize is None:
+            dists_scaled = dists_raw
+        elif anchor_dist is not None and anchor_dist > 0:
+            dists_scaled = dists_raw / anchor_dist
+        else:
+            max_dist = np.max(dists_raw)
+            if max_dist > 0:
+                dists_scaled = dists_raw / max_dist
+            else:
+                dists_scaled = dists_raw
+
+        for i in range(len(ids)):
+            for j in range(len(ids)):
+                id_i, id_j = ids[i], ids[j]
+                if weighting == "squared":
+                    weight = dists_raw[i, j] ** 2
+                    sum_weighted_distances[id_i, id_j] += dists_scaled[i, j] * weight
+                    sum_weights[id_i, id_j] += weight
+                else:
+                    sum_weighted_distances[id_i, id_j] += dists_scaled[i, j]
+                    sum_weights[id_i, id_j] += 1
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rdm = np.divide(sum_weighted_distances, sum_weights)
+        rdm[np.isnan(rdm)] = 0
+    np.fill_diagonal(rdm, 0)
+    return rdm
+
+
+def simulated_session(num_items, items_per_trial, num_trials, seed, anchor_items=None):
+    params, base_coords = random_space(num_items, 3, np.random.default_rng(seed))
+    design = make_design("greedy", num_items, items_per_trial, anchor_items, 3, None, random.Random(seed))
+    return simulate_session(base_coords, params, design, num_trials, np.random.default_rng(seed))
+
+
+def check_identity():
+    datasets = []
+    for path in sorted(glob.glob(os.path.join(RAW_RESULTS_DIR, "*.json"))):
+        with open(path, "r") as f:
+            data = json.load(f)
+        # 初期の形式（刺激の一覧だけのリスト）の結果ファイルは対象外
+        if isinstance(data, dict) and "trials" in data:
+            datasets.append((os.path.basename(path), data))
+    for seed in range(5):
+        datasets.append((f"simulated (seed {seed})", simulated_session(18, 7, 60, seed, ANCHOR_IDS)))
+
+    worst = 0.0
+    for name, data in datasets:
+        num_items = data["config"]["num_items_total"]
+        for normalize, weighting, anchor_ids, _ in VARIANTS:
+            if normalize == "anchor" and num_items <= max(anchor_ids):
+                continue
+            new = build_rdm(data["trials"], num_items, normalize, weighting, anchor_ids)
+            old = legacy_rdm(data["trials"], num_items, normalize, weighting, anchor_ids)
+            error = float(np.abs(new - old).max())
+            worst = max(worst, error)
+            if error > TOLERANCE:
+                raise AssertionError(f"{name}: {normalize}/{weighting} differs by {error:.3e}")
+    print(f"一致の確認: {len(datasets)} データ x {len(VARIANTS)} 種類, 最大誤差 {worst:.3e} (許容 {TOLERANCE:g})")
+    for normalize, weighting, _, users in VARIANTS:
+        print(f"  normalize={str(normalize):>6}, weighting={str(weighting):>7}: {users}")
+
+
+def benchmark(repeats):
+    print(f"\n{'N':>5} {'k':>4} {'trials':>7} {'legacy (ms)':>12} {'builder (ms)':>13} {'speedup':>8}")
+    for num_items, items_per_trial, num_trials in SIZES:
+        trials = simulated_session(num_items, items_per_trial, num_trials, 0)["trials"]
+        timings = {}
+        for label, func in (("legacy", legacy_rdm), ("builder", build_rdm)):
+            best = np.inf
+            for _ in range(repeats):
+                start_time = time.perf_counter()
+                func(trials, num_items, "max", "squared")
+                best = min(best, time.perf_counter() - start_time)
+            timings[label] = best * 1000
+        print(f"{num_items:5d} {items_per_trial:4d} {num_trials:7d} {timings['legacy']:12.2f} "
+              f"{timings['builder']:13.2f} {timings['legacy'] / timings['builder']:7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare rdm_builder with the legacy per-pair loops")
+    parser.add_argument("--repeats", type=int, default=3, help="Timing repeats (best is reported)")
+    args = parser.parse_args()
+    check_identity()
+    benchmark(args.repeats)
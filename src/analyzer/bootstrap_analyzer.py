@@ -0,0 +1,284 @@
+"""
+RDM の各ペアと MDS の各刺激の位置のブートストラップ信頼区間
+
+解析スクリプトが出す MDS の座標 (analysis_18stim_mds_coordinates.csv) は1つの点推定だけで、
+クラスタの境界が本当にあるのか誤差なのかが分からなかった。ここでは
+    1. 参加者の中でトライアルを、グループの中で参加者を復元抽出する（2段階のブートストラップ）
+    2. 各トライアルの寄与 (rdm_builder.per_trial_sums) に使用回数の行列を掛けて、全レプリケートの RDM を一度に作る
+    3. 元のデータの MDS (mds_engine) を初期値にして、各レプリケートの MDS をワーカープロセスで並列に解き、
+       Procrustes（回転・鏡映・拡大・平行移動）で元の配置に重ねる
+を行い、ペアごとの RDM の区間と、刺激ごとの信頼楕円を保存する。
+抽出で一度も選ばれなかったペアは、そのレプリケートでは欠測として区間の計算から除き、MDS では元の RDM の値で埋める。
+
+使い方:
+    python bootstrap_analyzer.py                                  # raw_results の全セッション (18刺激)
+    python bootstrap_analyzer.py ../results/raw_results/experiment_result_20251212_174248.json
+    python bootstrap_analyzer.py --replicates 5000 --level trials --plot
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from matplotlib.patches import Ellipse
+from scipy.linalg import orthogonal_procrustes
+from scipy.spatial.distance import squareform
+from scipy.stats import chi2
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "experiment"))
+from stimulus_bank import params_for_result
+from rdm_builder import per_trial_sums
+from mds_engine import fit_mds
+from group_analyzer import ANALYSES, ANCHOR_IDS, OUTPUT_DIR, RAW_RESULTS_DIR, mds_and_clusters
+
+REPLICATES = 2000
+CONFIDENCE = 0.95
+BATCH_SIZE = 100  # 1回のワーカー呼び出しで解くレプリケート数
+LEVELS = ("both", "trials", "participants")
+
+
+def load_sessions(paths, num_items=None):
+    """新しい形式の結果ファイルを読み、刺激数が num_items（省略時は最も多い刺激数）のものを返す"""
+    sessions = []
+    for path in paths:
+        with open(path, "r") as f:
+            data = json.load(f)
+        if isinstance(data, dict) and "trials" in data:
+            sessions.append((path, data))
+        else:
+            print(f"  Skipping {os.path.basename(path)} (no 'trials' key)")
+    if num_items is None:
+        sizes = [data["config"]["num_items_total"] for _, data in sessions]
+        num_items = max(set(sizes), key=sizes.count) if sizes else 0
+    for path, data in sessions:
+        if data["config"]["num_items_total"] != num_items:
+            print(f"  Skipping {os.path.basename(path)} ({data['config']['num_items_total']} stimuli, not {num_items})")
+    return [(path, data) for path, data in sessions if data["config"]["num_items_total"] == num_items], num_items
+
+
+def session_terms(sessions, num_items, analysis="weighted", anchor_ids=ANCHOR_IDS):
+    """参加者ごとの、刺激が2つ以上あるトライアルの寄与 (sums, totals)、それぞれ (T, ペア数)"""
+    normalize, weighting = ANALYSES[analysis]
+    if normalize == "anchor" and num_items <= max(anchor_ids):
+        normalize = "max"
+    terms = []
+    for _, data in sessions:
+        sums, totals = per_trial_sums(data["trials"], num_items, normalize, weighting, anchor_ids)
+        valid = totals.sum(axis=1) > 0
+        terms.append((sums[valid], totals[valid]))
+    return terms
+
+
+def _participant_rdms(counts, sums, totals):
+    """トライアルの使用回数 counts (R, T) ごとの RDM（上三角）と、ペアが提示されたかどうか"""
+    num = counts @ sums
+    den = counts @ totals
+    seen = den > 0
+    return np.divide(num, den, out=np.zeros_like(num), where=seen), seen
+
+
+def group_rdm_batch(terms, counts_per_participant, picks):
+    """picks (B, M) で選んだ参加者の RDM の平均（そのペアを見た参加者だけで平均）を一度に作る
+
+    counts_per_participant[p] は、参加者 p が選ばれた回ごとのトライアルの使用回数 (選ばれた回数, T_p)。
+    """
+    num_replicates, num_pairs = len(picks), terms[0][0].shape[1]
+    total = np.zeros((num_replicates, num_pairs))
+    n_seen = np.zeros((num_replicates, num_pairs))
+    for p, (sums, totals) in enumerate(terms):
+        rows = np.nonzero(picks == p)[0]
+        if len(rows) == 0:
+            continue
+        rdm, seen = _participant_rdms(counts_per_participant[p], sums, totals)
+        np.add.at(total, rows, rdm)
+        np.add.at(n_seen, rows, seen)
+    seen = n_seen > 0
+    return np.divide(total, n_seen, out=np.zeros_like(total), where=seen), seen
+
+
+def bootstrap_rdms(terms, replicates=REPLICATES, level="both", rng=None):
+    """全レプリケートの (RDM (B, ペア数), 提示されたかどうか (B, ペア数))
+
+    level: both = 参加者とトライアルの両方、trials = トライアルだけ、participants = 参加者だけを復元抽出する。
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    num_participants = len(terms)
+    if level in ("both", "participants") and num_participants > 1:
+        picks = rng.integers(0, num_participants, (replicates, num_participants))
+    else:
+        picks = np.tile(np.arange(num_participants), (replicates, 1))
+    counts = []
+    for p, (sums, _) in enumerate(terms):
+        num_trials = len(sums)
+        num_picks = int((picks == p).sum())
+        if level == "participants":
+            counts.append(np.ones((num_picks, num_trials)))
+        else:
+            counts.append(rng.multinomial(num_trials, np.full(num_trials, 1.0 / num_trials), num_picks).astype(float))
+    return group_rdm_batch(terms, counts, picks)
+
+
+def align(pos, reference):
+    """pos を回転・鏡映・拡大・平行移動で reference に重ねる"""
+    pos_c = pos - pos.mean(axis=0)
+    ref_mean = reference.mean(axis=0)
+    rotation, sv_sum = orthogonal_procrustes(pos_c, reference - ref_mean)
+    norm = (pos_c ** 2).sum()
+    scale = sv_sum / norm if norm > 0 else 1.0
+    return scale * pos_c @ rotation + ref_mean
+
+
+def _embed_batch(task):
+    """ワーカープロセスで、元の配置を初期値にした MDS を解いて重ねた座標 (b, N, dims) を返す"""
+    rdms, reference = task
+    dims = reference.shape[1]
+    out = np.empty((len(rdms), len(reference), dims))
+    for b, rdm in enumerate(rdms):
+        mds = fit_mds(squareform(rdm, checks=False), dims, init=reference, cache=False)
+        out[b] = align(mds["positions"], reference)
+    return out
+
+
+def bootstrap_positions(rdms, seen, reference_rdm, reference_pos, workers=None, batch_size=BATCH_SIZE):
+    """各レプリケートの MDS の座標 (B, N, dims)。欠測のペアは元の RDM の値で埋める"""
+    filled = np.where(seen, rdms, reference_rdm[None, :])
+    tasks = [(filled[i:i + batch_size], reference_pos) for i in range(0, len(filled), batch_size)]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        return np.concatenate(list(executor.map(_embed_batch, tasks)))
+
+
+def confidence_ellipses(positions, confidence=CONFIDENCE):
+    """刺激ごとの最初の2次元の信頼楕円 (中心 (N, 2), 幅, 高さ, 角度[度])"""
+    xy = positions[:, :, :2]
+    center = xy.mean(axis=0)
+    dev = xy - center
+    cov = np.einsum('bni,bnj->nij', dev, dev) / max(len(xy) - 1, 1)
+    values, vectors = np.linalg.eigh(cov)
+    radius = np.sqrt(chi2.ppf(confidence, 2) * np.maximum(values, 0))
+    width, height = 2 * radius[:, 1], 2 * radius[:, 0]
+    angle = np.degrees(np.arctan2(vectors[:, 1, 1], vectors[:, 0, 1]))
+    return center, width, height, angle
+
+
+def pair_intervals(rdms, seen, confidence=CONFIDENCE):
+    """ペアごとの (下限, 上限, 標準誤差, 欠測の割合)。欠測のレプリケートは除く"""
+    values = np.where(seen, rdms, np.nan)
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        low, high = np.nanquantile(values, [alpha, 1 - alpha], axis=0)
+        se = np.nanstd(values, axis=0, ddof=1)
+    return low, high, se, 1.0 - seen.mean(axis=0)
+
+
+def run_bootstrap(paths, num_items=None, analysis="weighted", anchor_ids=ANCHOR_IDS, replicates=REPLICATES,
+                  level="both", dims=2, confidence=CONFIDENCE, workers=None, master_seed=0, output_dir=OUTPUT_DIR,
+                  plot=False):
+    sessions, num_items = load_sessions(paths, num_items)
+    if not sessions:
+        print("No result files to analyze.")
+        return None
+    terms = session_terms(sessions, num_items, analysis, anchor_ids)
+    iu = np.triu_indices(num_items, 1)
+
+    # 元のデータ（全参加者・全トライアル）の RDM と MDS
+    full_counts = [np.ones((1, len(sums))) for sums, _ in terms]
+    reference_rdm, reference_seen = group_rdm_batch(terms, full_counts, np.arange(len(terms))[None, :])
+    reference_rdm = reference_rdm[0]
+    reference_pos, stress, best_k, clusters = mds_and_clusters(squareform(reference_rdm, checks=False), dims)
+
+    print(f"Bootstrap: {len(sessions)} sessions, {num_items} stimuli, {replicates} replicates "
+          f"(resampling: {level}, analysis: {analysis})")
+    start_time = time.perf_counter()
+    rdms, seen = bootstrap_rdms(terms, replicates, level, np.random.default_rng(master_seed))
+    rdm_time = time.perf_counter() - start_time
+    positions = bootstrap_positions(rdms, seen, reference_rdm, reference_pos, workers)
+    elapsed = time.perf_counter() - start_time
+    print(f"  RDMs: {rdm_time:.2f} s, MDS + Procrustes: {elapsed - rdm_time:.2f} s, total {elapsed:.2f} s")
+
+    low, high, se, missing = pair_intervals(rdms, seen, confidence)
+    center, width, height, angle = confidence_ellipses(positions, confidence)
+    alpha = (1 - confidence) / 2
+    pos_low, pos_high = np.quantile(positions, [alpha, 1 - alpha], axis=0)
+
+    id_to_params = params_for_result(sessions[0][1])
+    if id_to_params is None:
+        id_to_params = {}
+        for _, data in sessions:
+            for trial in data["trials"]:
+                for item in trial["items"]:
+                    id_to_params.setdefault(item["id"], item.get("params", {}))
+
+    pair_rows = [{"ID_i": int(i), "ID_j": int(j), "RDM": reference_rdm[p], "CI_Low": low[p], "CI_High": high[p],
+                  "SE": se[p], "Missing_Frac": missing[p]} for p, (i, j) in enumerate(zip(*iu))]
+    stim_rows = []
+    for i in range(num_items):
+        params = id_to_params.get(i, {})
+        row = {"ID": i, "Cluster": clusters[i]}
+        for d in range(dims):
+            row[f"MDS_Dim{d + 1}"] = reference_pos[i, d]
+            row[f"MDS_Dim{d + 1}_Low"] = pos_low[i, d]
+            row[f"MDS_Dim{d + 1}_High"] = pos_high[i, d]
+        row.update({"Ellipse_X": center[i, 0], "Ellipse_Y": center[i, 1], "Ellipse_Width": width[i],
+                    "Ellipse_Height": height[i], "Ellipse_Angle": angle[i],
+                    "Dist": params.get("dist", 0), "Velo": params.get("velo", 0),
+                    "AM_Freq": params.get("am_freq", 0)})
+        stim_rows.append(row)
+
+    os.makedirs(output_dir, exist_ok=True)
+    prefix = os.path.join(output_dir, f"bootstrap_{num_items}stim_{analysis}_{level}")
+    pd.DataFrame(pair_rows).to_csv(f"{prefix}_rdm_intervals.csv", index=False)
+    pd.DataFrame(stim_rows).to_csv(f"{prefix}_mds_ellipses.csv", index=False)
+    print(f"Saved: {prefix}_rdm_intervals.csv, {prefix}_mds_ellipses.csv")
+    widest = np.argsort(high - low)[::-1][:5]
+    print(f"  Widest {confidence:.0%} RDM intervals: " + ", ".join(
+        f"({iu[0][p]}, {iu[1][p]}) {low[p]:.3f}-{high[p]:.3f}" for p in widest))
+
+    if plot and dims >= 2:
+        fig, ax = plt.subplots(figsize=(9, 8))
+        colors = plt.get_cmap('tab10')
+        for i in range(num_items):
+            ax.add_patch(Ellipse(center[i], width[i], height[i], angle=angle[i], alpha=0.25,
+                                 color=colors(clusters[i] % 10)))
+        ax.scatter(reference_pos[:, 0], reference_pos[:, 1], c=[colors(c % 10) for c in clusters], s=120,
+                   edgecolor='black')
+        for i in range(num_items):
+            ax.text(reference_pos[i, 0] + 0.02, reference_pos[i, 1] + 0.02, str(i), fontsize=9)
+        ax.set_title(f"MDS with {confidence:.0%} bootstrap ellipses ({replicates} replicates, K={best_k})")
+        ax.set_xlabel("Dimension 1")
+        ax.set_ylabel("Dimension 2")
+        ax.grid(True, linestyle='--', alpha=0.6)
+        ax.set_aspect('equal', adjustable='datalim')
+        plt.show()
+    return {"reference_rdm": reference_rdm, "reference_pos": reference_pos, "rdms": rdms, "seen": seen,
+            "positions": positions}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bootstrap confidence intervals for the RDM and MDS map")
+    parser.add_argument("files", nargs="*", help="Result files (default: all files in raw_results)")
+    parser.add_argument("--items", type=int, default=None,
+                        help="Only use sessions with this many stimuli (default: the most common)")
+    parser.add_argument("--analysis", choices=sorted(ANALYSES), default="weighted")
+    parser.add_argument("--anchors", type=int, nargs=2, default=ANCHOR_IDS, help="Anchor ids for the weighted analysis")
+    parser.add_argument("--replicates", type=int, default=REPLICATES)
+    parser.add_argument("--level", choices=LEVELS, default="both",
+                        help="Resample participants and trials, trials within participants only, or participants only")
+    parser.add_argument("--dims", type=int, default=2, help="MDS dimensions")
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE)
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--master-seed", type=int, default=0)
+    parser.add_argument("--plot", action="store_true", help="Show the MDS map with confidence ellipses")
+    args = parser.parse_args()
+
+    paths = args.files or sorted(glob.glob(os.path.join(RAW_RESULTS_DIR, "*.json")))
+    run_bootstrap(paths, args.items, args.analysis, args.anchors, args.replicates, args.level, args.dims,
+                  args.confidence, args.workers, args.master_seed, plot=args.plot)
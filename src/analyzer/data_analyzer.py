@@ -4,8 +4,8 @@ import matplotlib.pyplot as plt
 from sklearn.manifold import MDS
 from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_score
-from scipy.spatial.distance import pdist, squareform
 from mpl_toolkits.mplot3d import Axes3D  # 3D描画用
+from rdm_builder import build_rdm
 
 # ==========================================
 # 解析したいJSONファイル名を指定してください
@@ -19,34 +19,8 @@ def analyze_experiment_3d(json_path):
         data = json.load(f)
 
     num_items = data["config"]["num_items_total"]
-    sum_distances = np.zeros((num_items, num_items))
-    counts = np.zeros((num_items, num_items))
-
     print(f"Loading {len(data['trials'])} trials...")
-
-    for trial in data["trials"]:
-        items = trial["items"]
-        if len(items) < 2:
-            continue
-        ids = [item["id"] for item in items]
-        coords = np.array([[item["x"], item["y"]] for item in items])
-        dists = squareform(pdist(coords))
-        max_dist = np.max(dists)
-        if max_dist > 0:
-            dists_norm = dists / max_dist
-        else:
-            dists_norm = dists
-
-        for i in range(len(ids)):
-            for j in range(len(ids)):
-                id_i, id_j = ids[i], ids[j]
-                sum_distances[id_i, id_j] += dists_norm[i, j]
-                counts[id_i, id_j] += 1
-
-    with np.errstate(divide='ignore', invalid='ignore'):
-        rdm = np.divide(sum_distances, counts)
-        rdm[np.isnan(rdm)] = 0
-    np.fill_diagonal(rdm, 0)
+    rdm = build_rdm(data["trials"], num_items, normalize="max")
 
     # --- 2. MDSを「3次元」で実行 ---
     print("\nCalculating MDS in 3D...")
@@ -1,12 +1,16 @@
 import json
-import numpy as np
 import pandas as pd  # データ保存用にpandasを追加
 import matplotlib.pyplot as plt
 from sklearn.manifold import MDS
 from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_score
-from scipy.spatial.distance import pdist, squareform
 from mpl_toolkits.mplot3d import Axes3D
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "experiment"))
+from stimulus_bank import params_for_result
+from rdm_builder import build_rdm
 
 # ==========================================
 # 解析したいJSONファイル名
@@ -22,40 +26,20 @@ def analyze_and_save(json_path):
     
     # 後でCSVに物理パラメータも載せるために、IDごとのパラメータ辞書を作っておく
     # (trialsの中から情報を探して埋める)
-    id_to_params = {}
-    for trial in data["trials"]:
-        for item in trial["items"]:
-            if item["id"] not in id_to_params:
-                id_to_params[item["id"]] = item["params"]
-        if len(id_to_params) == num_items:
-            break
+    # 刺激バンクを使って記録した結果なら、パラメータはバンクからIDで引く
+    id_to_params = params_for_result(data)
+    if id_to_params is None:
+        id_to_params = {}
+        for trial in data["trials"]:
+            for item in trial["items"]:
+                if item["id"] not in id_to_params:
+                    id_to_params[item["id"]] = item["params"]
+            if len(id_to_params) == num_items:
+                break
 
     # --- 2. RDM (非類似度行列) の作成 ---
-    sum_distances = np.zeros((num_items, num_items))
-    counts = np.zeros((num_items, num_items))
     print(f"Loading {len(data['trials'])} trials...")
-
-    for trial in data["trials"]:
-        items = trial["items"]
-        if len(items) < 2:
-            continue
-        ids = [item["id"] for item in items]
-        coords = np.array([[item["x"], item["y"]] for item in items])
-        dists = squareform(pdist(coords))
-        max_dist = np.max(dists)
-        if max_dist > 0: dists_norm = dists / max_dist
-        else: dists_norm = dists
-
-        for i in range(len(ids)):
-            for j in range(len(ids)):
-                id_i, id_j = ids[i], ids[j]
-                sum_distances[id_i, id_j] += dists_norm[i, j]
-                counts[id_i, id_j] += 1
-
-    with np.errstate(divide='ignore', invalid='ignore'):
-        rdm = np.divide(sum_distances, counts)
-        rdm[np.isnan(rdm)] = 0
-    np.fill_diagonal(rdm, 0)
+    rdm = build_rdm(data["trials"], num_items, normalize="max")
 
     # ★保存1: RDMをCSVに保存
     df_rdm = pd.DataFrame(rdm)
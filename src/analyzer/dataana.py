@@ -4,8 +4,9 @@ import matplotlib.pyplot as plt
 from sklearn.manifold import MDS
 from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_score
-from scipy.spatial.distance import pdist, squareform
+from scipy.spatial.distance import squareform
 from scipy.cluster.hierarchy import dendrogram, linkage
+from rdm_builder import build_rdm
 
 # ==========================================
 # 設定: 解析したいJSONファイル名を指定してください
@@ -19,47 +20,9 @@ def analyze_experiment(json_path):
 
     num_items = data["config"]["num_items_total"]
     
-    # 距離の蓄積用 (分子: 距離の合計, 分母: 回数)
-    sum_distances = np.zeros((num_items, num_items))
-    counts = np.zeros((num_items, num_items))
-
+    # トライアル内の「最大距離」で割って 0~1 にした距離の平均 (Zoom-inの影響を補正するため)
     print(f"Loading {len(data['trials'])} trials...")
-
-    for trial in data["trials"]:
-        items = trial["items"]
-        if len(items) < 2:
-            continue
-            
-        # トライアル内の各点の座標を取得
-        ids = [item["id"] for item in items]
-        coords = np.array([[item["x"], item["y"]] for item in items])
-        
-        # 距離行列を計算
-        dists = squareform(pdist(coords))
-        
-        # 正規化: このトライアル内の「最大距離」で割って 0~1 にする
-        # (Zoom-inの影響を補正するため)
-        max_dist = np.max(dists)
-        if max_dist > 0:
-            dists_norm = dists / max_dist
-        else:
-            dists_norm = dists
-
-        # 全体行列に加算
-        for i in range(len(ids)):
-            for j in range(len(ids)):
-                id_i, id_j = ids[i], ids[j]
-                sum_distances[id_i, id_j] += dists_norm[i, j]
-                counts[id_i, id_j] += 1
-
-    # 平均をとって非類似度行列(RDM)を完成させる
-    # (回数が0の場所は0のままにする)
-    with np.errstate(divide='ignore', invalid='ignore'):
-        rdm = np.divide(sum_distances, counts)
-        rdm[np.isnan(rdm)] = 0
-
-    # 対角成分を0にする念押し
-    np.fill_diagonal(rdm, 0)
+    rdm = build_rdm(data["trials"], num_items, normalize="max")
 
     # ヒートマップ表示
     plt.figure(figsize=(6, 5))
@@ -1,12 +1,17 @@
 import json
-import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from sklearn.manifold import MDS
 from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_score
-from scipy.spatial.distance import pdist, squareform
+from scipy.spatial.distance import squareform
 from scipy.cluster.hierarchy import dendrogram, linkage
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "experiment"))
+from stimulus_bank import params_for_result
+from rdm_builder import build_rdm
 
 # ==========================================
 # 設定: 解析したいJSONファイル名を指定してください
@@ -22,53 +27,21 @@ def analyze_experiment_2d(json_path):
     num_items = data["config"]["num_items_total"]
     
     # パラメータ情報の抽出
-    id_to_params = {}
-    for trial in data["trials"]:
-        for item in trial["items"]:
-            if item["id"] not in id_to_params:
-                id_to_params[item["id"]] = item["params"]
-        if len(id_to_params) == num_items:
-            break
+    # 刺激バンクを使って記録した結果なら、パラメータはバンクからIDで引く
+    id_to_params = params_for_result(data)
+    if id_to_params is None:
+        id_to_params = {}
+        for trial in data["trials"]:
+            for item in trial["items"]:
+                if item["id"] not in id_to_params:
+                    id_to_params[item["id"]] = item["params"]
+            if len(id_to_params) == num_items:
+                break
 
     # --- 2. 重み付き平均によるRDM作成 ---
-    sum_weighted_distances = np.zeros((num_items, num_items))
-    sum_weights = np.zeros((num_items, num_items))
-
     print(f"Processing {len(data['trials'])} trials using Weighted Average...")
-
-    for trial in data["trials"]:
-        items = trial["items"]
-        if len(items) < 2:
-            continue
-            
-        ids = [item["id"] for item in items]
-        coords = np.array([[item["x"], item["y"]] for item in items])
-        
-        # 生の距離 (ピクセル単位)
-        dists_raw = squareform(pdist(coords))
-        
-        # スケーリング (最大距離で割る)
-        max_dist = np.max(dists_raw)
-        if max_dist > 0:
-            dists_scaled = dists_raw / max_dist
-        else:
-            dists_scaled = dists_raw
-
-        # ★重み = 距離の2乗 (S/N比考慮)
-        weights = dists_raw ** 2
-
-        # 加算
-        for i in range(len(ids)):
-            for j in range(len(ids)):
-                id_i, id_j = ids[i], ids[j]
-                sum_weighted_distances[id_i, id_j] += dists_scaled[i, j] * weights[i, j]
-                sum_weights[id_i, id_j] += weights[i, j]
-
-    # 加重平均計算
-    with np.errstate(divide='ignore', invalid='ignore'):
-        rdm = np.divide(sum_weighted_distances, sum_weights)
-        rdm[np.isnan(rdm)] = 0 
-    np.fill_diagonal(rdm, 0)
+    # スケーリングは最大距離、重み = 距離の2乗 (S/N比考慮)
+    rdm = build_rdm(data["trials"], num_items, normalize="max", weighting="squared")
 
     # RDM保存
     pd.DataFrame(rdm).to_csv("analysis_rdm.csv")
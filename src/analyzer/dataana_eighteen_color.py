@@ -6,8 +6,12 @@ import matplotlib.cm as cm
 from sklearn.manifold import MDS
 from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_score
-from scipy.spatial.distance import pdist, squareform
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "experiment"))
+from stimulus_bank import params_for_result
+from rdm_builder import build_rdm
 
 # ==========================================
 # ★ここに18刺激実験の結果ファイル名（JSON）を指定してください
@@ -28,60 +32,22 @@ def analyze_18stimuli_with_plots(json_path):
     
     # パラメータ情報の抽出
     # 18刺激の場合、Velo=[10, 100, 1000], AM=[0, 20, 100] などが含まれます
-    id_to_params = {}
-    for trial in data["trials"]:
-        for item in trial["items"]:
-            if item["id"] not in id_to_params:
-                id_to_params[item["id"]] = item["params"]
-        if len(id_to_params) == num_items:
-            break
+    # 刺激バンクを使って記録した結果なら、パラメータはバンクからIDで引く
+    id_to_params = params_for_result(data)
+    if id_to_params is None:
+        id_to_params = {}
+        for trial in data["trials"]:
+            for item in trial["items"]:
+                if item["id"] not in id_to_params:
+                    id_to_params[item["id"]] = item["params"]
+            if len(id_to_params) == num_items:
+                break
 
     # --- 2. 重み付き平均によるRDM作成 ---
-    sum_weighted_distances = np.zeros((num_items, num_items))
-    sum_weights = np.zeros((num_items, num_items))
-
     print(f"Processing {len(data['trials'])} trials using Weighted Average...")
-
-    for trial in data["trials"]:
-        items = trial["items"]
-        if len(items) < 2:
-            continue
-            
-        ids = [item["id"] for item in items]
-        coords = np.array([[item["x"], item["y"]] for item in items])
-        dists_raw = squareform(pdist(coords))
-        
-        # スケーリング: アンカー刺激間の距離を基準にする
-        anchor_dist = None
-        if ANCHOR_IDS[0] in ids and ANCHOR_IDS[1] in ids:
-            idx_0 = ids.index(ANCHOR_IDS[0])
-            idx_17 = ids.index(ANCHOR_IDS[1])
-            anchor_dist = dists_raw[idx_0, idx_17]
-        
-        if anchor_dist is not None and anchor_dist > 0:
-            dists_scaled = dists_raw / anchor_dist
-        else:
-            # フォールバック（アンカーがない試行は最大距離で）
-            max_dist = np.max(dists_raw)
-            if max_dist > 0:
-                dists_scaled = dists_raw / max_dist
-            else:
-                dists_scaled = dists_raw
-
-        # 重み (距離の2乗)
-        weights = dists_raw ** 2
-
-        # 加算
-        for i in range(len(ids)):
-            for j in range(len(ids)):
-                id_i, id_j = ids[i], ids[j]
-                sum_weighted_distances[id_i, id_j] += dists_scaled[i, j] * weights[i, j]
-                sum_weights[id_i, id_j] += weights[i, j]
-
-    with np.errstate(divide='ignore', invalid='ignore'):
-        rdm = np.divide(sum_weighted_distances, sum_weights)
-        rdm[np.isnan(rdm)] = 0 
-    np.fill_diagonal(rdm, 0)
+    # スケーリング: アンカー刺激間の距離を基準にする（アンカーがない試行は最大距離で）、重みは距離の2乗
+    rdm = build_rdm(data["trials"], num_items, normalize="anchor", weighting="squared",
+                    anchor_ids=ANCHOR_IDS)
     
     # RDM保存
     pd.DataFrame(rdm).to_csv("analysis_18stim_rdm.csv")
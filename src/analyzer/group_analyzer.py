@@ -0,0 +1,283 @@
+"""
+results/raw_results の全セッションをまとめて解析するグループ解析パイプライン
+
+これまでの解析スクリプトは JSON_FILE に1つの結果ファイルを指定して1つの RDM を作っていた。
+ここでは
+    1. raw_results の結果ファイルを探し、刺激数が同じものを集める
+    2. ファイルごとの RDM とペアの提示回数を ProcessPoolExecutor で並列に作る
+       （ファイルの内容と解析の設定ごとにキャッシュし、新しいセッションを足したときはそのファイルだけ処理する）
+    3. 参加者の RDM の平均（そのペアを見た参加者だけで平均）と、ペアごとの参加者数・提示回数をまとめ、
+       グループの RDM で MDS とクラスタリングを1回だけ行う
+を行い、結果を results/analyzed_results/group に保存する。
+
+使い方:
+    python group_analyzer.py                      # 18刺激・アンカー [0, 17] で重み付き RDM
+    python group_analyzer.py --items 8 --analysis weighted-max
+    python group_analyzer.py --pattern "experiment_result_*.json" --dims 3
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from sklearn.cluster import KMeans
+from sklearn.metrics import silhouette_score
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "experiment"))
+from stimulus_bank import params_for_result
+from rdm_builder import accumulate, rdm_from_sums
+from mds_engine import dimension_sweep, fit_mds
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RAW_RESULTS_DIR = os.path.normpath(os.path.join(BASE_DIR, "..", "results", "raw_results"))
+OUTPUT_DIR = os.path.normpath(os.path.join(BASE_DIR, "..", "results", "analyzed_results", "group"))
+CACHE_DIR = os.path.join(OUTPUT_DIR, "cache")
+CACHE_VERSION = 1
+
+ANCHOR_IDS = [0, 17]
+# 解析の種類 -> rdm_builder の (normalize, weighting)
+ANALYSES = {
+    "weighted": ("anchor", "squared"),  # dataana_eighteen_color.py
+    "weighted-max": ("max", "squared"),  # dataana_eight.py, dataana_eight_color.py
+    "average": ("max", None),  # data_analyzer.py, dataana.py など
+}
+
+
+def participant_name(path):
+    """experiment_result_<名前>_<日付>_<時刻>.json の <名前>（名前がなければファイル名）"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    parts = stem.split("_")
+    if stem.startswith("experiment_result_") and len(parts) > 4:
+        return "_".join(parts[2:-2])
+    return stem
+
+
+def _settings(analysis, anchor_ids):
+    normalize, weighting = ANALYSES[analysis]
+    return {"version": CACHE_VERSION, "normalize": normalize, "weighting": weighting,
+            "anchor_ids": list(anchor_ids) if normalize == "anchor" else None}
+
+
+def cache_path(path, content_hash, settings, cache_dir=CACHE_DIR):
+    """ファイルの内容と解析の設定が同じなら同じになるキャッシュのパス"""
+    key = hashlib.sha1(json.dumps([content_hash, settings], sort_keys=True).encode()).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{stem}_{key}.npz")
+
+
+def _file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _write_atomic(path, **arrays):
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def analyze_file(task):
+    """ワーカープロセスで1ファイルを読み、RDM と提示回数を作ってキャッシュに保存する
+
+    trials のないファイル（初期の形式の結果ファイルなど）は None を返す（次回から読まないよう、そのこともキャッシュする）。
+    """
+    path, settings, out_path = task
+    with open(path, "r") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or "trials" not in data:
+        _write_atomic(out_path, meta=np.array(json.dumps({"path": path, "skipped": True})))
+        return path, None
+
+    num_items = data["config"]["num_items_total"]
+    normalize, weighting = settings["normalize"], settings["weighting"]
+    if normalize == "anchor" and num_items <= max(settings["anchor_ids"]):
+        normalize = "max"  # アンカーのない刺激数の実験
+    sums, totals = accumulate(data["trials"], num_items, normalize, weighting, settings["anchor_ids"])
+    _, counts = accumulate(data["trials"], num_items, normalize="max")
+
+    id_to_params = params_for_result(data)
+    if id_to_params is None:
+        id_to_params = {}
+        for trial in data["trials"]:
+            for item in trial["items"]:
+                id_to_params.setdefault(item["id"], item.get("params", {}))
+    meta = {
+        "path": path,
+        "participant": participant_name(path),
+        "num_items": num_items,
+        "num_trials": len(data["trials"]),
+        "stimulus_bank": data["config"].get("stimulus_bank"),
+        "design_id": data["config"].get("design_id"),
+        "params": {str(i): {k: p.get(k) for k in ("dist", "velo", "am_freq")} for i, p in id_to_params.items()},
+    }
+    result = {"rdm": rdm_from_sums(sums, totals), "counts": counts, "meta": meta}
+    _write_atomic(out_path, rdm=result["rdm"], counts=counts, meta=np.array(json.dumps(meta)))
+    return path, result
+
+
+def load_cached(path):
+    with np.load(path) as f:
+        meta = json.loads(str(f["meta"]))
+        if meta.get("skipped"):
+            return None
+        return {"rdm": f["rdm"], "counts": f["counts"], "meta": meta}
+
+
+def collect_participants(paths, analysis="weighted", anchor_ids=ANCHOR_IDS, workers=None, cache_dir=CACHE_DIR):
+    """各ファイルの結果（キャッシュがなければ並列に作る）を [{"rdm", "counts", "meta"}, ...] で返す"""
+    settings = _settings(analysis, anchor_ids)
+    os.makedirs(cache_dir, exist_ok=True)
+    results = {}
+    tasks = []
+    skipped = []
+    for path in paths:
+        out_path = cache_path(path, _file_hash(path), settings, cache_dir)
+        if os.path.exists(out_path):
+            results[path] = load_cached(out_path)
+            if results[path] is None:
+                skipped.append(path)
+        else:
+            tasks.append((path, settings, out_path))
+
+    print(f"{len(paths)} files: {len(paths) - len(tasks)} cached, {len(tasks)} to process")
+    if tasks:
+        with ProcessPoolExecutor(max_workers=min(len(tasks), workers or os.cpu_count() or 1)) as executor:
+            for path, result in executor.map(analyze_file, tasks):
+                if result is None:
+                    skipped.append(path)
+                results[path] = result
+    for path in skipped:
+        print(f"  Skipping {os.path.basename(path)} (no 'trials' key)")
+    return [results[path] for path in paths if results[path] is not None]
+
+
+def group_rdm(participants, num_items):
+    """(参加者の RDM の平均, ペアを見た参加者数, ペアの提示回数の合計)
+
+    平均はそのペアを提示された参加者だけでとり、誰も見ていないペアは 0 にする。
+    """
+    seen = np.array([p["counts"] > 0 for p in participants])
+    rdms = np.array([p["rdm"] for p in participants])
+    coverage = seen.sum(axis=0)
+    presentations = np.sum([p["counts"] for p in participants], axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rdm = np.divide((rdms * seen).sum(axis=0), coverage)
+        rdm[np.isnan(rdm)] = 0
+    np.fill_diagonal(rdm, 0)
+    return rdm, coverage, presentations
+
+
+def mds_and_clusters(rdm, dims=2, max_k=10, weights=None):
+    """mds_engine の MDS（古典的MDSから SMACOF）と、シルエットでKを選んだ K-means
+
+    (座標, stress-1, K, クラスタ) を返す。weights を渡すと重み付き SMACOF にする。
+    """
+    num_items = len(rdm)
+    mds = fit_mds(rdm, dims, weights)
+    pos = mds["positions"]
+    sil_scores = []
+    k_range = range(2, min(max_k, num_items))
+    for k in k_range:
+        labels = KMeans(n_clusters=k, random_state=42, n_init=10).fit_predict(pos)
+        sil_scores.append(silhouette_score(pos, labels))
+    best_k = k_range[int(np.argmax(sil_scores))]
+    clusters = KMeans(n_clusters=best_k, random_state=42, n_init=10).fit_predict(pos)
+    return pos, mds["stress1"], best_k, clusters
+
+
+def run_group_analysis(paths, num_items=None, analysis="weighted", anchor_ids=ANCHOR_IDS, dims=2, workers=None,
+                       output_dir=OUTPUT_DIR, plot=False, weighted_mds=False):
+    participants = collect_participants(paths, analysis, anchor_ids, workers)
+    if num_items is None:
+        sizes = [p["meta"]["num_items"] for p in participants]
+        num_items = max(set(sizes), key=sizes.count) if sizes else 0
+    others = [p for p in participants if p["meta"]["num_items"] != num_items]
+    participants = [p for p in participants if p["meta"]["num_items"] == num_items]
+    for p in others:
+        print(f"  Skipping {os.path.basename(p['meta']['path'])} ({p['meta']['num_items']} stimuli, not {num_items})")
+    if not participants:
+        print("No result files to analyze.")
+        return None
+    banks = {p["meta"]["stimulus_bank"] for p in participants} - {None}
+    if len(banks) > 1:
+        print(f"Warning: sessions were recorded with different stimulus banks: {sorted(banks)}")
+
+    rdm, coverage, presentations = group_rdm(participants, num_items)
+    iu = np.triu_indices(num_items, 1)
+    print(f"\nGroup RDM from {len(participants)} sessions ({num_items} stimuli, analysis: {analysis})")
+    for p in participants:
+        m = p["meta"]
+        print(f"  {m['participant']:>24}: {m['num_trials']:3d} trials, "
+              f"pairs seen {np.mean(p['counts'][iu] > 0):.0%}")
+    print(f"  Participants per pair: min {coverage[iu].min()}, max {coverage[iu].max()}; "
+          f"presentations per pair: min {presentations[iu].min():.0f}, max {presentations[iu].max():.0f}")
+
+    # ペアの提示回数で重み付けすると、見た回数の少ないペアの影響が小さくなる
+    mds_weights = presentations if weighted_mds else None
+    sweep = dimension_sweep(rdm, max(dims, 4), mds_weights)
+    print("\nMDS stress-1 by dimension: " + ", ".join(f"{d}D {s:.4f}" for d, s in sweep.items()))
+    print(f"Calculating group MDS in {dims}D{' (weighted by presentations)' if weighted_mds else ''}...")
+    pos, stress, best_k, clusters = mds_and_clusters(rdm, dims, weights=mds_weights)
+    print(f"MDS Stress-1: {stress:.4f}, best K: {best_k}")
+
+    id_to_params = {}
+    for p in participants:
+        for i, params in p["meta"]["params"].items():
+            id_to_params.setdefault(int(i), params)
+    rows = []
+    for i in range(num_items):
+        params = id_to_params.get(i, {})
+        row = {"ID": i, "Cluster": clusters[i]}
+        row.update({f"MDS_Dim{d + 1}": pos[i, d] for d in range(dims)})
+        row.update({"Dist": params.get("dist", 0), "Velo": params.get("velo", 0),
+                    "AM_Freq": params.get("am_freq", 0)})
+        rows.append(row)
+
+    os.makedirs(output_dir, exist_ok=True)
+    prefix = os.path.join(output_dir, f"group_{num_items}stim_{analysis}")
+    pd.DataFrame(rdm).to_csv(f"{prefix}_rdm.csv")
+    pd.DataFrame(coverage).to_csv(f"{prefix}_pair_participants.csv")
+    pd.DataFrame(presentations).to_csv(f"{prefix}_pair_presentations.csv")
+    pd.DataFrame(rows).to_csv(f"{prefix}_mds_coordinates.csv", index=False)
+    pd.DataFrame([{k: v for k, v in p["meta"].items() if k != "params"} for p in participants]).to_csv(
+        f"{prefix}_sessions.csv", index=False)
+    print(f"Saved: {prefix}_*.csv")
+
+    if plot and dims >= 2:
+        plt.figure(figsize=(9, 8))
+        plt.scatter(pos[:, 0], pos[:, 1], c=clusters, cmap='tab10', s=180, edgecolor='black')
+        for i in range(num_items):
+            plt.text(pos[i, 0] + 0.02, pos[i, 1] + 0.02, str(i), fontsize=9)
+        plt.title(f"Group MDS ({len(participants)} sessions, K={best_k})")
+        plt.xlabel("Dimension 1")
+        plt.ylabel("Dimension 2")
+        plt.grid(True, linestyle='--', alpha=0.6)
+        plt.show()
+    return {"rdm": rdm, "coverage": coverage, "presentations": presentations, "positions": pos,
+            "clusters": clusters, "participants": participants}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Group RDM/MDS analysis over all result files")
+    parser.add_argument("--results-dir", default=RAW_RESULTS_DIR)
+    parser.add_argument("--pattern", default="*.json", help="Glob pattern for result files")
+    parser.add_argument("--items", type=int, default=None,
+                        help="Only use sessions with this many stimuli (default: the most common)")
+    parser.add_argument("--analysis", choices=sorted(ANALYSES), default="weighted")
+    parser.add_argument("--anchors", type=int, nargs=2, default=ANCHOR_IDS, help="Anchor ids for the weighted analysis")
+    parser.add_argument("--dims", type=int, default=2, help="MDS dimensions")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--plot", action="store_true", help="Show the group MDS map")
+    parser.add_argument("--weighted-mds", action="store_true", help="Weight the MDS by pair presentation counts")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.results_dir, args.pattern)))
+    run_group_analysis(paths, args.items, args.analysis, args.anchors, args.dims, args.workers, plot=args.plot,
+                       weighted_mds=args.weighted_mds)
@@ -0,0 +1,195 @@
+"""
+古典的MDSで初期値を作り、SMACOF で仕上げる MDS エンジン
+
+解析スクリプトは毎回 sklearn の MDS(dissimilarity='precomputed', random_state=42) を
+ランダムな初期値から何度も解いており、ブートストラップや次元数の比較、参加者ごとの解析ではこれが一番重かった。
+ここでは
+    - 古典的MDS (Torgerson) を固有値分解で求めて初期値にする（初期値を渡せばそこから始める）
+    - SMACOF (Guttman 変換) を、ストレスの相対的な減少が eps を下回るまで回す
+    - 重み行列（ペアの提示回数や証拠の重みなど）を渡すと重み付き SMACOF にする
+    - 同じ RDM・設定の結果は RDM のハッシュで覚えておき、2回目以降は計算しない
+を行う。古典的MDSから始めた解は局所解に止まって sklearn よりストレスが大きいことがある
+（experiment_result_8stimuli_20251221_155626.json の2次元で 0.1029 対 0.1016）ので、
+結果を覚えておく解析 (cache=True) では sklearn と同じ一様乱数の初期値 n_init 個からも解き、ストレスが最も小さい解を使う。ストレスは生のストレスと Kruskal の stress-1 を返すので、
+2次元 (dataana_eighteen_color.py) と3次元 (data_analyzer2.py) のどちらにするかを dimension_sweep ですぐ比べられる。
+
+使い方:
+    python mds_engine.py ../results/raw_results/experiment_result_20251212_174248.json
+"""
+
+import argparse
+import hashlib
+import json
+import time
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+from sklearn.manifold import MDS
+
+from rdm_builder import build_rdm
+
+MAX_ITER = 300
+EPS = 1e-6  # ストレスの相対的な減少がこれを下回ったら収束とみなす
+CACHE_SIZE = 256  # 覚えておく結果の数
+N_INIT = 4  # cache=True のとき古典的MDSに加えて試す乱数の初期値の数
+RANDOM_STATE = 42  # 解析スクリプトの MDS(random_state=42) と同じ
+
+_cache = OrderedDict()
+
+
+def classical_mds(rdm, dims=2):
+    """古典的MDS: (座標 (N, dims), 固有値（大きい順）) を返す"""
+    n = len(rdm)
+    centering = np.eye(n) - 1.0 / n
+    b = -0.5 * centering @ (rdm ** 2) @ centering
+    values, vectors = np.linalg.eigh(b)
+    order = np.argsort(values)[::-1]
+    values, vectors = values[order], vectors[:, order]
+    return vectors[:, :dims] * np.sqrt(np.maximum(values[:dims], 0.0)), values
+
+
+def _pairwise(x):
+    diff = x[:, None, :] - x[None, :, :]
+    return np.sqrt((diff ** 2).sum(axis=2))
+
+
+def _stress(dists, rdm, weights):
+    """(生のストレス, stress-1)。i < j のペアについて"""
+    raw = float((weights * (dists - rdm) ** 2).sum() / 2)
+    norm = float((weights * rdm ** 2).sum() / 2)
+    return raw, np.sqrt(raw / norm) if norm > 0 else 0.0
+
+
+def smacof(rdm, dims=2, weights=None, init=None, max_iter=MAX_ITER, eps=EPS):
+    """SMACOF で MDS を解き、{"positions", "stress", "stress1", "n_iter", "eigenvalues"} を返す
+
+    weights は (N, N) の対称な非負の重み（None なら全ペア 1）。init を省略すると古典的MDSから始める。
+    """
+    rdm = np.asarray(rdm, dtype=float)
+    n = len(rdm)
+    eigenvalues = None
+    if init is None:
+        x, eigenvalues = classical_mds(rdm, dims)
+    else:
+        x = np.array(init, dtype=float)
+    if weights is None:
+        w = 1.0 - np.eye(n)
+        v_pinv = None
+    else:
+        w = np.asarray(weights, dtype=float)
+        w = (w + w.T) / 2
+        np.fill_diagonal(w, 0.0)
+        v = -w
+        np.fill_diagonal(v, w.sum(axis=1))
+        v_pinv = np.linalg.pinv(v)
+
+    dists = _pairwise(x)
+    stress, _ = _stress(dists, rdm, w)
+    n_iter = 0
+    for n_iter in range(1, max_iter + 1):
+        # Guttman 変換
+        ratio = np.divide(w * rdm, dists, out=np.zeros_like(rdm), where=dists > 0)
+        b = -ratio
+        np.fill_diagonal(b, ratio.sum(axis=1))
+        x = (b @ x) / n if v_pinv is None else v_pinv @ (b @ x)
+        dists = _pairwise(x)
+        new_stress, _ = _stress(dists, rdm, w)
+        converged = stress - new_stress <= eps * stress
+        stress = new_stress
+        if converged:
+            break
+    raw, stress1 = _stress(dists, rdm, w)
+    return {"positions": x, "stress": raw, "stress1": stress1, "n_iter": n_iter, "eigenvalues": eigenvalues}
+
+
+def multi_start(rdm, dims=2, weights=None, n_init=N_INIT, max_iter=MAX_ITER, eps=EPS, random_state=RANDOM_STATE):
+    """古典的MDSと、sklearn と同じ一様乱数の初期値 n_init 個から解き、生のストレスが最も小さい解を返す"""
+    best = smacof(rdm, dims, weights, None, max_iter, eps)
+    rng = np.random.RandomState(random_state)
+    for _ in range(n_init):
+        init = rng.uniform(size=len(rdm) * dims).reshape(len(rdm), dims)
+        result = smacof(rdm, dims, weights, init, max_iter, eps)
+        if result["stress"] < best["stress"]:
+            best = {**result, "eigenvalues": best["eigenvalues"]}
+    return best
+
+
+def _key(rdm, dims, weights, init, max_iter, eps, n_init):
+    h = hashlib.sha1(np.ascontiguousarray(rdm, dtype=float).tobytes())
+    for extra in (weights, init):
+        h.update(b"|" if extra is None else np.ascontiguousarray(extra, dtype=float).tobytes())
+    h.update(json.dumps([len(rdm), dims, max_iter, eps, n_init]).encode())
+    return h.hexdigest()
+
+
+def fit_mds(rdm, dims=2, weights=None, init=None, max_iter=MAX_ITER, eps=EPS, cache=True, n_init=N_INIT):
+    """smacof と同じ。cache=True なら同じ RDM・設定の結果を覚えておき、コピーを返す
+
+    cache=True で init を渡さないときは multi_start で n_init 個の乱数の初期値も試す
+    （cache=False はブートストラップなど回数の多い計算用で、1つの初期値から解くだけ）。
+    """
+    if not cache:
+        return smacof(rdm, dims, weights, init, max_iter, eps)
+    if init is not None:
+        n_init = 0
+    key = _key(rdm, dims, weights, init, max_iter, eps, n_init)
+    if key in _cache:
+        _cache.move_to_end(key)
+    else:
+        if n_init:
+            _cache[key] = multi_start(rdm, dims, weights, n_init, max_iter, eps)
+        else:
+            _cache[key] = smacof(rdm, dims, weights, init, max_iter, eps)
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    result = _cache[key]
+    return {**result, "positions": result["positions"].copy()}
+
+
+def dimension_sweep(rdm, max_dims=4, weights=None):
+    """1〜max_dims 次元の {次元数: stress-1}（次元数を決めるときのスクリープロット用）"""
+    return {dims: fit_mds(rdm, dims, weights)["stress1"] for dims in range(1, min(max_dims, len(rdm) - 1) + 1)}
+
+
+def clear_cache():
+    _cache.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the MDS engine with sklearn and sweep dimensions")
+    parser.add_argument("json_file", help="Experiment result file")
+    parser.add_argument("--anchors", type=int, nargs=2, default=[0, 17], help="Anchor ids for the weighted RDM")
+    parser.add_argument("--max-dims", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(args.json_file, "r") as f:
+        data = json.load(f)
+    num_items = data["config"]["num_items_total"]
+    if num_items > max(args.anchors):
+        rdm = build_rdm(data["trials"], num_items, normalize="anchor", weighting="squared", anchor_ids=args.anchors)
+    else:
+        rdm = build_rdm(data["trials"], num_items, normalize="max", weighting="squared")
+
+    print(f"{'dims':>4} {'sklearn stress-1':>17} {'engine stress-1':>16} {'sklearn (ms)':>13} {'engine (ms)':>12} "
+          f"{'cached (ms)':>12} {'iters':>6}")
+    for dims in range(1, args.max_dims + 1):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", FutureWarning)
+            start_time = time.perf_counter()
+            for _ in range(args.repeats):
+                mds = MDS(n_components=dims, dissimilarity='precomputed', random_state=42, normalized_stress='auto')
+                pos = mds.fit_transform(rdm)
+            sklearn_ms = (time.perf_counter() - start_time) / args.repeats * 1000
+        _, sklearn_stress1 = _stress(_pairwise(pos), rdm, 1.0 - np.eye(num_items))
+
+        clear_cache()
+        start_time = time.perf_counter()
+        result = fit_mds(rdm, dims)
+        engine_ms = (time.perf_counter() - start_time) * 1000
+        start_time = time.perf_counter()
+        fit_mds(rdm, dims)
+        cached_ms = (time.perf_counter() - start_time) * 1000
+        print(f"{dims:4d} {sklearn_stress1:17.4f} {result['stress1']:16.4f} {sklearn_ms:13.2f} {engine_ms:12.2f} "
+              f"{cached_ms:12.3f} {result['n_iter']:6d}")
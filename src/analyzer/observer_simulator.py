@@ -0,0 +1,328 @@
+"""
+仮想の観察者で実験デザインと解析を評価するシミュレータ（GUI・実機なし）
+
+何トライアル・1トライアル何刺激・アンカーの有無でどれだけ正しく知覚空間が復元できるかは、
+これまで実際に参加者を呼ばないと分からなかった。ここでは
+    1. 刺激の要因 (dist / velo / am_freq) から真の知覚空間を作り、観察者ごとに要因の重みを少し変える
+    2. 既存のトライアルジェネレータ（greedy / balanced / optimized / adaptive）のトライアルリストで、
+       観察者が真の空間を2次元の画面に並べた結果（save_and_quit と同じJSON形式）を作る
+    3. 解析スクリプトと同じ RDM と mds_engine の MDS に通し、トライアル数ごとに
+       RDM の相関と Procrustes 誤差（真の空間との差）を求める
+を大量のセッションについて ProcessPoolExecutor で並列に行い、トライアル数ごとの平均を表にする。
+乱数はセッション番号から決めるので、結果はワーカー数に依存しない。
+同じセッション番号ではデザインが違っても同じ観察者になる。
+
+使い方:
+    python observer_simulator.py --sessions 1000
+    python observer_simulator.py --designs greedy balanced --per-trial 5 --anchors
+    python observer_simulator.py --space random --items 60 --checkpoints 20 40 80 160
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import procrustes
+from scipy.spatial.distance import pdist, squareform
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "experiment"))
+from adaptive_design import LiftTheWeakestSelector
+from design_optimizer import optimize_design
+from stimulus_bank import SEEDS_FILE, stm_freq_for
+from trial_generator import BalancedTrialGenerator, GreedyTrialGenerator
+from rdm_builder import build_rdm
+from mds_engine import fit_mds
+
+DESIGNS = ("greedy", "balanced", "optimized", "adaptive")
+ANALYSES = ("weighted", "average")
+
+# 真の知覚空間での各要因の重み（要因ごとに 0〜1 に揃えた値に掛ける）
+FACTOR_WEIGHTS = {"dist": 1.0, "velo": 1.0, "am_freq": 0.6}
+OBSERVER_WEIGHT_SD = 0.2  # 観察者ごとの要因の重みのばらつき（対数正規の sd）
+
+# 配置（random_walk_circle.py の画面と同じ広さ）
+CANVAS_SIZE = 800
+ARENA_RADIUS = 350
+PLACEMENT_NOISE = 0.08  # 配置のばらつき（アリーナの半径に対する比）
+ZOOM_RANGE = (0.6, 1.0)  # 観察者がアリーナのどれだけの広さを使うか
+
+CHECKPOINTS = [5, 10, 15, 20, 30, 40, 60]
+SESSIONS = 200
+
+
+# --- 真の知覚空間 ---
+
+def factor_space(weights=FACTOR_WEIGHTS, seeds_file=SEEDS_FILE):
+    """stimuli_seeds.json の要因から (params のリスト, 要因ごとに 0〜1 に揃えた座標) を返す
+
+    dist と velo は対数、am_freq は log(1 + f) で並べる（いずれも刺激の水準は比で並んでいるため）。
+    """
+    with open(seeds_file, "r") as f:
+        stimuli = json.load(f)["stimuli"]
+    params = [{"id": s["id"], "dist": s["dist"], "velo": s["velo"], "am_freq": s["am_freq"],
+               "stm_freq": stm_freq_for(s["dist"], s["velo"])} for s in stimuli]
+    raw = np.array([[np.log(s["dist"]), np.log(s["velo"]), np.log1p(s["am_freq"])] for s in stimuli])
+    span = raw.max(axis=0) - raw.min(axis=0)
+    unit = (raw - raw.min(axis=0)) / np.where(span > 0, span, 1.0)
+    return params, unit * np.array([weights["dist"], weights["velo"], weights["am_freq"]])
+
+
+def random_space(num_items, dims, rng):
+    """要因を持たない刺激のための一様乱数の空間"""
+    params = [{"id": i} for i in range(num_items)]
+    return params, rng.uniform(0.0, 1.0, (num_items, dims))
+
+
+def observer_space(base_coords, rng, weight_sd=OBSERVER_WEIGHT_SD):
+    """観察者ごとに軸（要因）の重みを変えた真の空間"""
+    return base_coords * rng.lognormal(0.0, weight_sd, base_coords.shape[1])
+
+
+# --- 配置のシミュレーション ---
+
+def simulate_arrangement(true_coords, subset, rng, noise=PLACEMENT_NOISE):
+    """subset を2次元の画面に並べた座標 (len(subset), 2) を返す
+
+    観察者はトライアル内の刺激の真の距離をなるべく保つ平面（主成分の2軸）に並べ、
+    向きと広さは毎回ばらばらで、位置にノイズが乗るとする。
+    """
+    coords = true_coords[subset] - true_coords[subset].mean(axis=0)
+    _, _, vt = np.linalg.svd(coords, full_matrices=False)
+    flat = coords @ vt[:2].T
+    if flat.shape[1] < 2:
+        flat = np.hstack([flat, np.zeros((len(subset), 2 - flat.shape[1]))])
+    # ランダムな回転と鏡映
+    angle = rng.uniform(0.0, 2 * np.pi)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    if rng.random() < 0.5:
+        rotation[:, 1] *= -1
+    flat = flat @ rotation
+    spread = np.sqrt((flat ** 2).sum(axis=1)).max()
+    if spread > 0:
+        flat = flat / spread * ARENA_RADIUS * rng.uniform(*ZOOM_RANGE)
+    flat = flat + rng.normal(0.0, noise * ARENA_RADIUS, flat.shape)
+    return flat + CANVAS_SIZE / 2
+
+
+def trial_result(trial_index, subset, screen, params):
+    """_save_current_screen と同じ形式のトライアルの結果"""
+    return {
+        "trial_index": trial_index,
+        "items": [{"id": int(i), "x": float(x), "y": float(y), "params": params[i]}
+                  for i, (x, y) in zip(subset, screen)],
+    }
+
+
+class _FixedDesign:
+    """トライアルリストを使い切ったら、新しいリストを作って続ける"""
+
+    def __init__(self, make_trials):
+        self.make_trials = make_trials
+        self.queue = []
+
+    def next_trial(self, results):
+        if not self.queue:
+            self.queue = [list(t) for t in self.make_trials()]
+        return self.queue.pop(0)
+
+
+class _AdaptiveDesign:
+    """LiftTheWeakestSelector でそれまでの配置から次のトライアルを選ぶ（アンカーは使わない）"""
+
+    def __init__(self, selector):
+        self.selector = selector
+
+    def next_trial(self, results):
+        self.selector.update(results)
+        return self.selector.select()
+
+
+def make_design(design, num_items, items_per_trial, anchor_items, coverage, base_trials, rng):
+    if design == "greedy":
+        return _FixedDesign(lambda: GreedyTrialGenerator(num_items, items_per_trial, anchor_items,
+                                                         verbose=False, rng=rng).trials)
+    if design == "balanced":
+        return _FixedDesign(lambda: BalancedTrialGenerator(num_items, items_per_trial, coverage=coverage,
+                                                           anchor_items=anchor_items, verbose=False, rng=rng).trials)
+    if design == "optimized":
+        # 最適化したデザインは全セッションで共通なので、順番だけセッションごとに変える
+        return _FixedDesign(lambda: rng.sample(base_trials, len(base_trials)))
+    if design == "adaptive":
+        return _AdaptiveDesign(LiftTheWeakestSelector(num_items, items_per_trial, target_evidence=np.inf,
+                                                      max_trials=np.inf, rng=rng))
+    raise ValueError(f"Unknown design: {design}")
+
+
+def simulate_session(true_coords, params, design, max_trials, rng, noise=PLACEMENT_NOISE, config=None):
+    """1セッション分の結果を save_and_quit と同じ形式の dict で返す"""
+    results = []
+    for trial_index in range(max_trials):
+        subset = design.next_trial(results)
+        screen = simulate_arrangement(true_coords, subset, rng, noise)
+        results.append(trial_result(trial_index, subset, screen, params))
+    return {
+        "config": {
+            "num_items_total": len(true_coords),
+            "items_per_trial": len(results[0]["items"]) if results else 0,
+            "total_trials": len(results),
+            **(config or {}),
+        },
+        "trials": results,
+    }
+
+
+# --- 解析（解析スクリプトと同じ RDM と、mds_engine の MDS） ---
+
+def analysis_rdm(trials, num_items, analysis, anchor_ids):
+    """解析スクリプトと同じ RDM（weighted は dataana_eighteen_color.py、average は data_analyzer.py）"""
+    if analysis == "average":
+        return build_rdm(trials, num_items, normalize="max")
+    # アンカーが2つなければ dataana_eight.py と同じく最大距離で揃える
+    if anchor_ids and len(anchor_ids) == 2:
+        return build_rdm(trials, num_items, normalize="anchor", weighting="squared", anchor_ids=anchor_ids)
+    return build_rdm(trials, num_items, normalize="max", weighting="squared")
+
+
+def recovery(rdm, true_coords):
+    """(RDM の相関, MDS の配置と真の空間の Procrustes 誤差, 一度でも提示されたペアの割合)"""
+    num_items = len(true_coords)
+    iu = np.triu_indices(num_items, 1)
+    true_rdm = squareform(pdist(true_coords))
+    seen = float(np.mean(rdm[iu] > 0))
+    r = float(np.corrcoef(rdm[iu], true_rdm[iu])[0, 1]) if rdm[iu].std() > 0 else 0.0
+    pos_2d = fit_mds(rdm, 2, cache=False)["positions"]
+    # 次元の違う配置は 0 を足して揃える
+    dims = max(pos_2d.shape[1], true_coords.shape[1])
+    pad = lambda x: np.hstack([x, np.zeros((num_items, dims - x.shape[1]))])
+    _, _, disparity = procrustes(pad(true_coords), pad(pos_2d))
+    return r, float(disparity), seen
+
+
+# --- 並列実行 ---
+
+def _run_session(task):
+    """ワーカープロセスで1セッションをシミュレートし、チェックポイントごとの復元精度を返す"""
+    (design_name, session, base_coords, params, items_per_trial, anchor_items, coverage, base_trials,
+     checkpoints, analysis, noise, master_seed) = task
+    observer_rng = np.random.default_rng([master_seed, session])
+    true_coords = observer_space(base_coords, observer_rng)
+    design_rng = random.Random(f"{master_seed}:{design_name}:{session}")
+    noise_rng = np.random.default_rng([master_seed, session, DESIGNS.index(design_name)])
+
+    design = make_design(design_name, len(true_coords), items_per_trial, anchor_items, coverage, base_trials,
+                         design_rng)
+    data = simulate_session(true_coords, params, design, max(checkpoints), noise_rng, noise)
+    rows = []
+    for num_trials in checkpoints:
+        trials = data["trials"][:num_trials]
+        rdm = analysis_rdm(trials, len(true_coords), analysis, anchor_items)
+        r, disparity, seen = recovery(rdm, true_coords)
+        rows.append({"design": design_name, "session": session, "trials": num_trials,
+                     "rdm_r": r, "procrustes": disparity, "pairs_seen": seen})
+    return rows
+
+
+def run_benchmark(designs, sessions, base_coords, params, items_per_trial, anchor_items=None, coverage=3,
+                  checkpoints=CHECKPOINTS, analysis="weighted", noise=PLACEMENT_NOISE, workers=None,
+                  master_seed=0):
+    """designs × sessions のセッションをシミュレートし、1行が (デザイン, セッション, トライアル数) の DataFrame を返す"""
+    anchor_items = sorted(set(anchor_items)) if anchor_items else []
+    checkpoints = sorted(set(checkpoints))
+    base_trials = None
+    if "optimized" in designs:
+        base_trials = optimize_design(len(base_coords), items_per_trial, anchor_items, workers=workers,
+                                      master_seed=master_seed)["trials"]
+    tasks = [(design, s, base_coords, params, items_per_trial, anchor_items, coverage, base_trials,
+              checkpoints, analysis, noise, master_seed) for design in designs for s in range(sessions)]
+    rows = []
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for session_rows in executor.map(_run_session, tasks, chunksize=max(1, len(tasks) // (workers * 8))):
+            rows.extend(session_rows)
+    return pd.DataFrame(rows)
+
+
+def print_summary(df):
+    summary = df.groupby(["design", "trials"], sort=False).agg(
+        r_mean=("rdm_r", "mean"), r_sd=("rdm_r", "std"), r_p05=("rdm_r", lambda x: x.quantile(0.05)),
+        procrustes=("procrustes", "mean"), pairs_seen=("pairs_seen", "mean"))
+    print(f"{'design':>10} {'trials':>7} {'RDM r':>7} {'(sd)':>7} {'r 5%':>7} {'Procrustes':>11} {'pairs seen':>11}")
+    for (design, trials), row in summary.iterrows():
+        print(f"{design:>10} {trials:7d} {row.r_mean:7.3f} {row.r_sd:7.3f} {row.r_p05:7.3f} "
+              f"{row.procrustes:11.4f} {row.pairs_seen:10.1%}")
+
+
+def save_example(path, base_coords, params, design_name, items_per_trial, anchor_items, coverage, max_trials,
+                 noise=PLACEMENT_NOISE, master_seed=0):
+    """セッション0の配置を save_and_quit と同じ形式で保存する（解析スクリプトにそのまま渡せる）"""
+    true_coords = observer_space(base_coords, np.random.default_rng([master_seed, 0]))
+    base_trials = None
+    if design_name == "optimized":
+        base_trials = optimize_design(len(base_coords), items_per_trial, anchor_items,
+                                      master_seed=master_seed)["trials"]
+    rng = random.Random(f"{master_seed}:{design_name}:0")
+    design = make_design(design_name, len(true_coords), items_per_trial, anchor_items, coverage, base_trials, rng)
+    data = simulate_session(true_coords, params, design, max_trials,
+                            np.random.default_rng([master_seed, 0, DESIGNS.index(design_name)]), noise,
+                            config={"design": design_name, "simulated": True,
+                                    "true_coords": true_coords.tolist()})
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
+    print(f"Saved simulated session to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark trial designs and the RDM/MDS analysis with simulated observers")
+    parser.add_argument("--designs", nargs="+", choices=DESIGNS, default=["greedy", "balanced", "adaptive"])
+    parser.add_argument("--sessions", type=int, default=SESSIONS, help="Simulated sessions per design")
+    parser.add_argument("--space", choices=("factors", "random"), default="factors",
+                        help="Ground truth: dist/velo/am_freq factors of stimuli_seeds.json, or uniform random")
+    parser.add_argument("--items", type=int, default=18, help="Number of stimuli (random space only)")
+    parser.add_argument("--dims", type=int, default=3, help="Dimensions of the random space")
+    parser.add_argument("--per-trial", type=int, default=7, help="Items per trial")
+    parser.add_argument("--anchors", type=int, nargs="*", default=None,
+                        help="Anchor items included in every trial (e.g. --anchors 0 17)")
+    parser.add_argument("--coverage", type=int, default=3, help="Minimum presentations per pair (balanced design)")
+    parser.add_argument("--checkpoints", type=int, nargs="+", default=CHECKPOINTS,
+                        help="Numbers of trials at which the recovery is measured")
+    parser.add_argument("--analysis", choices=ANALYSES, default="weighted",
+                        help="weighted: anchor-scaled, squared-distance weighted (dataana_eighteen_color.py); "
+                             "average: max-normalized average (data_analyzer.py)")
+    parser.add_argument("--noise", type=float, default=PLACEMENT_NOISE, help="Placement noise (fraction of arena radius)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--master-seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Save per-session results to this CSV file")
+    parser.add_argument("--save-example", default=None,
+                        help="Save session 0 of the first design as an experiment_result JSON file")
+    args = parser.parse_args()
+
+    if args.space == "factors":
+        params, base_coords = factor_space()
+    else:
+        params, base_coords = random_space(args.items, args.dims, np.random.default_rng(args.master_seed))
+    anchors = args.anchors or []
+
+    print("=" * 76)
+    print(f"仮想観察者によるデザインの評価: N={len(base_coords)}, 1トライアル {args.per_trial} 刺激, "
+          f"アンカー {anchors}, {args.sessions} セッション/デザイン")
+    print(f"解析: {args.analysis}, 配置のノイズ: {args.noise}")
+    print("=" * 76)
+    start_time = time.perf_counter()
+    df = run_benchmark(args.designs, args.sessions, base_coords, params, args.per_trial, anchors, args.coverage,
+                       args.checkpoints, args.analysis, args.noise, args.workers, args.master_seed)
+    elapsed = time.perf_counter() - start_time
+    print_summary(df)
+    print(f"\n{args.sessions * len(args.designs)} セッションを {elapsed:.1f} 秒でシミュレートしました")
+
+    if args.output:
+        df.to_csv(args.output, index=False)
+        print(f"Saved: {args.output}")
+    if args.save_example:
+        save_example(args.save_example, base_coords, params, args.designs[0], args.per_trial, anchors,
+                     args.coverage, max(args.checkpoints), args.noise, args.master_seed)
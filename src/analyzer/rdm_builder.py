@@ -0,0 +1,142 @@
+"""
+全トライアルの配置から RDM（非類似度行列）を作る共通モジュール
+
+これまで各解析スクリプトは、トライアルごとに pdist で距離行列を作り、
+for i ... for j ... の二重ループで sum_distances / sum_weights に足していた。
+ここでは全トライアルを (トライアル数, 最大刺激数) の配列に詰め、距離・正規化・重みを一度に計算し、
+刺激ペアの番号 (id_i * N + id_j) ごとに np.bincount で足し合わせる。
+足す順番は従来のループと同じ（トライアル順、トライアル内は i, j の順）なので、結果は従来と一致する。
+
+正規化 (normalize):
+    None     正規化しない（画面上の距離そのもの）
+    "max"    トライアル内の最大距離で割る（data_analyzer.py など）
+    "anchor" アンカー2刺激の距離で割り、アンカーが揃っていない試行は最大距離で割る（dataana_eighteen_color.py）
+重み (weighting):
+    None      単純平均
+    "squared" 画面上の生の距離の2乗で重み付けした平均（dataana_eight.py など）
+"""
+
+import numpy as np
+
+NORMALIZATIONS = (None, "max", "anchor")
+WEIGHTINGS = (None, "squared")
+
+
+def pack_trials(trials):
+    """刺激が2つ以上あるトライアルを (ids, coords, mask) の配列に詰める
+
+    ids: (T, K) の刺激ID（空きは 0）、coords: (T, K, 2) の画面座標、mask: (T, K) の有効な位置。
+    """
+    valid = [trial["items"] for trial in trials if len(trial["items"]) >= 2]
+    width = max((len(items) for items in valid), default=0)
+    ids = np.zeros((len(valid), width), dtype=np.int64)
+    coords = np.zeros((len(valid), width, 2))
+    mask = np.zeros((len(valid), width), dtype=bool)
+    for t, items in enumerate(valid):
+        k = len(items)
+        ids[t, :k] = [item["id"] for item in items]
+        coords[t, :k] = [[item["x"], item["y"]] for item in items]
+        mask[t, :k] = True
+    return ids, coords, mask
+
+
+def _trial_scales(ids, dists, mask, pair_mask, normalize, anchor_ids):
+    """トライアルごとに距離を割る値（割らない場合は 1）"""
+    num_trials = len(ids)
+    if normalize is None:
+        return np.ones(num_trials)
+    max_dist = np.where(pair_mask, dists, 0.0).max(axis=(1, 2)) if num_trials else np.zeros(0)
+    scale = np.where(max_dist > 0, max_dist, 1.0)
+    if normalize == "max":
+        return scale
+    if normalize != "anchor":
+        raise ValueError(f"Unknown normalization: {normalize}")
+    if anchor_ids is None or len(anchor_ids) != 2:
+        raise ValueError("Anchor normalization needs exactly two anchor ids")
+    # 従来の ids.index と同じく、それぞれのアンカーの最初の位置を使う
+    hit_a = mask & (ids == anchor_ids[0])
+    hit_b = mask & (ids == anchor_ids[1])
+    has_both = hit_a.any(axis=1) & hit_b.any(axis=1)
+    anchor_dist = dists[np.arange(num_trials), hit_a.argmax(axis=1), hit_b.argmax(axis=1)]
+    use_anchor = has_both & (anchor_dist > 0)
+    return np.where(use_anchor, anchor_dist, scale)
+
+
+def _pair_terms(trials, num_items, normalize, weighting, anchor_ids):
+    """全トライアルの刺激ペアごとの (トライアル番号, ペア番号 id_i * N + id_j, 重み付きの距離, 重み)
+
+    並びはトライアル順、トライアル内は i, j の順（従来のループと同じ）。対角は含まない。
+    """
+    if normalize not in NORMALIZATIONS:
+        raise ValueError(f"Unknown normalization: {normalize}")
+    if weighting not in WEIGHTINGS:
+        raise ValueError(f"Unknown weighting: {weighting}")
+    ids, coords, mask = pack_trials(trials)
+    if len(ids) == 0:
+        empty = np.zeros(0)
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), empty, empty
+
+    diff = coords[:, :, None, :] - coords[:, None, :, :]
+    dists = np.sqrt((diff ** 2).sum(axis=3))
+    width = ids.shape[1]
+    pair_mask = mask[:, :, None] & mask[:, None, :] & ~np.eye(width, dtype=bool)
+
+    scale = _trial_scales(ids, dists, mask, pair_mask, normalize, anchor_ids)
+    scaled = (dists / scale[:, None, None])[pair_mask]
+    pair = (ids[:, :, None] * num_items + ids[:, None, :])[pair_mask]
+    owner = np.broadcast_to(np.arange(len(ids))[:, None, None], pair_mask.shape)[pair_mask]
+    if weighting == "squared":
+        weights = (dists ** 2)[pair_mask]
+        return owner, pair, scaled * weights, weights
+    return owner, pair, scaled, np.ones(len(pair))
+
+
+def accumulate(trials, num_items, normalize="max", weighting=None, anchor_ids=None):
+    """(重み付きの距離の合計, 重みの合計) の (N, N) 行列を返す（対角は数えない）
+
+    重みなしの場合、重みの合計は各ペアが提示された回数になる。
+    """
+    _, pair, values, weights = _pair_terms(trials, num_items, normalize, weighting, anchor_ids)
+    num_pairs = num_items * num_items
+    sums = np.bincount(pair, values, num_pairs).reshape(num_items, num_items)
+    totals = np.bincount(pair, weights, num_pairs).reshape(num_items, num_items)
+    np.fill_diagonal(sums, 0)
+    np.fill_diagonal(totals, 0)
+    return sums, totals
+
+
+def per_trial_sums(trials, num_items, normalize="max", weighting=None, anchor_ids=None):
+    """トライアルごとの (重み付きの距離, 重み) を上三角のペアについて並べた (T, N(N-1)/2) の配列 2つ
+
+    刺激が2つ未満のトライアルも 0 の行として残すので、行はトライアルの並びと対応する。
+    c を各トライアルを使う回数とすると、c @ sums と c @ totals がそのトライアルの組の合計になる
+    （ブートストラップで一度に多数の RDM を作るのに使う）。
+    """
+    valid = [t for t, trial in enumerate(trials) if len(trial["items"]) >= 2]
+    owner, pair, values, weights = _pair_terms(trials, num_items, normalize, weighting, anchor_ids)
+    i, j = np.divmod(pair, num_items)
+    upper = np.full((num_items, num_items), -1, dtype=np.int64)
+    iu = np.triu_indices(num_items, 1)
+    upper[iu] = np.arange(len(iu[0]))
+    upper[iu[1], iu[0]] = upper[iu]
+    keep = i != j
+    cell = np.asarray(valid, dtype=np.int64)[owner[keep]] * len(iu[0]) + upper[i[keep], j[keep]]
+    # (i, j) と (j, i) の両方が足されるので半分にする（重み付き平均の比は変わらない）
+    size = len(trials) * len(iu[0])
+    sums = np.bincount(cell, values[keep], size).reshape(len(trials), -1) / 2
+    totals = np.bincount(cell, weights[keep], size).reshape(len(trials), -1) / 2
+    return sums, totals
+
+
+def rdm_from_sums(sums, totals):
+    """合計から平均をとって RDM にする（一度も提示されていないペアは 0）"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rdm = np.divide(sums, totals)
+        rdm[np.isnan(rdm)] = 0
+    np.fill_diagonal(rdm, 0)
+    return rdm
+
+
+def build_rdm(trials, num_items, normalize="max", weighting=None, anchor_ids=None):
+    """トライアルの結果のリスト（結果ファイルの data["trials"]）から RDM を作る"""
+    return rdm_from_sums(*accumulate(trials, num_items, normalize, weighting, anchor_ids))
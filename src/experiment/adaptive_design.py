@@ -0,0 +1,239 @@
+"""
+これまでの配置結果から次のトライアルを選ぶ適応的デザイン ("lift-the-weakest")
+
+逆MDS (Kriegeskorte & Mur, 2012) と同様に、各トライアルの配置から
+ペアごとの「証拠の重み」（画面上の距離の2乗。dataana_eighteen_color.py の重みと同じ考え方で、
+トライアル内の最大距離で正規化する）を積み上げ、最も証拠の弱いペアを核にして、
+弱いペアの証拠が最も増える刺激の組を次のトライアルにする。
+全ペアの証拠が目標値に達したら終了する。
+
+証拠の更新と選択は N=100・数百トライアルでも合わせて十数ミリ秒で終わるので、トライアルの合間にGUIが止まることはない。
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from trial_generator import GreedyTrialGenerator
+
+TARGET_EVIDENCE = 0.1  # 全ペアの証拠がこの値に達したら終了
+EVIDENCE_SCALE = 0.5  # 効用 1 - exp(-証拠 / EVIDENCE_SCALE) の飽和の速さ
+MAX_TRIALS = 200  # 目標に届かない場合の上限
+SCALE_ITERATIONS = 30  # 距離の推定値とトライアルごとの拡大率を交互に更新する回数
+
+
+def arrangement_distances(trial):
+    """トライアルの結果 {"items": [{"id", "x", "y"}, ...]} から (ids, 最大距離で正規化した距離行列) を返す"""
+    ids = np.array([item["id"] for item in trial["items"]])
+    coords = np.array([[item["x"], item["y"]] for item in trial["items"]], dtype=float)
+    dists = np.sqrt(((coords[:, None, :] - coords[None, :, :]) ** 2).sum(axis=2))
+    max_dist = dists.max() if len(ids) > 1 else 0.0
+    if max_dist > 0:
+        dists = dists / max_dist
+    return ids, dists
+
+
+class LiftTheWeakestSelector:
+    """配置結果からペアごとの証拠と距離の推定値を更新し、次のトライアルを選ぶ
+
+    evidence[i, j] はペアの証拠の合計、rdm[i, j] は証拠で重み付けした距離の平均。
+    rng は random.Random（None ならモジュール共通の random）。
+    """
+
+    def __init__(self, num_items, items_per_trial, target_evidence=TARGET_EVIDENCE,
+                 evidence_scale=EVIDENCE_SCALE, max_trials=MAX_TRIALS, rng=None):
+        self.num_items = num_items
+        self.items_per_trial = min(items_per_trial, num_items)
+        self.target_evidence = target_evidence
+        self.evidence_scale = evidence_scale
+        self.max_trials = max_trials
+        self.rng = rng if rng is not None else random
+        self.num_trials = 0
+        self.evidence = np.zeros((num_items, num_items))
+        self.rdm = np.ones((num_items, num_items))
+        np.fill_diagonal(self.rdm, 0.0)
+        self._pairs = {}  # results の位置 -> (トライアルの結果, 刺激ペアと正規化した距離)
+
+    def update(self, results):
+        """これまでのトライアルの結果（None は未実施）から証拠と距離の推定値を作り直す
+
+        戻って配置をやり直すこともあるので、毎回すべての結果から計算する。
+        トライアルごとに配置の拡大率が違う（近い刺激だけのトライアルは拡大して並べられる）ので、
+        距離の推定値は、各トライアルの拡大率を推定値に合わせる最小二乗と交互に数回更新して求める。
+        """
+        n = self.num_items
+        rows, cols, dists, owners = [], [], [], []
+        self.num_trials = 0
+        for index, trial in enumerate(results):
+            if trial is None or len(trial["items"]) < 2:
+                continue
+            lo, hi, d = self._trial_pairs(index, trial)
+            rows.append(lo)
+            cols.append(hi)
+            dists.append(d)
+            owners.append(np.full(len(d), self.num_trials))
+            self.num_trials += 1
+
+        evidence = np.zeros((n, n))
+        rdm = np.ones((n, n))
+        if self.num_trials:
+            rows, cols = np.concatenate(rows), np.concatenate(cols)
+            dists, owners = np.concatenate(dists), np.concatenate(owners)
+            pair = rows * n + cols  # 上三角の位置
+            weights = dists ** 2
+            total = np.bincount(pair, weights, n * n)
+            seen = total > 0
+            if seen.any():
+                # 全部のトークンが1か所に重なっている（距離がすべて0の）間は、中立な rdm のままにする
+                scaled = dists
+                for _ in range(SCALE_ITERATIONS):
+                    estimate = np.bincount(pair, weights * scaled, n * n)
+                    estimate = np.divide(estimate, total, out=np.zeros(n * n), where=seen)
+                    estimate /= np.sqrt(np.mean(estimate[seen] ** 2))
+                    # 各トライアルの拡大率: sum w (s d - D)^2 を最小にする s
+                    target = estimate[pair]
+                    num = np.bincount(owners, weights * dists * target, self.num_trials)
+                    den = np.bincount(owners, weights * dists ** 2, self.num_trials)
+                    scale = np.divide(num, den, out=np.ones(self.num_trials), where=den > 0)
+                    scaled = dists * scale[owners]
+                rdm = estimate.reshape(n, n)
+                evidence = total.reshape(n, n)
+                # まだ証拠のないペアは、分かっているペアの平均距離とみなす
+                unseen = ~seen.reshape(n, n)
+                rdm[unseen] = rdm[~unseen].mean()
+                rdm = np.triu(rdm, 1) + np.triu(rdm, 1).T
+                evidence = np.triu(evidence, 1) + np.triu(evidence, 1).T
+        np.fill_diagonal(rdm, 0.0)
+        self.rdm = rdm
+        self.evidence = evidence
+
+    def _trial_pairs(self, index, trial):
+        """トライアルの (小さい方のID, 大きい方のID, 正規化した距離) の配列。同じ結果なら前回の計算を使う"""
+        cached = self._pairs.get(index)
+        if cached is not None and cached[0] is trial:
+            return cached[1]
+        ids, d = arrangement_distances(trial)
+        iu, ju = np.triu_indices(len(ids), 1)
+        pairs = (np.minimum(ids[iu], ids[ju]), np.maximum(ids[iu], ids[ju]), d[iu, ju])
+        self._pairs[index] = (trial, pairs)
+        return pairs
+
+    @property
+    def min_evidence(self):
+        iu = np.triu_indices(self.num_items, 1)
+        return float(self.evidence[iu].min()) if len(iu[0]) else 0.0
+
+    @property
+    def done(self):
+        return self.min_evidence >= self.target_evidence or self.num_trials >= self.max_trials
+
+    def _utility(self, evidence):
+        return 1.0 - np.exp(-evidence / self.evidence_scale)
+
+    def select(self):
+        """最も証拠の弱いペアを核に、弱いペアの効用の増加が最大になるよう刺激を足していく"""
+        n = self.num_items
+        evidence = self.evidence
+        rdm = np.maximum(self.rdm, 1e-6)
+
+        iu, ju = np.triu_indices(n, 1)
+        weakest = np.flatnonzero(evidence[iu, ju] == evidence[iu, ju].min())
+        k = weakest[self.rng.randrange(len(weakest))]
+        subset = [int(iu[k]), int(ju[k])]
+
+        while len(subset) < self.items_per_trial:
+            candidates = [c for c in range(n) if c not in subset]
+            self.rng.shuffle(candidates)
+            cands = np.array(candidates)
+            s = np.array(subset)
+            tri = np.triu(np.ones((len(s), len(s)), dtype=bool), 1)
+
+            d_ss = rdm[np.ix_(s, s)]
+            d_cs = rdm[np.ix_(cands, s)]
+            e_ss = evidence[np.ix_(s, s)]
+            e_cs = evidence[np.ix_(cands, s)]
+            # 配置はトライアル内の最大距離で正規化されるので、候補ごとに予想される正規化後の距離が変わる
+            scale = np.maximum(d_ss.max(), d_cs.max(axis=1))
+            new_ss = e_ss[None] + (d_ss[None] / scale[:, None, None]) ** 2
+            new_cs = e_cs + (d_cs / scale[:, None]) ** 2
+            gain = (self._utility(new_ss)[:, tri].sum(axis=1) - self._utility(e_ss[tri]).sum()
+                    + (self._utility(new_cs) - self._utility(e_cs)).sum(axis=1))
+            subset.append(int(cands[int(np.argmax(gain))]))
+        return subset
+
+
+# --- シミュレーション（選択時間と、目標に達するまでのトライアル数の比較） ---
+ARENA_RADIUS = 300  # 初期配置の円の半径 (px) と同程度の広さに並べる
+PLACEMENT_NOISE = 0.05  # 配置のばらつき（配置の広さに対する比）
+
+
+def simulate_arrangement(true_coords, subset, rng):
+    """真の2次元座標を持つ観察者が subset を配置した結果を返す（広さを揃えてノイズを足す）"""
+    coords = true_coords[subset] - true_coords[subset].mean(axis=0)
+    spread = np.abs(coords).max()
+    coords = coords / spread * ARENA_RADIUS if spread > 0 else coords
+    coords = coords + rng.normal(0.0, PLACEMENT_NOISE * ARENA_RADIUS, coords.shape)
+    return {"items": [{"id": int(i), "x": float(x), "y": float(y)} for i, (x, y) in zip(subset, coords)]}
+
+
+def rdm_correlation(rdm, true_coords):
+    true_rdm = np.sqrt(((true_coords[:, None] - true_coords[None]) ** 2).sum(axis=2))
+    iu = np.triu_indices(len(true_coords), 1)
+    return float(np.corrcoef(rdm[iu], true_rdm[iu])[0, 1])
+
+
+def run_simulation(num_items, items_per_trial, seed=0, max_trials=MAX_TRIALS):
+    """適応的デザインと、GreedyTrialGenerator のデザインを繰り返す場合を比べる"""
+    rng = np.random.default_rng(seed)
+    true_coords = rng.uniform(-1.0, 1.0, (num_items, 2))
+
+    # 適応的デザイン
+    selector = LiftTheWeakestSelector(num_items, items_per_trial, max_trials=max_trials, rng=random.Random(seed))
+    results = []
+    times = []
+    while not selector.done:
+        start_time = time.perf_counter()
+        selector.update(results)
+        if selector.done:
+            break
+        subset = selector.select()
+        times.append(time.perf_counter() - start_time)
+        results.append(simulate_arrangement(true_coords, subset, rng))
+    selector.update(results)
+    adaptive = (len(results), selector.min_evidence, rdm_correlation(selector.rdm, true_coords))
+
+    # 固定デザイン: 全ペアを網羅するデザインを目標に達するまで繰り返す
+    fixed = LiftTheWeakestSelector(num_items, items_per_trial, max_trials=max_trials)
+    fixed_results = []
+    design_rng = random.Random(seed)
+    while not fixed.done:
+        design = GreedyTrialGenerator(num_items, items_per_trial, verbose=False, rng=design_rng).trials
+        for subset in design:
+            fixed_results.append(simulate_arrangement(true_coords, subset, rng))
+            fixed.update(fixed_results)
+            if fixed.done:
+                break
+    greedy = (len(fixed_results), fixed.min_evidence, rdm_correlation(fixed.rdm, true_coords))
+    return adaptive, greedy, times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate the adaptive lift-the-weakest trial selection")
+    parser.add_argument("--items", type=int, nargs="*", default=[18, 50, 100], help="Numbers of stimuli")
+    parser.add_argument("--per-trial", type=int, default=7, help="Items per trial")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-trials", type=int, default=1000, help="Stop a simulated session after this many trials")
+    args = parser.parse_args()
+
+    print("=" * 86)
+    print(f"適応的デザイン (lift-the-weakest) と greedy デザインの繰り返しの比較 (目標の証拠 {TARGET_EVIDENCE})")
+    print("=" * 86)
+    print(f"{'N':>4} {'design':>9} {'trials':>7} {'min evidence':>13} {'RDM r':>7} {'select mean/max (ms)':>21}")
+    for num_items in args.items:
+        adaptive, greedy, times = run_simulation(num_items, args.per_trial, args.seed, args.max_trials)
+        times_ms = np.array(times) * 1000
+        print(f"{num_items:4d} {'adaptive':>9} {adaptive[0]:7d} {adaptive[1]:13.3f} {adaptive[2]:7.3f} "
+              f"{times_ms.mean():10.2f} / {times_ms.max():7.2f}")
+        print(f"{num_items:4d} {'greedy':>9} {greedy[0]:7d} {greedy[1]:13.3f} {greedy[2]:7.3f}")
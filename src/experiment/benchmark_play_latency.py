@@ -0,0 +1,105 @@
+"""
+クリックから send() が返るまでの時間のベンチマーク
+
+従来の play_stimulus（クリックのたびに Sine / Static と FociSTM を作って送る）と、
+datagram_cache で作っておいた (変調, PackedFociSTM) を取り出して送るだけの場合を、
+実機と同じ14台構成の Controller に Nop リンクをつないで比べる（通信そのものの時間は含まない）。
+PackedFociSTM が pyautd3 と同じバイト列を送ることも確認する。
+
+    python benchmark_play_latency.py
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from pyautd3 import AUTD3, Controller, FociSTM, Hz, Silencer, Sine, SineOption, Static
+from pyautd3.link.nop import Nop
+
+from datagram_cache import StimulusDatagramCache, check_packing, make_foci_stm
+from stimulus_bank import BANK_FILE, build_bank, load_bank
+from stm_resampler import fit_to_buffer
+from trajectory import Trajectory
+
+NUM_DEVICES = 14
+w = AUTD3.DEVICE_WIDTH
+h = AUTD3.DEVICE_HEIGHT
+CENTER = np.array([1.5 * w, h, 200.0])
+
+
+def modulation_for(am_freq):
+    if am_freq == 0:
+        return Static(intensity=255)
+    return Sine(freq=am_freq * Hz, option=SineOption(intensity=255))
+
+
+def legacy_play(autd, params, plan):
+    """従来の play_stimulus（STM の計画は作成済み）"""
+    m = modulation_for(params["am_freq"])
+    g = FociSTM(foci=plan.trajectory.to_foci(), config=plan.sampling_config())
+    autd.send((m, g))
+
+
+def cached_play(autd, cache, stim_id):
+    m, g = cache.get(stim_id)
+    autd.send((m, g))
+
+
+def open_bank(path):
+    if os.path.exists(path):
+        return load_bank(path)
+    # バンクを作っていない環境では一時ファイルに作る
+    return load_bank(build_bank(output=os.path.join(tempfile.mkdtemp(), "stimulus_bank.bin")))
+
+
+def run_benchmark(repeats, bank_path=BANK_FILE):
+    bank = open_bank(bank_path)
+    params = {stim_id: bank.params(stim_id) for stim_id in bank.ids}
+    plans = {stim_id: fit_to_buffer(Trajectory(bank.trajectory(stim_id), CENTER), params[stim_id]["velo"])
+             for stim_id in bank.ids}
+    if not all(check_packing(plan.trajectory.to_foci(), plan.sampling_config()) for plan in plans.values()):
+        raise AssertionError("PackedFociSTM differs from FociSTM")
+    print(f"{len(plans)} 刺激: PackedFociSTM の制御点は FociSTM と同じバイト列")
+
+    cache = StimulusDatagramCache(
+        lambda stim_id: (modulation_for(params[stim_id]["am_freq"]),
+                         make_foci_stm(plans[stim_id].trajectory.to_foci(), plans[stim_id].sampling_config())))
+    start_time = time.perf_counter()
+    cache.preload(bank.ids).wait()
+    print(f"全刺激のデータグラム作成 {(time.perf_counter() - start_time) * 1000:.1f} ms (起動時に別スレッドで実行)")
+
+    devices = [AUTD3(pos=[w * (i % 4), h * (i // 4), 0.0], rot=[1, 0, 0, 0]) for i in range(NUM_DEVICES)]
+    with Controller.open(devices, Nop()) as autd:
+        autd.send(Silencer.disable())
+        print(f"\n{'ID':>3} {'points':>7} {'legacy p50 (ms)':>16} {'cached p50 (ms)':>16} {'speedup':>8}")
+        totals = {"legacy": [], "cached": []}
+        for stim_id in bank.ids:
+            timings = {"legacy": [], "cached": []}
+            for _ in range(repeats):
+                for label, play in (("legacy", lambda: legacy_play(autd, params[stim_id], plans[stim_id])),
+                                    ("cached", lambda: cached_play(autd, cache, stim_id))):
+                    start_time = time.perf_counter()
+                    play()
+                    timings[label].append(time.perf_counter() - start_time)
+                    autd.send(Static(intensity=0))
+            legacy, cached = (np.median(timings[label]) * 1000 for label in ("legacy", "cached"))
+            for label in totals:
+                totals[label].extend(timings[label])
+            print(f"{stim_id:3d} {len(plans[stim_id].trajectory):7d} {legacy:16.2f} {cached:16.2f} "
+                  f"{legacy / cached:7.1f}x")
+
+    for label in ("legacy", "cached"):
+        samples = np.array(totals[label]) * 1000
+        print(f"{label}: p50 {np.percentile(samples, 50):.2f} ms, p95 {np.percentile(samples, 95):.2f} ms, "
+              f"max {samples.max():.2f} ms")
+    print(f"キャッシュ: {cache.summary()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark press-to-send latency with and without the datagram cache")
+    parser.add_argument("--repeats", type=int, default=5, help="Presses per stimulus and path")
+    parser.add_argument("--bank", default=BANK_FILE, help="Stimulus bank (built in a temporary directory if missing)")
+    args = parser.parse_args()
+    run_benchmark(args.repeats, args.bank)
@@ -0,0 +1,166 @@
+"""
+再生経路のオフラインベンチマーク（実機なし）
+
+RecordingController で EtherCAT の遅れ（1回あたり + 制御点1つあたり + ゆらぎ）と送信の失敗を模擬し、
+同じ参加者の操作（カーソルを乗せる -> 押す -> 離す）を時刻どおりに流して次の4つの経路を比べる。
+
+    uncached : 押すたびに (変調, FociSTM) を作り、GUI スレッドで送る（従来の play_stimulus）
+    cached   : datagram_cache から取り出して GUI スレッドで送る
+    worker   : 送信スレッド (send_worker) に渡し、古い意図は上書きする
+    preload  : worker + カーソルが乗った刺激を待機中のセグメントに書いておく (segment_player)
+
+押してから送信が終わるまでの時間は LatencyRecorder で、GUI が止まった時間はイベントごとに測る。
+
+    python benchmark_playback_paths.py
+    python benchmark_playback_paths.py --per-focus 0 --latency 0.05 --failure-rate 0.05
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+from pyautd3 import FociSTM
+
+from benchmark_play_latency import CENTER, modulation_for, open_bank
+from datagram_cache import StimulusDatagramCache, make_foci_stm
+from latency_recorder import PRESS, RELEASE, LatencyRecorder
+from playback import StimulusPlayback
+from recording_controller import RecordingController
+from segment_player import SegmentPlayer
+from send_worker import SendWorker
+from stimulus_bank import BANK_FILE
+from stm_resampler import fit_to_buffer
+from trajectory import Trajectory
+from trial_generator import GreedyTrialGenerator
+
+PATHS = ("uncached", "cached", "worker", "preload")
+
+
+def session_script(trials, presses, hover_prob, hover_lead, hold, gap, seed):
+    """[(時刻, "hover" / "press" / "release", 刺激ID)] を時刻順に返す"""
+    rng = random.Random(seed)
+    events = []
+    t = 0.0
+    for trial in trials:
+        for _ in range(presses):
+            stim_id = rng.choice(trial)
+            if rng.random() < hover_prob:
+                events.append((t, "hover", stim_id))
+            t += hover_lead
+            events.append((t, "press", stim_id))
+            t += rng.uniform(0.5, 1.5) * hold
+            events.append((t, "release", stim_id))
+            t += rng.uniform(0.5, 1.5) * gap
+    return events
+
+
+def run_path(path, script, builders, params, controller_options):
+    autd = RecordingController(**controller_options)
+    recorder = LatencyRecorder()
+    if path == "uncached":
+        get = builders["uncached"]
+    else:
+        cache = StimulusDatagramCache(builders["cached"]).preload(sorted({stim_id for _, _, stim_id in script}))
+        cache.wait()
+        get = cache.get
+    player = SegmentPlayer() if path == "preload" else None
+    # random_walk_circle.py の送信スレッドと同じ処理
+    output = StimulusPlayback(get, recorder, player, params)
+    play, stop = output.play, output.stop
+    worker = (SendWorker(autd, play, stop, stage=output.stage if player else None)
+              if path in ("worker", "preload") else None)
+
+    gui_block = []
+    start_time = time.perf_counter()
+    for t, kind, stim_id in script:
+        time.sleep(max(0.0, start_time + t - time.perf_counter()))
+        event_start = time.perf_counter()
+        if kind == "hover":
+            if worker is not None:
+                worker.post_stage(stim_id)
+            continue
+        recorder.record(PRESS if kind == "press" else RELEASE, stim_id if kind == "press" else -1)
+        if worker is not None:
+            worker.post_play(stim_id) if kind == "press" else worker.post_stop()
+        else:
+            try:
+                play(autd, stim_id) if kind == "press" else stop(autd)
+            except Exception:
+                pass  # 従来どおり警告を出して続ける
+        gui_block.append(time.perf_counter() - event_start)
+    if worker is not None:
+        worker.close()
+    output.stop_streaming()
+    elapsed = time.perf_counter() - start_time
+
+    summary = recorder.summary()
+    gui_block = np.array(gui_block) * 1000
+    return {
+        "path": path,
+        "emission": summary["overall"]["press_to_emission"],
+        "superseded": summary["superseded"],
+        "failures": summary["send_failures"],
+        "gui_block_p50": float(np.percentile(gui_block, 50)),
+        "gui_block_max": float(gui_block.max()),
+        "controller": autd.summary(),
+        "player": player.summary() if player else None,
+        "overrun": elapsed - script[-1][0],
+    }
+
+
+def print_results(results):
+    print(f"\n{'path':>9} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'GUI p50':>8} {'GUI max':>8} "
+          f"{'sends':>6} {'foci sent':>10} {'fail':>5} {'superseded':>11} {'hit rate':>9}")
+    for result in results:
+        emission = result["emission"] or {}
+        controller = result["controller"]
+        hit_rate = result["player"]["hit_rate"] if result["player"] else None
+        print(f"{result['path']:>9} {emission.get('p50_ms', np.nan):9.2f} {emission.get('p95_ms', np.nan):9.2f} "
+              f"{emission.get('p99_ms', np.nan):9.2f} {result['gui_block_p50']:8.2f} {result['gui_block_max']:8.2f} "
+              f"{controller['sends']:6d} {controller['foci_sent']:10d} {controller['failures']:5d} "
+              f"{result['superseded']:11d} {'-' if hit_rate is None else f'{hit_rate:.1%}':>9}")
+    print("p50/p95/p99: 押してから送信完了まで, GUI: 押す・離すで GUI スレッドが止まった時間 (ms)")
+
+
+def run_benchmark(args):
+    bank = open_bank(args.bank)
+    params = {stim_id: {**bank.params(stim_id), "trajectory": Trajectory(bank.trajectory(stim_id), CENTER)}
+              for stim_id in bank.ids}
+    plans = {stim_id: fit_to_buffer(params[stim_id]["trajectory"], params[stim_id]["velo"]) for stim_id in bank.ids}
+    builders = {
+        "uncached": lambda stim_id: (modulation_for(params[stim_id]["am_freq"]),
+                                     FociSTM(foci=plans[stim_id].trajectory.to_foci(),
+                                             config=plans[stim_id].sampling_config())),
+        "cached": lambda stim_id: (modulation_for(params[stim_id]["am_freq"]),
+                                   make_foci_stm(plans[stim_id].trajectory.to_foci(),
+                                                 plans[stim_id].sampling_config())),
+    }
+    trials = GreedyTrialGenerator(len(bank), 7, anchor_items=[0, 17], verbose=False,
+                                  rng=random.Random(args.seed)).trials[:args.trials]
+    script = session_script(trials, args.presses, args.hover_prob, args.hover_lead, args.hold, args.gap, args.seed)
+    controller_options = {"latency": args.latency, "latency_per_focus": args.per_focus, "jitter": args.jitter,
+                          "failure_rate": args.failure_rate, "seed": args.seed}
+    print(f"{len(trials)} トライアル, {sum(kind == 'press' for _, kind, _ in script)} 回押す "
+          f"(1セッション {script[-1][0]:.1f}s), 模擬リンク: {controller_options}")
+    results = [run_path(path, script, builders, params, controller_options) for path in args.paths]
+    print_results(results)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare playback paths offline against an emulated AUTD link")
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=list(PATHS))
+    parser.add_argument("--trials", type=int, default=4)
+    parser.add_argument("--presses", type=int, default=8, help="Presses per trial")
+    parser.add_argument("--hover-prob", type=float, default=0.8, help="Probability the cursor enters a token first")
+    parser.add_argument("--hover-lead", type=float, default=0.15, help="Seconds between hover and press")
+    parser.add_argument("--hold", type=float, default=0.2, help="Mean seconds a token is held")
+    parser.add_argument("--gap", type=float, default=0.1, help="Mean seconds between release and the next hover")
+    parser.add_argument("--latency", type=float, default=0.001, help="Emulated latency per send (s)")
+    parser.add_argument("--per-focus", type=float, default=5e-6, help="Emulated latency per control point (s)")
+    parser.add_argument("--jitter", type=float, default=0.002, help="Uniform extra latency per send (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.01, help="Probability that a send fails")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--bank", default=BANK_FILE, help="Stimulus bank (built in a temporary directory if missing)")
+    run_benchmark(parser.parse_args())
@@ -0,0 +1,93 @@
+"""
+軌道生成エンジンのベンチマークスクリプト
+
+従来の1点ずつの generate_points と trajectory_engine の生成速度 (points/sec) を比較し、
+compat モードが stimuli_seeds.json のシード値で従来と同じ軌道を返すことを確認する。
+"""
+
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+from trajectory_engine import generate_trajectory
+
+SEEDS_FILE = os.path.join(os.path.dirname(__file__), "stimuli_seeds.json")
+NUM_REPEATS = 3
+
+
+def generate_points_legacy(distance, num_points=1000):
+    """従来の generate_points（比較用にそのまま残したもの）"""
+    points = []
+    current_point = np.array([random.uniform(0.0, 10.0), random.uniform(0.0, 10.0), 0.0])
+    points.append(current_point.copy())
+
+    for _ in range(num_points - 1):
+        while True:
+            angle = random.uniform(0, 2 * np.pi)
+            next_x = current_point[0] + distance * np.cos(angle)
+            next_y = current_point[1] + distance * np.sin(angle)
+            if 0.0 <= next_x <= 10.0 and 0.0 <= next_y <= 10.0:
+                current_point = np.array([next_x, next_y, 0.0])
+                points.append(current_point.copy())
+                break
+    return np.array(points)
+
+
+def measure(func, num_points):
+    """NUM_REPEATS 回実行したときの points/sec を返す"""
+    start_time = time.perf_counter()
+    for i in range(NUM_REPEATS):
+        random.seed(i)
+        func()
+    elapsed = time.perf_counter() - start_time
+    return num_points * NUM_REPEATS / elapsed
+
+
+def check_compat():
+    """stimuli_seeds.json の全シードで従来と同じ軌道・乱数状態になるか確認"""
+    with open(SEEDS_FILE, "r") as f:
+        seeds_data = json.load(f)
+
+    all_ok = True
+    for stim in seeds_data["stimuli"]:
+        dist = stim["dist"]
+        num_points = 100000 if dist < 1.0 else 1000
+
+        random.seed(stim["seed"])
+        legacy = generate_points_legacy(dist, num_points)
+        legacy_next = random.random()
+
+        random.seed(stim["seed"])
+        engine = generate_trajectory(dist, num_points)
+        engine_next = random.random()
+
+        ok = np.array_equal(legacy, engine) and legacy_next == engine_next
+        all_ok &= ok
+        print(f"  Stimulus {stim['id']:2d} (seed={stim['seed']}, dist={dist}): {'OK' if ok else 'MISMATCH'}")
+    return all_ok
+
+
+def run_benchmark():
+    print("=" * 70)
+    print("軌道生成のベンチマーク (points/sec)")
+    print("=" * 70)
+
+    for dist, num_points in [(0.05, 100000), (4.0, 1000)]:
+        legacy = measure(lambda: generate_points_legacy(dist, num_points), num_points)
+        compat = measure(lambda: generate_trajectory(dist, num_points, mode="compat"), num_points)
+        fast = measure(lambda: generate_trajectory(dist, num_points, mode="numpy"), num_points)
+        print(f"\n--- dist = {dist} mm, points = {num_points} ---")
+        print(f"従来 (1点ずつ):   {legacy:12,.0f} points/sec")
+        print(f"engine (compat): {compat:12,.0f} points/sec  (x{compat / legacy:.1f})")
+        print(f"engine (numpy):  {fast:12,.0f} points/sec  (x{fast / legacy:.1f})")
+
+    print("\n互換性チェック (stimuli_seeds.json)")
+    all_ok = check_compat()
+    print("全シード一致" if all_ok else "不一致あり")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,142 @@
+"""
+トライアル生成 (GreedyTrialGenerator) のベンチマークスクリプト
+
+従来の辞書ベースの実装と trial_generator の行列ベースの実装の生成時間を N=8〜500 で比較し、
+同じシードから同じトライアルリストが得られることを確認する。
+大きな N で残る時間の大半は、従来と同じ乱数列を保つための random.shuffle である。
+"""
+
+import argparse
+import itertools
+import random
+import time
+from collections import defaultdict
+
+from trial_generator import GreedyTrialGenerator
+
+# (刺激数, 1回の提示数)
+SIZES = [(8, 5), (18, 7), (50, 7), (100, 7), (200, 7), (300, 7), (500, 7)]
+ANCHOR_ITEMS = [0, 17]  # random_walk_circle.py と同じアンカー
+CHECK_SEEDS = 20  # 一致確認に使うシード数
+LEGACY_MAX_ITEMS = 200  # 従来実装はこれより大きい N では遅すぎるので測らない
+CHECK_MAX_ITEMS = 100  # 一致確認をする N の上限
+
+
+def generate_legacy(num_items, items_per_trial, anchor_items=None):
+    """従来の GreedyTrialGenerator._generate（比較用にそのまま残したもの）"""
+    anchor_items = set(anchor_items) if anchor_items else set()
+    trials = []
+    all_items = list(range(num_items))
+    non_anchor_items = [i for i in all_items if i not in anchor_items]
+
+    all_pairs = list(itertools.combinations(all_items, 2))
+    anchor_pair = tuple(sorted(anchor_items)) if len(anchor_items) == 2 else None
+
+    pair_counts = defaultdict(int)
+
+    while True:
+        missing_pairs = [p for p in all_pairs if pair_counts[p] < 1 and p != anchor_pair]
+        if not missing_pairs:
+            break
+
+        current_trial_items = set(anchor_items)
+
+        target_pair = random.choice(missing_pairs)
+        for item in target_pair:
+            if item not in anchor_items and len(current_trial_items) < items_per_trial:
+                current_trial_items.add(item)
+
+        while len(current_trial_items) < items_per_trial:
+            best_candidate = -1
+            max_new_pairs = -1
+
+            candidates = [i for i in non_anchor_items if i not in current_trial_items]
+            if not candidates:
+                break
+            random.shuffle(candidates)
+
+            for cand in candidates:
+                new_pairs_count = 0
+                for existing in current_trial_items:
+                    pair = tuple(sorted((cand, existing)))
+                    if pair_counts[pair] < 1:
+                        new_pairs_count += 1
+
+                if new_pairs_count > max_new_pairs:
+                    max_new_pairs = new_pairs_count
+                    best_candidate = cand
+
+            if best_candidate != -1:
+                current_trial_items.add(best_candidate)
+            else:
+                current_trial_items.add(random.choice(candidates))
+
+        trial_list = list(current_trial_items)
+        trials.append(trial_list)
+
+        for p in itertools.combinations(trial_list, 2):
+            pair_counts[tuple(sorted(p))] += 1
+    return trials
+
+
+def generate_matrix(num_items, items_per_trial, anchor_items=None):
+    return GreedyTrialGenerator(num_items, items_per_trial, anchor_items=anchor_items, verbose=False).trials
+
+
+def check_identical(num_items, items_per_trial, anchor_items):
+    """CHECK_SEEDS 個のシードで、両実装のトライアルリストと生成後の random の状態が一致するか"""
+    for seed in range(CHECK_SEEDS):
+        random.seed(seed)
+        legacy = generate_legacy(num_items, items_per_trial, anchor_items)
+        legacy_next = random.random()
+        random.seed(seed)
+        matrix = generate_matrix(num_items, items_per_trial, anchor_items)
+        matrix_next = random.random()
+        if legacy != matrix or legacy_next != matrix_next:
+            return False
+    return True
+
+
+def measure(func, repeats):
+    """repeats 回実行したときの1回あたりの秒数と最後のトライアル数を返す"""
+    start_time = time.perf_counter()
+    for i in range(repeats):
+        random.seed(i)
+        trials = func()
+    return (time.perf_counter() - start_time) / repeats, len(trials)
+
+
+def run_benchmark(repeats):
+    print("=" * 70)
+    print("トライアル生成のベンチマーク")
+    print("=" * 70)
+    print(f"{'N':>5} {'k':>3} {'anchors':>8} {'trials':>7} {'従来 (s)':>10} {'行列 (s)':>10} {'速度比':>7} {'一致':>5}")
+
+    all_ok = True
+    for num_items, items_per_trial in SIZES:
+        for anchor_items in (None, ANCHOR_ITEMS):
+            if anchor_items and max(anchor_items) >= num_items:
+                continue
+            matrix_time, num_trials = measure(
+                lambda: generate_matrix(num_items, items_per_trial, anchor_items), repeats)
+            if num_items <= LEGACY_MAX_ITEMS:
+                legacy_time, _ = measure(lambda: generate_legacy(num_items, items_per_trial, anchor_items), repeats)
+                ok = check_identical(num_items, items_per_trial, anchor_items) if num_items <= CHECK_MAX_ITEMS else None
+                legacy_str, ratio_str = f"{legacy_time:10.3f}", f"x{legacy_time / matrix_time:6.1f}"
+            else:
+                ok = None
+                legacy_str, ratio_str = f"{'-':>10}", f"{'-':>7}"
+            all_ok &= ok is not False
+            ok_str = "-" if ok is None else ("OK" if ok else "NG")
+            print(f"{num_items:5d} {items_per_trial:3d} {'yes' if anchor_items else 'no':>8} {num_trials:7d} "
+                  f"{legacy_str} {matrix_time:10.3f} {ratio_str} {ok_str:>5}")
+
+    print("\n" + ("全シードで従来と同じトライアルリスト" if all_ok else "従来と異なるトライアルリストあり"))
+    return all_ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pair-coverage trial generator")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per size")
+    args = parser.parse_args()
+    run_benchmark(args.repeats)
@@ -0,0 +1,218 @@
+"""
+刺激ごとの (変調, STM) データグラムをあらかじめ作っておくキャッシュ
+
+TactileMapApp.play_stimulus はクリックのたびに Sine / Static と FociSTM を作っていた。
+FociSTM は制御点を1点ずつ ControlPoints(points=[ControlPoint(point=p)]) で包み、
+さらに send() の中で1点ずつ ctypes の構造体に詰め直すので、8000点の STM では
+送信前の Python の処理だけで数百 ms かかり、参加者はその間待たされていた。
+
+PackedFociSTM は制御点を pyautd3 と同じバイト列（ControlPoints1 の配列）に numpy で一度だけ詰めておき、
+send() ではそれをそのまま渡す。StimulusDatagramCache は刺激IDごとにデータグラムを作って覚えておき、
+起動時に別スレッドで全刺激を作る (preload) か、初めて使うときに作って最大 capacity 個を LRU で持つ。
+
+バイト列の並びは pyautd3 の内部に合わせているので、import 時に ControlPoints1 の大きさと強度の位置を確かめ、
+make_foci_stm() で最初に作る刺激は FociSTM が詰めるバイト列と比べる (check_packing)。
+どちらかが合わなければ（pyautd3 を更新したときなど）警告を出して普通の FociSTM を使う。
+"""
+
+import ctypes
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from pyautd3 import FociSTM
+from pyautd3.driver.datagram.stm.control_point import ControlPoint, ControlPoints, ControlPoints1
+from pyautd3.driver.datagram.stm.stm_sampling_config import _sampling_config
+from pyautd3.native_methods.autd3capi import NativeMethods as Base
+
+MAX_INTENSITY = 255
+
+# pyautd3 の ControlPoints1 (点 float32 x3, 位相オフセット, パディング, 強度, パディング) と同じ並び
+CONTROL_POINT_DTYPE = np.dtype({
+    "names": ["point", "phase_offset", "intensity"],
+    "formats": [("<f4", 3), "u1", "u1"],
+    "offsets": [0, 12, 16],
+    "itemsize": 20,
+})
+LAYOUT_MATCHES = (ctypes.sizeof(ControlPoints1) == CONTROL_POINT_DTYPE.itemsize
+                  and ControlPoints1._intensity.offset == CONTROL_POINT_DTYPE.fields["intensity"][1])
+
+
+def pack_foci(foci, intensity=MAX_INTENSITY):
+    """(N, 3) の絶対座標を FociSTM が send() で作るのと同じバイト列にする"""
+    packed = np.zeros(len(foci), dtype=CONTROL_POINT_DTYPE)
+    packed["point"] = foci
+    packed["intensity"] = intensity
+    return packed
+
+
+class _PackedFoci:
+    """FociSTM.foci の代わり。len() はすぐ返し、要素を取り出したときだけ ControlPoints を作る"""
+
+    __slots__ = ("packed",)
+
+    def __init__(self, packed):
+        self.packed = packed
+
+    def __len__(self):
+        return len(self.packed)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return ControlPoints(points=[ControlPoint(point=self.packed["point"][index])])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class PackedFociSTM(FociSTM):
+    """制御点を詰め終えた FociSTM（焦点1つ・強度最大）。何度 send() しても詰め直さない"""
+
+    def __init__(self, foci, config):
+        self.packed = pack_foci(np.asarray(foci, dtype=float))
+        self.foci = _PackedFoci(self.packed)
+        self.config = config
+
+    def _n(self):
+        return 1
+
+    def sampling_config(self):
+        return _sampling_config(self.config, len(self.packed))
+
+    def _raw_ptr(self, _):
+        return Base().stm_foci(
+            self.sampling_config()._inner,
+            self.packed.ctypes.data_as(ctypes.c_void_p),
+            len(self.packed),
+            1,
+        )
+
+
+def check_packing(foci, config):
+    """PackedFociSTM の制御点が pyautd3 の FociSTM と同じバイト列になるか"""
+    reference = FociSTM(foci=foci, config=config)
+    expected = np.fromiter((np.void(ControlPoints1(p.points[0], p.intensity.value)) for p in reference.foci),
+                           dtype=np.dtype((np.void, CONTROL_POINT_DTYPE.itemsize)))
+    return expected.tobytes() == PackedFociSTM(foci, config).packed.tobytes()
+
+
+_packing_ok = None  # None: まだ確かめていない
+_packing_lock = threading.Lock()
+
+
+def make_foci_stm(foci, config):
+    """確かめられていれば PackedFociSTM、そうでなければ普通の FociSTM を返す（最初の1回だけ check_packing する）"""
+    global _packing_ok
+    with _packing_lock:
+        if _packing_ok is None:
+            _packing_ok = LAYOUT_MATCHES and check_packing(foci, config)
+            if not _packing_ok:
+                print("Warning (Cache): control point layout differs from this pyautd3, using FociSTM.")
+    if _packing_ok:
+        return PackedFociSTM(foci, config)
+    return FociSTM(foci=foci, config=config)
+
+
+class StimulusDatagramCache:
+    """build(stim_id) で作ったデータグラムを刺激IDごとに覚えておく
+
+    capacity=None なら全部持ち、整数なら最近使った capacity 個だけを持つ。
+    preload() は別スレッドで作り始め、まだできていない刺激を get() したときは
+    その場で作る（別スレッドが作っている途中ならそれを待つ）。
+    """
+
+    def __init__(self, build, capacity=None):
+        self.build = build
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.build_times = {}  # stim_id -> 作るのにかかった時間 (s)
+        self._items = OrderedDict()
+        self._building = {}  # stim_id -> 作り終わったら set される Event
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, stim_id):
+        return stim_id in self._items
+
+    def get(self, stim_id):
+        while True:
+            with self._lock:
+                if stim_id in self._items:
+                    self._items.move_to_end(stim_id)
+                    self.hits += 1
+                    return self._items[stim_id]
+                event = self._building.get(stim_id)
+                if event is None:
+                    self.misses += 1
+                    break
+            event.wait()
+        return self._build(stim_id)
+
+    def _build(self, stim_id):
+        """作ってキャッシュに入れる（同じIDを同時に作らないよう _building で印をつける）"""
+        with self._lock:
+            if stim_id in self._items:
+                return self._items[stim_id]
+            event = self._building.get(stim_id)
+            if event is None:
+                event = self._building[stim_id] = threading.Event()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            event.wait()
+            return self.get(stim_id)
+        try:
+            start_time = time.perf_counter()
+            datagram = self.build(stim_id)
+            self.build_times[stim_id] = time.perf_counter() - start_time
+            with self._lock:
+                self._items[stim_id] = datagram
+                if self.capacity is not None and len(self._items) > self.capacity:
+                    self._items.popitem(last=False)
+            return datagram
+        finally:
+            with self._lock:
+                del self._building[stim_id]
+            event.set()
+
+    def preload(self, stim_ids):
+        """stim_ids の順に別スレッドで作る。できたものから get() で使える"""
+        def run():
+            for stim_id in stim_ids:
+                if self.capacity is not None and len(self._items) >= self.capacity:
+                    break
+                try:
+                    self._build(stim_id)
+                except Exception as e:
+                    # 失敗した刺激は get() のときにもう一度作る
+                    print(f"Warning (Preload): ID:{stim_id} could not be built. ({e})")
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """preload() が終わるまで待つ"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self._thread is None or not self._thread.is_alive()
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def summary(self):
+        return {
+            "cached": len(self._items),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "build_time_total": sum(self.build_times.values()),
+        }
@@ -0,0 +1,225 @@
+"""
+参加者ごとのトライアルリストを事前に作って保存しておくキャッシュ
+
+これまでトライアルリストは TactileMapApp.__init__ でシードなしの random から毎回作っていたため、
+参加者がどのデザインで実験したかを後から再現・確認できず、起動のたびに生成し直していた。
+ここではコホート（例えば60人分）のデザインをまとめて作って保存し、
+(num_items, items_per_trial, anchors, participant) で引けるようにする。
+
+コホートの全員に同じトライアルの集合（基本デザイン）を使い、参加者ごとに
+    - トライアルの順番: Williams のラテン方格の行（直前のトライアルとの組み合わせも釣り合う）
+    - 刺激の配置位置: トライアル内の並び（= 初期配置の円周上の位置）を参加者とトライアルごとに回転
+を変えてカウンターバランスする。
+基本デザインは greedy なら design_optimizer でトライアル数が最小のもの、
+balanced なら BalancedTrialGenerator を並列にやり直してばらつきが最小のものを使う。
+参加者名はコホートの空いている番号に先着順で割り当て、ファイルに記録する。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from design_optimizer import optimize_design
+from trial_generator import BalancedTrialGenerator
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "design_cache")
+DESIGN_KINDS = ("greedy", "balanced")
+NUM_PARTICIPANTS = 60
+BALANCED_RESTARTS = 16  # balanced の基本デザインを選ぶときのやり直し回数
+
+
+def cohort_path(num_items, items_per_trial, anchor_items, design="greedy", cache_dir=CACHE_DIR):
+    """(num_items, items_per_trial, anchors, design) ごとのコホートファイルのパス"""
+    anchors = "-".join(str(a) for a in sorted(anchor_items)) if anchor_items else "none"
+    return os.path.join(cache_dir, f"n{num_items}_k{items_per_trial}_a{anchors}_{design}.json")
+
+
+def williams_order(num_trials, participant):
+    """Williams のラテン方格で participant 番目の参加者のトライアル順を返す
+
+    トライアル数が奇数のときは、行を逆順にしたものも合わせて 2 * num_trials 人で釣り合う。
+    """
+    base = [0]
+    low, high = 1, num_trials - 1
+    while len(base) < num_trials:
+        base.append(low)
+        low += 1
+        if len(base) < num_trials:
+            base.append(high)
+            high -= 1
+    row = [(b + participant) % num_trials for b in base]
+    if num_trials % 2 == 1 and (participant // num_trials) % 2 == 1:
+        row.reverse()
+    return row
+
+
+def _balanced_restart(task):
+    """ワーカープロセスで balanced のデザインを1つ作る"""
+    num_items, items_per_trial, coverage, anchor_items, master_seed, restart = task
+    generator = BalancedTrialGenerator(num_items, items_per_trial, coverage=coverage, anchor_items=anchor_items,
+                                       verbose=False, rng=random.Random(f"{master_seed}:{restart}"))
+    pair_var = float(generator.free_pair_counts().var())
+    return restart, generator.trials, pair_var
+
+
+def base_design(num_items, items_per_trial, anchor_items, design="greedy", coverage=3, master_seed=0,
+                workers=None):
+    """コホートで共有するトライアルの集合を作る"""
+    if design == "greedy":
+        return optimize_design(num_items, items_per_trial, anchor_items, workers=workers,
+                               master_seed=master_seed)["trials"]
+    tasks = [(num_items, items_per_trial, coverage, anchor_items, master_seed, r) for r in range(BALANCED_RESTARTS)]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        results = list(executor.map(_balanced_restart, tasks))
+    # トライアル数が最小、同数ならペアの回数の分散が最小（さらに同じならやり直し番号が小さい）もの
+    _, trials, _ = min(results, key=lambda r: (len(r[1]), r[2], r[0]))
+    return trials
+
+
+def participant_design(base, participant, set_id):
+    """基本デザインの順番と刺激の並びを participant 用に入れ替える"""
+    order = williams_order(len(base), participant)
+    trials = []
+    rotations = []
+    for position, t in enumerate(order):
+        items = list(base[t])
+        # 同じトライアルの並びを参加者ごとに1つずつずらす（k 人で各刺激が各位置を一巡する）
+        shift = (participant + t) % len(items)
+        trials.append(items[shift:] + items[:shift])
+        rotations.append(shift)
+    digest = hashlib.sha1(json.dumps([set_id, participant, trials]).encode())
+    return {
+        "participant": participant,
+        "design_id": digest.hexdigest()[:16],
+        "order": order,
+        "rotations": rotations,
+        "trials": trials,
+    }
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def build_cohort(num_items, items_per_trial, anchor_items, design="greedy", coverage=3,
+                 num_participants=NUM_PARTICIPANTS, master_seed=0, workers=None, cache_dir=CACHE_DIR):
+    """コホート分のデザインを作って保存し、保存先のパスを返す（既存の名前の割り当ては引き継ぐ）"""
+    anchors = sorted(set(anchor_items)) if anchor_items else []
+    print(f"Building {design} base design for N={num_items}, k={items_per_trial}, anchors={anchors}...")
+    base = [sorted(trial) for trial in base_design(num_items, items_per_trial, anchors, design, coverage,
+                                                   master_seed, workers)]
+    key = {
+        "num_items": num_items,
+        "items_per_trial": items_per_trial,
+        "anchor_items": anchors,
+        "design": design,
+        "coverage": coverage if design == "balanced" else 1,
+        "master_seed": master_seed,
+    }
+    set_id = hashlib.sha1(json.dumps([key, base], sort_keys=True).encode()).hexdigest()[:16]
+
+    path = cohort_path(num_items, items_per_trial, anchors, design, cache_dir)
+    roster = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            old = json.load(f)
+        if old.get("set_id") == set_id:
+            roster = {name: p for name, p in old.get("roster", {}).items() if p < num_participants}
+        else:
+            print(f"Warning: replacing design set {old.get('set_id')} (participant names are not carried over)")
+
+    cohort = {
+        **key,
+        "set_id": set_id,
+        "base_trials": base,
+        "participants": [participant_design(base, p, set_id) for p in range(num_participants)],
+        "roster": roster,
+    }
+    os.makedirs(cache_dir, exist_ok=True)
+    _write_atomic(path, cohort)
+    print(f"Saved {num_participants} participant designs ({len(base)} trials each) to {path} (set_id={set_id})")
+    return path
+
+
+def load_participant_design(num_items, items_per_trial, anchor_items, name, design="greedy", coverage=3,
+                            cache_dir=CACHE_DIR):
+    """name の参加者のデザインを返す。キャッシュがない・空きがない場合は None
+
+    初めての名前にはコホートの空いている番号を割り当ててファイルに記録する。
+    """
+    path = cohort_path(num_items, items_per_trial, anchor_items, design, cache_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        cohort = json.load(f)
+    if design == "balanced" and cohort["coverage"] != coverage:
+        print(f"Warning: {path} was built for coverage {cohort['coverage']}, not {coverage}")
+        return None
+
+    roster = cohort["roster"]
+    if name not in roster:
+        used = set(roster.values())
+        free = [p["participant"] for p in cohort["participants"] if p["participant"] not in used]
+        if not free:
+            print(f"Warning: all {len(cohort['participants'])} designs in {path} are already assigned")
+            return None
+        roster[name] = free[0]
+        _write_atomic(path, cohort)
+    entry = cohort["participants"][roster[name]]
+    return {**entry, "set_id": cohort["set_id"]}
+
+
+def check_counterbalance(path):
+    """各トライアルが各順番に、各刺激が各位置に何回ずつ来たかの偏りを表示する"""
+    with open(path, "r") as f:
+        cohort = json.load(f)
+    num_trials = len(cohort["base_trials"])
+    k = cohort["items_per_trial"]
+    order_counts = np.zeros((num_trials, num_trials), dtype=int)
+    position_counts = np.zeros((cohort["num_items"], k), dtype=int)
+    carryover = np.zeros((num_trials, num_trials), dtype=int)
+    for p in cohort["participants"]:
+        for position, t in enumerate(p["order"]):
+            order_counts[t, position] += 1
+        for prev, nxt in zip(p["order"], p["order"][1:]):
+            carryover[prev, nxt] += 1
+        for trial in p["trials"]:
+            for position, item in enumerate(trial):
+                position_counts[item, position] += 1
+    off_diag = ~np.eye(num_trials, dtype=bool)
+    present = position_counts.sum(axis=1) > 0
+    spread = position_counts[present].max(axis=1) - position_counts[present].min(axis=1)
+    print(f"{path}: {len(cohort['participants'])} participants, {num_trials} trials, set_id={cohort['set_id']}")
+    print(f"  trial x order position: min {order_counts.min()}, max {order_counts.max()}")
+    print(f"  trial -> next trial:    min {carryover[off_diag].min()}, max {carryover[off_diag].max()}")
+    print(f"  item x circle position: largest per-item spread {spread.max()} "
+          f"(positions per item: {position_counts[present].min()}..{position_counts[present].max()})")
+    print(f"  assigned names: {len(cohort['roster'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate counterbalanced trial designs for a cohort")
+    parser.add_argument("--items", type=int, default=18, help="Number of stimuli")
+    parser.add_argument("--per-trial", type=int, default=7, help="Items per trial")
+    parser.add_argument("--anchors", type=int, nargs="*", default=[0, 17], help="Anchor items included in every trial")
+    parser.add_argument("--design", choices=DESIGN_KINDS, default="greedy")
+    parser.add_argument("--coverage", type=int, default=3, help="Minimum presentations per pair (balanced design)")
+    parser.add_argument("--participants", type=int, default=NUM_PARTICIPANTS)
+    parser.add_argument("--master-seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--show", action="store_true", help="Show the counterbalancing of an existing cohort")
+    args = parser.parse_args()
+
+    path = cohort_path(args.items, args.per_trial, args.anchors, args.design)
+    if not args.show:
+        path = build_cohort(args.items, args.per_trial, args.anchors, args.design, args.coverage,
+                            args.participants, args.master_seed, args.workers)
+    check_counterbalance(path)
@@ -0,0 +1,266 @@
+"""
+トライアル数の少ない実験デザインを探すスクリプト
+
+GreedyTrialGenerator は random.choice / random.shuffle を使うため、実行のたびに
+トライアル数がばらつく（トライアルが1つ増えるごとに参加者の拘束時間が延びる）。
+ここでは乱数を変えた greedy を何度もやり直し、それぞれについて
+「トライアルを1つ抜き、入れ替え (swap) の局所探索で抜けたペアを埋め直す」ことを繰り返して、
+全ペアを網羅したまま最もトライアル数の少ないデザインを残す。
+やり直しはプロセスプールで並列に行う。
+
+下限の目安として、被覆数 C(v, k, 2) の Schönheim 下限
+    L(v, k) = ceil(v / k * ceil((v - 1) / (k - 1)))
+と比較する。アンカー a 個を毎回含む場合は、残り v-a 個の刺激を k-a 枠で網羅する問題になる。
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from trial_generator import GreedyTrialGenerator, pair_count_matrix, required_pairs
+
+RESTARTS = 16  # greedy のやり直し回数
+ITERATIONS = 20000  # 1回のやり直しあたりの swap 回数の上限
+NOISE = 0.1  # 最良の swap ではなくランダムな swap を選ぶ確率（局所解から抜けるため）
+
+# 実験スクリプトで使っている組み合わせ: (スクリプト, 刺激数, 1回の提示数, アンカー)
+DESIGNS = [
+    ("random_walk_eight_stimuli", 8, 5, None),
+    ("gui_test", 18, 5, None),
+    ("random_walk_iMDS", 18, 7, None),
+    ("random_walk_circle", 18, 7, [0, 17]),
+]
+
+
+def schonheim_bound(v, k):
+    """被覆数 C(v, k, 2) の Schönheim 下限"""
+    if v <= k:
+        return 1 if v >= 2 else 0
+    return math.ceil(v / k * math.ceil((v - 1) / (k - 1)))
+
+
+def covering_bound(num_items, items_per_trial, anchor_items=None):
+    """アンカーを毎回含むデザインのトライアル数の下限"""
+    num_anchors = len(set(anchor_items)) if anchor_items else 0
+    return schonheim_bound(num_items - num_anchors, items_per_trial - num_anchors)
+
+
+def covers_all_pairs(trials, num_items, anchor_items=None):
+    """trials が網羅の必要な全ペアを含んでいるか"""
+    counts = pair_count_matrix(trials, num_items)
+    return not np.any((counts == 0) & required_pairs(num_items, anchor_items))
+
+
+class _SwapSearch:
+    """トライアルの集合を固定数のまま、1要素の入れ替えで未カバーのペアを減らしていく
+
+    counts はペアの提示回数、required は網羅が必要なペアのマスク。
+    アンカーは入れ替えの対象にしない。
+    """
+
+    def __init__(self, trials, num_items, anchor_items, rng):
+        self.trials = np.array(trials, dtype=np.int64)
+        self.counts = pair_count_matrix(trials, num_items)
+        self.required = required_pairs(num_items, anchor_items)
+        self.movable = np.ones(num_items, dtype=bool)
+        if anchor_items:
+            self.movable[list(anchor_items)] = False
+        self.rng = rng
+
+    def uncovered_pairs(self):
+        return np.argwhere(np.triu((self.counts == 0) & self.required))
+
+    def drop_trial(self):
+        """抜いたときに未カバーになるペアが最も少ないトライアルを抜く"""
+        losses = [self._unique_pairs(row) for row in self.trials]
+        best = np.flatnonzero(np.asarray(losses) == min(losses))
+        t = int(self.rng.choice(best))
+        idx = self.trials[t]
+        self.counts[np.ix_(idx, idx)] -= 1
+        np.fill_diagonal(self.counts, 0)
+        self.trials = np.delete(self.trials, t, axis=0)
+
+    def _unique_pairs(self, row):
+        sub = self.counts[np.ix_(row, row)]
+        return int(np.triu((sub == 1) & self.required[np.ix_(row, row)]).sum())
+
+    def _moves(self, a, b):
+        """a を含み b を含まないトライアルで、a 以外の要素 x を b に置き換える手の一覧と増減
+
+        増減 = (置き換えで未カバーになるペア数) - (新しく埋まるペア数)
+        """
+        rows = np.flatnonzero((self.trials == a).any(axis=1) & ~(self.trials == b).any(axis=1))
+        if len(rows) == 0:
+            return None
+        sub = self.trials[rows]  # (r, k)
+        # loss[r, p]: 要素 p を抜いたときに 1 → 0 になるペアの数
+        pair_idx = (sub[:, :, None], sub[:, None, :])
+        loss = ((self.counts[pair_idx] == 1) & self.required[pair_idx]).sum(axis=2)
+        # gain[r, p]: b を入れたときに 0 → 1 になるペアの数（抜いた要素とのペアは除く）
+        new = (self.counts[b, sub] == 0) & self.required[b, sub]
+        gain = new.sum(axis=1, keepdims=True) - new
+        delta = loss - gain
+        allowed = self.movable[sub] & (sub != a)
+        return rows, delta, allowed
+
+    def step(self, noise=NOISE):
+        """未カバーのペアを1つ選び、それを埋める swap を1回行う"""
+        uncovered = self.uncovered_pairs()
+        a, b = uncovered[self.rng.integers(len(uncovered))]
+        # (増減, トライアル番号, 位置, 入れる要素) を並べた配列
+        moves = []
+        for item, found in ((b, self._moves(a, b)), (a, self._moves(b, a))):
+            if found is None:
+                continue
+            rows, delta, allowed = found
+            r, p = np.nonzero(allowed)
+            moves.append(np.column_stack((delta[r, p], rows[r], p, np.full(len(r), item))))
+        if not moves:
+            # a も b もどのトライアルにも含まれない（抜いた直後など）: ランダムな位置に a を入れる
+            t = int(self.rng.integers(len(self.trials)))
+            positions = np.flatnonzero(self.movable[self.trials[t]])
+            self._apply(t, int(self.rng.choice(positions)), int(a))
+            return
+
+        moves = np.concatenate(moves)
+        if self.rng.random() >= noise:
+            moves = moves[moves[:, 0] == moves[:, 0].min()]
+        _, t, p, item = moves[self.rng.integers(len(moves))]
+        self._apply(int(t), int(p), int(item))
+
+    def _apply(self, t, p, item):
+        row = self.trials[t]
+        others = np.delete(row, p)
+        old = row[p]
+        self.counts[old, others] -= 1
+        self.counts[others, old] -= 1
+        self.counts[item, others] += 1
+        self.counts[others, item] += 1
+        row[p] = item
+
+
+def _run_restart(task):
+    """ワーカープロセスで1回分のやり直し（greedy + 局所探索）を行う"""
+    num_items, items_per_trial, anchor_items, master_seed, restart, iterations, deadline = task
+    if deadline is not None and time.time() > deadline:
+        return restart, None, None
+    # 乱数はやり直し番号から決まるので、ワーカー数や実行順に依存しない
+    rng = random.Random(f"{master_seed}:{restart}")
+    greedy = GreedyTrialGenerator(num_items, items_per_trial, anchor_items=anchor_items, verbose=False, rng=rng)
+    best = [sorted(trial) for trial in greedy.trials]
+
+    search = _SwapSearch(best, num_items, anchor_items, np.random.default_rng([master_seed, restart]))
+    # 下限に達したらそれ以上は減らせない
+    bound = covering_bound(num_items, items_per_trial, anchor_items)
+    used = 0
+    while used < iterations and len(search.trials) > bound:
+        search.drop_trial()
+        while used < iterations and len(search.uncovered_pairs()) > 0:
+            if deadline is not None and time.time() > deadline:
+                return restart, len(greedy.trials), best
+            search.step()
+            used += 1
+        if len(search.uncovered_pairs()) > 0:
+            break
+        best = [sorted(int(i) for i in row) for row in search.trials]
+    return restart, len(greedy.trials), best
+
+
+def optimize_design(num_items, items_per_trial, anchor_items=None, restarts=RESTARTS, iterations=ITERATIONS,
+                    time_budget=None, workers=None, master_seed=0):
+    """全ペアを網羅する最もトライアル数の少ないデザインを探す
+
+    restarts 回のやり直しを並列に行い、トライアル数が最小のもの（同数ならやり直し番号が小さいもの）を返す。
+    time_budget (秒) を指定すると、それを過ぎた時点で打ち切り、それまでに見つかった最良のデザインを返す。
+    time_budget を指定しなければ、結果はワーカー数に依存しない。
+    """
+    workers = workers or os.cpu_count() or 1
+    start_time = time.perf_counter()
+    deadline = time.time() + time_budget if time_budget else None
+    anchors = sorted(set(anchor_items)) if anchor_items else None
+    tasks = [(num_items, items_per_trial, anchors, master_seed, r, iterations, deadline) for r in range(restarts)]
+
+    greedy_counts = []
+    best, best_restart = None, None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for restart, greedy_count, trials in executor.map(_run_restart, tasks):
+            if trials is None:
+                continue
+            greedy_counts.append(greedy_count)
+            if best is None or len(trials) < len(best):
+                best, best_restart = trials, restart
+
+    if best is None:
+        raise RuntimeError("No restart finished within the time budget")
+    if not covers_all_pairs(best, num_items, anchors):
+        raise RuntimeError("Optimized design does not cover all pairs")
+    return {
+        "num_items": num_items,
+        "items_per_trial": items_per_trial,
+        "anchor_items": anchors or [],
+        "master_seed": master_seed,
+        "restart": best_restart,
+        "restarts_finished": len(greedy_counts),
+        "greedy_trials": greedy_counts,
+        "bound": covering_bound(num_items, items_per_trial, anchors),
+        "trials": best,
+        "elapsed": time.perf_counter() - start_time,
+    }
+
+
+def print_bound_table(restarts=RESTARTS, iterations=ITERATIONS, time_budget=None, workers=None, master_seed=0):
+    """実験で使う (N, k, アンカー) について、greedy・最適化後・Schönheim 下限のトライアル数を比較する"""
+    print("=" * 86)
+    print("トライアル数の比較 (greedy / 最適化後 / 被覆数 C(v, k, 2) の Schönheim 下限)")
+    print("=" * 86)
+    print(f"{'script':<26} {'N':>3} {'k':>3} {'anchors':>8} {'greedy (min/mean)':>18} "
+          f"{'optimized':>9} {'bound':>6} {'gap':>4} {'time (s)':>9}")
+    for script, num_items, items_per_trial, anchor_items in DESIGNS:
+        result = optimize_design(num_items, items_per_trial, anchor_items, restarts=restarts,
+                                 iterations=iterations, time_budget=time_budget, workers=workers,
+                                 master_seed=master_seed)
+        greedy = result["greedy_trials"]
+        optimized = len(result["trials"])
+        bound = result["bound"]
+        anchors = "-".join(map(str, anchor_items)) if anchor_items else "-"
+        print(f"{script:<26} {num_items:3d} {items_per_trial:3d} {anchors:>8} "
+              f"{min(greedy):>8d} / {np.mean(greedy):7.2f} {optimized:9d} {bound:6d} {optimized - bound:4d} "
+              f"{result['elapsed']:9.1f}")
+    print("\ngap = 最適化後 - 下限（下限は必ずしも達成できるとは限らない）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search for a trial design with the fewest trials")
+    parser.add_argument("--items", type=int, default=18, help="Number of stimuli")
+    parser.add_argument("--per-trial", type=int, default=7, help="Items per trial")
+    parser.add_argument("--anchors", type=int, nargs="*", default=[0, 17], help="Anchor items included in every trial")
+    parser.add_argument("--restarts", type=int, default=RESTARTS, help="Number of randomized greedy restarts")
+    parser.add_argument("--iterations", type=int, default=ITERATIONS, help="Swap moves per restart")
+    parser.add_argument("--time-budget", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--master-seed", type=int, default=0, help="Seed for the restarts")
+    parser.add_argument("--output", default=None, help="Save the best design to this JSON file")
+    parser.add_argument("--table", action="store_true",
+                        help="Compare trial counts with the Schönheim bound for the experiment designs")
+    args = parser.parse_args()
+
+    if args.table:
+        print_bound_table(args.restarts, args.iterations, args.time_budget, args.workers, args.master_seed)
+    else:
+        result = optimize_design(args.items, args.per_trial, args.anchors, restarts=args.restarts,
+                                 iterations=args.iterations, time_budget=args.time_budget,
+                                 workers=args.workers, master_seed=args.master_seed)
+        print(f"Greedy: min {min(result['greedy_trials'])}, mean {np.mean(result['greedy_trials']):.2f} trials "
+              f"({result['restarts_finished']} restarts)")
+        print(f"Optimized: {len(result['trials'])} trials (restart {result['restart']}, "
+              f"bound {result['bound']}, {result['elapsed']:.1f}s)")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(result, f, indent=4)
+            print(f"Design saved to {args.output}")
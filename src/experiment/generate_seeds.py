@@ -10,6 +10,14 @@ import numpy as np
 import random
 import json
 import os
+import time
+import argparse
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from stimulus_rng import make_stream_spec, stream_rng
+from streaming_validator import check_trajectory
+from trajectory_engine import MODES, generate_trajectory
 
 # 設定
 CENTER = np.array([0.0, 0.0, 0.0])  # 相対座標で生成（後でcenterを足す）
@@ -20,23 +28,14 @@ DISTANCES = [0.05, 4.0]
 VELOCITIES = [10, 100, 1000]
 AM_FREQS = [0, 20, 100]
 
+MAX_ATTEMPTS = 100  # 1刺激あたりに試すシードの最大数
+PROGRESS_INTERVAL = 5.0  # 進捗表示の間隔 (秒)
 
-def generate_points(distance, num_points=1000):
-    """ランダムウォークでnum_points点の軌道を生成"""
-    points = []
-    current_point = np.array([random.uniform(0.0, 10.0), random.uniform(0.0, 10.0), 0.0])
-    points.append(current_point.copy())
-    
-    for _ in range(num_points - 1):
-        while True:
-            angle = random.uniform(0, 2 * np.pi)
-            next_x = current_point[0] + distance * np.cos(angle)
-            next_y = current_point[1] + distance * np.sin(angle)
-            if 0.0 <= next_x <= 10.0 and 0.0 <= next_y <= 10.0:
-                current_point = np.array([next_x, next_y, 0.0])
-                points.append(current_point.copy())
-                break
-    return np.array(points)
+
+def generate_points(distance, num_points=1000, mode="compat", seed=None):
+    """ランダムウォークでnum_points点の軌道を生成（compat以外のmodeはseedから乱数を作る）"""
+    rng = None if mode == "compat" else seed
+    return generate_trajectory(distance, num_points, mode=mode, rng=rng)
 
 
 def is_valid_trajectory(points, centroid_threshold=2.0, std_threshold=1.5, range_threshold=6.0):
@@ -60,17 +59,35 @@ def is_valid_trajectory(points, centroid_threshold=2.0, std_threshold=1.5, range
     return True
 
 
-def find_valid_seed(distance, max_attempts=100):
-    """有効な軌道を生成できるシード値を探す"""
-    num_points = 100000 if distance < 1.0 else 1000
-    
-    for attempt in range(max_attempts):
-        seed = random.randint(0, 2**31 - 1)
+def num_points_for(distance):
+    """distに応じたポイント数"""
+    return 100000 if distance < 1.0 else 1000
+
+
+def candidate_seeds(master_seed, stim_id, max_attempts=MAX_ATTEMPTS):
+    """刺激ごとに試すシード値の列（master_seed と刺激IDだけで決まる）"""
+    rng = random.Random(f"{master_seed}:{stim_id}")
+    return [rng.randint(0, 2**31 - 1) for _ in range(max_attempts)]
+
+
+def check_seed(distance, seed, mode="compat", rng=None):
+    """シード値から軌道を生成して妥当性を返す（不合格が確定した時点で生成を打ち切る）
+
+    rng を渡した場合はモジュール共通の乱数を初期化せず、その Generator から生成する。
+    """
+    if rng is None:
         random.seed(seed)
         np.random.seed(seed)
-        
-        trajectory = generate_points(distance, num_points)
-        if is_valid_trajectory(trajectory):
+        rng = None if mode == "compat" else seed
+    is_valid, _, _ = check_trajectory(distance, num_points_for(distance), mode=mode, rng=rng)
+    return is_valid
+
+
+def find_valid_seed(distance, max_attempts=MAX_ATTEMPTS, mode="compat", seeds=None):
+    """有効な軌道を生成できるシード値を探す（1刺激分を順番に試す）"""
+    for attempt in range(max_attempts):
+        seed = seeds[attempt] if seeds is not None else random.randint(0, 2**31 - 1)
+        if check_seed(distance, seed, mode):
             print(f"  Found valid seed {seed} for dist={distance} on attempt {attempt + 1}")
             return seed
     
@@ -78,31 +95,144 @@ def find_valid_seed(distance, max_attempts=100):
     return seed  # 最後に試したシードを返す
 
 
-def generate_all_seeds():
-    """全18刺激のシード値を生成"""
-    print("Generating valid seeds for all 18 stimuli...")
+def _run_attempt(task):
+    """ワーカープロセスで1回分の試行を行う"""
+    stim_id, attempt, distance, seed, mode, streams = task
+    start_time = time.perf_counter()
+    rng = stream_rng(streams, stim_id, "trajectory", attempt) if streams else None
+    valid = check_seed(distance, seed, mode, rng)
+    return stim_id, attempt, valid, os.getpid(), time.perf_counter() - start_time
+
+
+def _report_progress(worker_attempts, start_time):
+    elapsed = time.perf_counter() - start_time
+    rates = ", ".join(f"pid {pid}: {n / elapsed:.2f}" for pid, n in sorted(worker_attempts.items()))
+    print(f"  [progress {elapsed:6.1f}s] attempts/sec per worker -> {rates}")
+
+
+def search_seeds_parallel(stimuli, mode="compat", master_seed=0, workers=None, max_attempts=MAX_ATTEMPTS,
+                          streams=None):
+    """全刺激のシード探索をプロセスプールで並列に行う
+
+    各刺激の候補シード列は master_seed から決まり、「最初に妥当になった候補」を採用する。
+    streams（ストリームの仕様）を渡した場合、候補は軌道ストリームの試行番号 0, 1, 2, ... になる。
+    ある刺激で候補 a が妥当と分かった時点で、それより後ろの候補は投入せず実行待ちもキャンセルする。
+    a より前の候補がすべて終わるまでは確定しないので、結果はワーカー数に依存しない。
+    """
+    workers = workers or os.cpu_count() or 1
+    if streams:
+        candidates = {s["id"]: list(range(max_attempts)) for s in stimuli}
+    else:
+        candidates = {s["id"]: candidate_seeds(master_seed, s["id"], max_attempts) for s in stimuli}
+    dist_of = {s["id"]: s["dist"] for s in stimuli}
+
+    next_attempt = {stim_id: 0 for stim_id in candidates}
+    outcomes = {stim_id: {} for stim_id in candidates}   # attempt -> valid
+    best = {stim_id: max_attempts for stim_id in candidates}  # 妥当だった最小の attempt
+    chosen = {}
+    worker_attempts = defaultdict(int)
+    start_time = time.perf_counter()
+    last_report = start_time
+
+    def resolve(stim_id):
+        # best より前の候補がすべて不合格と確定したら採用する
+        limit = best[stim_id]
+        if all(outcomes[stim_id].get(a) is False for a in range(min(limit, max_attempts))):
+            attempt = limit if limit < max_attempts else max_attempts - 1
+            chosen[stim_id] = (candidates[stim_id][attempt], attempt, limit < max_attempts)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        inflight = {}
+        while len(chosen) < len(candidates):
+            # 未確定の刺激に順番に試行を投入する（ワーカー数の2倍まで）
+            submitted = True
+            while len(inflight) < 2 * workers and submitted:
+                submitted = False
+                for stim_id in candidates:
+                    if len(inflight) >= 2 * workers:
+                        break
+                    attempt = next_attempt[stim_id]
+                    if stim_id in chosen or attempt >= best[stim_id]:
+                        continue
+                    task = (stim_id, attempt, dist_of[stim_id], candidates[stim_id][attempt], mode, streams)
+                    inflight[executor.submit(_run_attempt, task)] = (stim_id, attempt)
+                    next_attempt[stim_id] += 1
+                    submitted = True
+
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for future in done:
+                stim_id, attempt = inflight.pop(future)
+                if future.cancelled():
+                    continue
+                _, _, valid, pid, _ = future.result()
+                worker_attempts[pid] += 1
+                outcomes[stim_id][attempt] = valid
+                if valid and attempt < best[stim_id]:
+                    best[stim_id] = attempt
+                    # 後ろの候補は不要なので実行待ちをキャンセル
+                    for other, (other_stim, other_attempt) in inflight.items():
+                        if other_stim == stim_id and other_attempt > attempt:
+                            other.cancel()
+                if stim_id not in chosen:
+                    resolve(stim_id)
+                    if stim_id in chosen:
+                        seed, found_attempt, found = chosen[stim_id]
+                        if found:
+                            label = "stream attempt" if streams else "seed"
+                            print(f"  Stimulus {stim_id}: valid {label} {seed} (dist={dist_of[stim_id]}) on attempt {found_attempt + 1}")
+                        else:
+                            print(f"  WARNING: Stimulus {stim_id}: no valid seed after {max_attempts} attempts")
+
+            if time.perf_counter() - last_report > PROGRESS_INTERVAL:
+                _report_progress(worker_attempts, start_time)
+                last_report = time.perf_counter()
+
+        for future in inflight:
+            future.cancel()
+
+    _report_progress(worker_attempts, start_time)
+    return {stim_id: seed for stim_id, (seed, _, _) in chosen.items()}
+
+
+def generate_all_seeds(mode="compat", master_seed=None, workers=None, streams=False):
+    """全18刺激のシード値を生成
+
+    streams=True のときは刺激ごとの乱数ストリーム (stimulus_rng) を使い、
+    シード値の代わりに妥当だった試行番号 (attempt) を保存する。
+    """
+    if streams and mode == "compat":
+        raise ValueError("--streams needs a numpy or arc trajectory mode")
+    if master_seed is None:
+        master_seed = random.SystemRandom().randint(0, 2**31 - 1)
+    print(f"Generating valid seeds for all 18 stimuli (mode={mode}, master_seed={master_seed})...")
     print("=" * 60)
     
     seeds_data = {
         "description": "Seed values for reproducible trajectory generation",
+        "mode": mode,
+        "master_seed": master_seed,
         "stimuli": []
     }
+    spec = make_stream_spec(master_seed) if streams else None
+    if spec:
+        seeds_data["streams"] = spec
     
     idx = 0
     for dist in DISTANCES:
         for velo in VELOCITIES:
             for am in AM_FREQS:
-                print(f"Stimulus {idx}: dist={dist}, velo={velo}, am={am}")
-                seed = find_valid_seed(dist)
-                
                 seeds_data["stimuli"].append({
                     "id": idx,
                     "dist": dist,
                     "velo": velo,
                     "am_freq": am,
-                    "seed": seed
                 })
                 idx += 1
+
+    seeds = search_seeds_parallel(seeds_data["stimuli"], mode=mode, master_seed=master_seed, workers=workers,
+                                  streams=spec)
+    for stim in seeds_data["stimuli"]:
+        stim["attempt" if spec else "seed"] = seeds[stim["id"]]
     
     # 保存
     with open(OUTPUT_FILE, "w") as f:
@@ -114,4 +244,13 @@ def generate_all_seeds():
 
 
 if __name__ == "__main__":
-    generate_all_seeds()
+    parser = argparse.ArgumentParser(description="Generate valid trajectory seeds")
+    parser.add_argument("--mode", choices=MODES, default="compat",
+                        help="Trajectory mode (compat: 従来の棄却法, arc: 円弧から直接サンプリング)")
+    parser.add_argument("--master-seed", type=int, default=None,
+                        help="Master seed for the candidate seed lists (same value -> same output file)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--streams", action="store_true",
+                        help="Use per-stimulus SeedSequence streams (trajectory/color/layout) instead of global seeds")
+    args = parser.parse_args()
+    generate_all_seeds(args.mode, args.master_seed, args.workers, args.streams)
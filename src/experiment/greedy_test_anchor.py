@@ -8,6 +8,8 @@ import itertools
 from collections import defaultdict
 from datetime import datetime
 
+from trajectory_engine import generate_trajectory
+
 # --- AUTD3ライブラリのインポート (実機がない環境でも動くように工夫) ---
 try:
     from pyautd3 import (
@@ -30,6 +32,7 @@ CANVAS_SIZE = 800
 ARENA_RADIUS = 350
 NODE_RADIUS = 20    
 ITEMS_PER_TRIAL = 7 # 1回の提示数 (アンカー2個 + 自由枠3個)
+TRAJECTORY_MODE = "compat"  # 軌道の生成方法 ("arc" にすると棄却なしで円弧から直接サンプリング)
 
 def err_handler(idx: int, status) -> None:
     pass
@@ -121,19 +124,7 @@ class AnchorFixedTrialGenerator:
 
 # --- 幾何計算用の関数 ---
 def generate_points(distance, center):
-    points = []
-    current_point = np.array([random.uniform(0.0, 10.0), random.uniform(0.0, 10.0), 0.0])
-    points.append(center + current_point)
-    for _ in range(999): 
-        while True:
-            angle = random.uniform(0, 2 * np.pi)
-            next_x = current_point[0] + distance * np.cos(angle)
-            next_y = current_point[1] + distance * np.sin(angle)
-            if 0.0 <= next_x <= 10.0 and 0.0 <= next_y <= 10.0:
-                current_point = np.array([next_x, next_y, 0.0])
-                points.append(center + current_point)
-                break
-    return points
+    return generate_trajectory(distance, 1000, center=center, mode=TRAJECTORY_MODE)
 
 # --- GUIアプリケーションクラス ---
 class TactileMapApp:
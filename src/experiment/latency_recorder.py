@@ -0,0 +1,176 @@
+"""
+クリックから刺激が出るまでの遅れを記録するレコーダー
+
+参加者がトークンを押してから配列が出力を始めるまでどれだけ待っているのか、
+「Warning (Play): Communication failed」がどれくらい起きているのかのデータがなかった。
+LatencyRecorder は on_press / play_stimulus / autd.send / on_release の前後で
+(イベント, 刺激ID, time.perf_counter_ns()) をあらかじめ確保したリングバッファに書くだけにして
+（1イベント 1 us 未満。python latency_recorder.py で確認できる）、
+集計はセッションの終わりに1回だけ行う。
+
+    押す (press) -> play_stimulus (play) -> 送信開始 (send_start) -> 送信完了 (send_end) / 失敗 (send_fail)
+    離す (release) -> 停止の送信開始 (stop_start) -> 停止の送信完了 (stop_end) / 失敗 (stop_fail)
+
+press から send_end までを「押してから出力まで」とし、刺激IDごとに p50 / p95 / p99 を出す。
+送信スレッドで次の press に上書きされた（送られなかった）press は superseded に数える。
+
+    python latency_recorder.py    # 1イベントあたりの記録のオーバーヘッドを測る
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+EVENTS = ("press", "play", "send_start", "send_end", "send_fail", "release", "stop_start", "stop_end", "stop_fail")
+(PRESS, PLAY, SEND_START, SEND_END, SEND_FAIL, RELEASE, STOP_START, STOP_END, STOP_FAIL) = range(len(EVENTS))
+CAPACITY = 1 << 16  # 1セッション（押す・離すが数千回）なら一周しない
+PERCENTILES = (50, 95, 99)
+
+
+def _stats(samples_ns):
+    if not samples_ns:
+        return None
+    samples = np.array(samples_ns) / 1e6
+    stats = {f"p{q}_ms": float(np.percentile(samples, q)) for q in PERCENTILES}
+    stats.update(n=len(samples), max_ms=float(samples.max()))
+    return stats
+
+
+def _new_entry():
+    return {"press_to_emission": [], "queue": [], "send": [], "failures": 0}
+
+
+class LatencyRecorder:
+    """(イベント, 刺激ID, 時刻 ns) を固定長のリングバッファに書く。GUI と送信スレッドの両方から呼んでよい"""
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.event = np.zeros(capacity, dtype=np.int8)
+        self.stim_id = np.zeros(capacity, dtype=np.int16)
+        self.t_ns = np.zeros(capacity, dtype=np.int64)
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def record(self, event, stim_id=-1, t=None):
+        """t を省略すると今の時刻 (perf_counter_ns) を使う"""
+        if t is None:
+            t = time.perf_counter_ns()
+        with self._lock:
+            i = self.recorded % self.capacity
+            self.recorded += 1
+        self.event[i] = event
+        self.stim_id[i] = stim_id
+        self.t_ns[i] = t
+
+    def samples(self):
+        """記録順に並べた (event, stim_id, t_ns)。一周していれば古いものは失われている"""
+        with self._lock:
+            n = self.recorded
+        if n <= self.capacity:
+            order = np.arange(n)
+        else:
+            order = np.roll(np.arange(self.capacity), -(n % self.capacity))
+        return self.event[order], self.stim_id[order], self.t_ns[order]
+
+    def summary(self):
+        events, stim_ids, times = self.samples()
+        per_stim = {}
+        overall = {"press_to_emission": [], "queue": [], "send": [], "release_to_stop": []}
+        failures = {"play": 0, "stop": 0}
+        presses = superseded = 0
+        press = None  # (刺激ID, press の時刻)
+        send_start = None
+        release = None
+        for event, stim_id, t in zip(events.tolist(), stim_ids.tolist(), times.tolist()):
+            if event == PRESS:
+                presses += 1
+                if press is not None:
+                    superseded += 1
+                press = (stim_id, t)
+            elif event == SEND_START:
+                send_start = (stim_id, t)
+                if press is not None and press[0] == stim_id:
+                    per_stim.setdefault(stim_id, _new_entry())["queue"].append(t - press[1])
+                    overall["queue"].append(t - press[1])
+            elif event in (SEND_END, SEND_FAIL):
+                entry = per_stim.setdefault(stim_id, _new_entry())
+                if send_start is not None and send_start[0] == stim_id:
+                    entry["send"].append(t - send_start[1])
+                    overall["send"].append(t - send_start[1])
+                send_start = None
+                if event == SEND_FAIL:
+                    entry["failures"] += 1
+                    failures["play"] += 1
+                elif press is not None and press[0] == stim_id:
+                    entry["press_to_emission"].append(t - press[1])
+                    overall["press_to_emission"].append(t - press[1])
+                if press is not None and press[0] == stim_id:
+                    press = None
+            elif event == RELEASE:
+                release = t
+            elif event == STOP_END and release is not None:
+                overall["release_to_stop"].append(t - release)
+                release = None
+            elif event == STOP_FAIL:
+                failures["stop"] += 1
+                release = None
+        return {
+            "events": int(len(events)),
+            "lost_events": max(0, self.recorded - self.capacity),
+            "presses": presses,
+            "superseded": superseded,
+            "send_failures": failures,
+            "overall": {name: _stats(samples) for name, samples in overall.items()},
+            "per_stimulus": {
+                str(stim_id): {**{name: _stats(entry[name]) for name in ("press_to_emission", "queue", "send")},
+                               "failures": entry["failures"]}
+                for stim_id, entry in sorted(per_stim.items())
+            },
+        }
+
+    def save(self, path):
+        """集計と生の記録（時刻は最初のイベントからの ns）を JSON に保存する"""
+        events, stim_ids, times = self.samples()
+        data = {
+            "summary": self.summary(),
+            "samples": {
+                "event_names": list(EVENTS),
+                "event": events.tolist(),
+                "stim_id": stim_ids.tolist(),
+                "t_ns": (times - times[0]).tolist() if len(times) else [],
+            },
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+        return data["summary"]
+
+
+def print_summary(summary):
+    emission = summary["overall"]["press_to_emission"]
+    print(f"Latency: {summary['presses']} presses ({summary['superseded']} superseded), "
+          f"send failures play={summary['send_failures']['play']} stop={summary['send_failures']['stop']}")
+    if emission:
+        print(f"  press -> emission: p50 {emission['p50_ms']:.2f} ms, p95 {emission['p95_ms']:.2f} ms, "
+              f"p99 {emission['p99_ms']:.2f} ms")
+
+
+def measure_overhead(num_events=200000):
+    """1イベントを記録するのにかかる時間 (us)"""
+    recorder = LatencyRecorder()
+    start_time = time.perf_counter()
+    for i in range(num_events):
+        recorder.record(PRESS, i % 18)
+    return (time.perf_counter() - start_time) / num_events * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the per-event overhead of LatencyRecorder")
+    parser.add_argument("--events", type=int, default=200000)
+    args = parser.parse_args()
+    print(f"記録のオーバーヘッド: {measure_overhead(args.events):.2f} us/イベント (上限 10 us)")
@@ -0,0 +1,83 @@
+"""
+送信スレッドで刺激を再生・停止・先読みする処理
+
+TactileMapApp と benchmark_playback_paths.py が同じ経路を通るよう、
+SendWorker に渡す play / stop / stage の中身をここにまとめる。
+
+    play  : (変調, STM) を取り出し、SegmentPlayer で切り替えるか、そのまま送る。
+            STM が None の刺激（stream モード）は SegmentStreamer で全点を再生する
+    stop  : ストリーミングを止めてから、再生中のセグメントの変調を Static(intensity=0) にする
+    stage : 待機中のセグメントに STM を書いておく（ストリーミング中は何もしない）
+
+送信の前後は LatencyRecorder に記録し、失敗したら SEND_FAIL / STOP_FAIL を書いて例外をそのまま投げる。
+"""
+
+from pyautd3 import Static
+
+from latency_recorder import SEND_END, SEND_FAIL, SEND_START, STOP_END, STOP_FAIL, STOP_START
+from segment_streamer import SegmentStreamer, divide_for
+
+
+class StimulusPlayback:
+    """get(stim_id) -> (変調, STM or None) で取り出した刺激を送る
+
+    params[stim_id] は stream モードの刺激を再生するときだけ使う（dist, velo, trajectory）。
+    play / stop / stage は同じスレッド（送信スレッド）から呼ぶ。
+    """
+
+    def __init__(self, get, recorder, player=None, params=None):
+        self.get = get
+        self.recorder = recorder
+        self.player = player
+        self.params = params
+        self.streamer = None  # stream モードで再生中の SegmentStreamer
+
+    def play(self, autd, stim_id):
+        self.recorder.record(SEND_START, stim_id)
+        try:
+            self._send_stimulus(autd, stim_id)
+        except Exception:
+            self.recorder.record(SEND_FAIL, stim_id)
+            raise
+        self.recorder.record(SEND_END, stim_id)
+
+    def _send_stimulus(self, autd, stim_id):
+        m, g = self.get(stim_id)
+        self.stop_streaming()
+        if g is None:
+            # 全点を元の速度のまま、S0/S1 を交互に書き換えて再生する
+            params = self.params[stim_id]
+            divide = divide_for(params['dist'], params['velo'])
+            if self.player is not None:
+                self.player.invalidate()
+            self.streamer = SegmentStreamer(autd, params['trajectory'], divide, modulation=m).start()
+            return
+        if self.player is not None:
+            self.player.play(autd, stim_id, m, g)
+        else:
+            autd.send((m, g))
+
+    def stop(self, autd):
+        self.recorder.record(STOP_START)
+        try:
+            self.stop_streaming()
+            if self.player is not None:
+                self.player.stop(autd)
+            else:
+                autd.send(Static(intensity=0))
+        except Exception:
+            self.recorder.record(STOP_FAIL)
+            raise
+        self.recorder.record(STOP_END)
+
+    def stage(self, autd, stim_id):
+        if self.streamer is not None:
+            return  # ストリーミング中は両方のセグメントを使っている
+        _, g = self.get(stim_id)
+        if g is not None:
+            self.player.stage(autd, stim_id, g)
+
+    def stop_streaming(self):
+        if self.streamer is not None:
+            self.streamer.stop()
+            self.streamer = None
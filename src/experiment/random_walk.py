@@ -1,5 +1,4 @@
 import numpy as np
-import random
 import msvcrt
 import time
 from pyautd3 import (
@@ -29,23 +28,13 @@ from pyautd3.modulation import Fourier, FourierOption, Custom
 from pyautd3.link.ethercrab import EtherCrab, EtherCrabOption, Status
 from pyautd3.link.simulator import Simulator
 
+from trajectory import Trajectory
+from trajectory_engine import generate_trajectory
+
 
 def generate_points(distance):
-    points = []
-    current_point = np.array([random.uniform(0.0, 10.0), random.uniform(0.0, 10.0), 0.0])
-    points.append(center + current_point)
-
-    for _ in range(999):
-        while True:
-                angle = random.uniform(0, 2 * np.pi)
-                next_x = current_point[0] + distance * np.cos(angle)
-                next_y = current_point[1] + distance * np.sin(angle)
-                
-                if 0.0 <= next_x <= 10.0 and 0.0 <= next_y <= 10.0:
-                    current_point = np.array([next_x, next_y, 0.0])
-                    points.append(center + current_point)
-                    break
-    return points
+    """ランダムウォークで1000点の軌道を生成（相対座標と中心を Trajectory にまとめる）"""
+    return Trajectory.from_points(generate_trajectory(distance, 1000), center)
 
 w = AUTD3.DEVICE_WIDTH
 h = AUTD3.DEVICE_HEIGHT
@@ -145,7 +134,7 @@ if __name__ == "__main__":
 
         #     fre = velo / (1000*dist)
         #     g = FociSTM(
-        #             foci=generate_points(dist),
+        #             foci=generate_points(dist).to_foci(),
         #             config=fre * Hz,
         #         )
         #     autd.send((m, g))
@@ -184,7 +173,7 @@ if __name__ == "__main__":
 
                     # --- 4. STMの設定 ---
                     g = FociSTM(
-                        foci=generate_points(dist),
+                        foci=generate_points(dist).to_foci(),
                         config=fre * Hz,
                     )
 
@@ -5,15 +5,29 @@ import random
 import json
 import math
 import os
-import itertools
 import argparse
-from collections import defaultdict
+import time
 from datetime import datetime
 
+from datagram_cache import StimulusDatagramCache, make_foci_stm
+from design_cache import load_participant_design
+from latency_recorder import (
+    PLAY as PLAY_EVENT, PRESS, RELEASE, LatencyRecorder, print_summary as print_latency_summary
+)
+from stimulus_bank import load_bank
+from playback import StimulusPlayback
+from segment_streamer import SEGMENT_FOCI
+from segment_player import SegmentPlayer
+from send_worker import PLAY, STAGE, SendWorker
+from stm_resampler import fit_to_buffer
+from trajectory import Trajectory
+from trajectory_engine import MODES
+from trial_generator import BalancedTrialGenerator, GreedyTrialGenerator
+
 # AUTD3関連のインポート
 from pyautd3 import (
     AUTD3, Controller, FocusOption, Hz, Silencer, Sine, SineOption,
-    EulerAngles, rad, FociSTM, Static
+    EulerAngles, rad, Static
 )
 from pyautd3.link.simulator import Simulator
 from pyautd3.link.ethercrab import EtherCrab, EtherCrabOption, Status
@@ -26,109 +40,28 @@ ARENA_RADIUS = 350
 NODE_RADIUS = 20    # 点の大きさ（操作しやすいよう少し大きくしました）
 ITEMS_PER_TRIAL = 7 # 1回の提示数（アンカー2個 + 通常5個）
 ANCHOR_ITEMS = [0, 17]  # アンカー刺激（スケーリング用）
+DESIGN_MODES = ("greedy", "balanced")  # greedy: 全ペアを1回以上, balanced: 全ペアを coverage 回以上で回数を揃える
+PAIR_COVERAGE = 3  # balanced モードで各ペアを提示する最低回数
+SEND_ERROR_POLL_MS = 100  # 送信スレッドの失敗を確認する間隔
 
 def err_handler(idx: int, status: Status) -> None:
     pass
 
-# --- Greedy法によるトライアル生成クラス ---
-class GreedyTrialGenerator:
-    def __init__(self, num_items, items_per_trial, anchor_items=None):
-        self.num_items = num_items
-        self.items_per_trial = items_per_trial
-        self.anchor_items = set(anchor_items) if anchor_items else set()
-        self.trials = []
-        self._generate()
-
-    def _generate(self):
-        """全ペアを網羅するまでgreedyにリストを作成（アンカーは毎回含む）"""
-        all_items = list(range(self.num_items))
-        non_anchor_items = [i for i in all_items if i not in self.anchor_items]
-        
-        # アンカー同士のペアは毎回出るので除外してカウント
-        all_pairs = list(itertools.combinations(all_items, 2))
-        anchor_pair = tuple(sorted(self.anchor_items)) if len(self.anchor_items) == 2 else None
-        
-        pair_counts = defaultdict(int)
-        
-        print(f"Generating trials for {self.num_items} items, {self.items_per_trial} per trial...")
-        print(f"Anchor items: {self.anchor_items} (included in every trial)")
-        
-        while True:
-            # アンカーペア以外で未カバーのペアを探す
-            missing_pairs = [p for p in all_pairs if pair_counts[p] < 1 and p != anchor_pair]
-            if not missing_pairs:
-                break
-            
-            # 毎回アンカーから開始
-            current_trial_items = set(self.anchor_items)
-            
-            # 不足ペアから1つ選んで核にする（アンカー以外のアイテムを優先）
-            target_pair = random.choice(missing_pairs)
-            for item in target_pair:
-                if item not in self.anchor_items and len(current_trial_items) < self.items_per_trial:
-                    current_trial_items.add(item)
-            
-            # 残り枠をGreedyで埋める
-            while len(current_trial_items) < self.items_per_trial:
-                best_candidate = -1
-                max_new_pairs = -1
-                
-                candidates = [i for i in non_anchor_items if i not in current_trial_items]
-                if not candidates:
-                    break
-                random.shuffle(candidates)
-                
-                for cand in candidates:
-                    new_pairs_count = 0
-                    for existing in current_trial_items:
-                        pair = tuple(sorted((cand, existing)))
-                        if pair_counts[pair] < 1:
-                            new_pairs_count += 1
-                    
-                    if new_pairs_count > max_new_pairs:
-                        max_new_pairs = new_pairs_count
-                        best_candidate = cand
-                
-                if best_candidate != -1:
-                    current_trial_items.add(best_candidate)
-                else:
-                    current_trial_items.add(random.choice(candidates))
-            
-            # 記録
-            trial_list = list(current_trial_items)
-            self.trials.append(trial_list)
-            
-            for p in itertools.combinations(trial_list, 2):
-                pair_counts[tuple(sorted(p))] += 1
-                
-        print(f"Generated {len(self.trials)} trials to cover all pairs.")
-
-# --- 幾何計算用の関数 ---
-def generate_points(distance, center, num_points=1000):
-    """ランダムウォークでnum_points点の軌道を生成"""
-    points = []
-    # ランダムウォークの初期点
-    current_point = np.array([random.uniform(0.0, 10.0), random.uniform(0.0, 10.0), 0.0])
-    points.append(center + current_point)
-    for _ in range(num_points - 1):
-        while True:
-            angle = random.uniform(0, 2 * np.pi)
-            next_x = current_point[0] + distance * np.cos(angle)
-            next_y = current_point[1] + distance * np.sin(angle)
-            # 1cm (10mm) 平方の範囲内に収める
-            if 0.0 <= next_x <= 10.0 and 0.0 <= next_y <= 10.0:
-                current_point = np.array([next_x, next_y, 0.0])
-                points.append(center + current_point)
-                break
-    return points
-
+PLAYBACK_MODES = ("resample", "stream")  # resample: バッファに収まる点数に作り直す, stream: セグメントを入れ替えて全点を再生
+DATAGRAM_CACHE_MODES = ("eager", "lazy")  # eager: 起動時に別スレッドで全刺激を作る, lazy: 初めて提示するときに作る
 
 # --- GUIアプリケーションクラス ---
 class TactileMapApp:
-    def __init__(self, root, autd_controller, participant_name=""):
+    def __init__(self, root, autd_controller, participant_name="", trajectory_mode=None, playback="resample",
+                 design="greedy", coverage=PAIR_COVERAGE, datagram_cache="eager", cache_size=None,
+                 segment_preload=False):
         self.root = root
         self.autd = autd_controller
         self.participant_name = participant_name
+        self.trajectory_mode = trajectory_mode  # Noneならバンクのmodeをそのまま使う。指定した場合はバンクのmodeと一致している必要がある
+        self.playback = playback
+        self.design = design
+        self.coverage = coverage
         self.root.title("Tactile Spatial Arrangement Task (Multi-arrangement)")
 
         # AUTD座標の中心設定
@@ -136,10 +69,37 @@ class TactileMapApp:
         
         # 1. 刺激パラメータの生成 (N=18)
         self.all_params = self._generate_stimuli_params()
+        # FociSTM のバッファに合わせて作り直した軌道（データグラムを作るときに作る）
+        self.stm_plans = {}
+        # 刺激ごとの (変調, STM)。クリック時には作らず、ここから取り出して送るだけにする
+        self.datagrams = StimulusDatagramCache(self._build_datagram, capacity=cache_size)
+        # 押してから出力までの遅れと送信の失敗を記録する
+        self.latency = LatencyRecorder()
+        # 次に押されそうな刺激を待機中のセグメントに書いておき、押したときは切り替えるだけにする
+        self.player = SegmentPlayer() if segment_preload else None
+        # 送信スレッドで行う再生・停止・先読み（benchmark_playback_paths.py と同じ処理）
+        self.output = StimulusPlayback(self.datagrams.get, self.latency, self.player, self.all_params)
+        # AUTD への送信は専用スレッドで行い、GUI からは「再生」「停止」を渡すだけにする
+        self.sender = SendWorker(self.autd, self.output.play, self.output.stop,
+                                 stage=self.output.stage if self.player else None)
         
-        # 2. トライアルリストの生成
-        generator = GreedyTrialGenerator(num_items=len(self.all_params), items_per_trial=ITEMS_PER_TRIAL, anchor_items=ANCHOR_ITEMS)
-        self.trial_list = generator.trials
+        # 2. トライアルリストの生成（事前に作った参加者のデザインがあればそれを使う）
+        self.design_id = None
+        cached = None
+        if self.participant_name:
+            cached = load_participant_design(len(self.all_params), ITEMS_PER_TRIAL, ANCHOR_ITEMS, self.participant_name,
+                                             design=self.design, coverage=self.coverage)
+        if cached is not None:
+            print(f"Loaded design {cached['design_id']} (participant {cached['participant']} of set {cached['set_id']})")
+            self.design_id = cached["design_id"]
+            self.trial_list = cached["trials"]
+        elif self.design == "balanced":
+            generator = BalancedTrialGenerator(num_items=len(self.all_params), items_per_trial=ITEMS_PER_TRIAL,
+                                               coverage=self.coverage, anchor_items=ANCHOR_ITEMS)
+            self.trial_list = generator.trials
+        else:
+            generator = GreedyTrialGenerator(num_items=len(self.all_params), items_per_trial=ITEMS_PER_TRIAL, anchor_items=ANCHOR_ITEMS)
+            self.trial_list = generator.trials
         self.current_trial_idx = 0
         
         # 結果保存用（行ったり来たりできるよう、あらかじめ枠を作っておく）
@@ -154,52 +114,39 @@ class TactileMapApp:
         # 最初のトライアルを開始
         self.load_trial()
 
+        if datagram_cache == "eager":
+            # 最初のトライアルの刺激から順に作る
+            self.datagrams.preload(list(dict.fromkeys([*self.trial_list[0], *self.bank.ids])))
+        self.root.after(SEND_ERROR_POLL_MS, self._report_send_errors)
+
     def _generate_stimuli_params(self):
-        """18パターンの刺激パラメータを生成（シード値から軌道を再現）"""
-        # シード値ファイルを読み込む
-        seeds_file = os.path.join(os.path.dirname(__file__), "stimuli_seeds.json")
-        
-        if not os.path.exists(seeds_file):
-            raise FileNotFoundError(
-                f"stimuli_seeds.json not found at {seeds_file}. "
-                "Please run generate_seeds.py first."
+        """18パターンの刺激パラメータを刺激バンクから読み込む（軌道は mmap したファイルのビュー）"""
+        self.bank = load_bank()
+        print(f"Loaded stimulus bank {self.bank.path} (bank_id={self.bank.bank_id})")
+        if self.bank.is_stale():
+            print("Warning: stimuli_seeds.json has changed since the stimulus bank was built. "
+                  "Run stimulus_bank.py to rebuild it.")
+
+        # どのスクリプトも同じ刺激を使うよう、軌道のmodeはバンク作成時に決める
+        bank_mode = self.bank.sampling["mode"]
+        if self.trajectory_mode and self.trajectory_mode != bank_mode:
+            raise ValueError(
+                f"Stimulus bank was built with mode '{bank_mode}'. "
+                f"Run 'stimulus_bank.py --mode {self.trajectory_mode}' to rebuild it."
             )
-        
-        with open(seeds_file, "r") as f:
-            seeds_data = json.load(f)
-        print(f"Loaded seeds from {seeds_file}")
-        
-        distances = [0.05, 4.0] 
-        velocities = [10, 100, 1000]
-        am_freqs = [0, 20, 100]
-        
-        print("Generating stimuli with pre-computed trajectories...")
+
+        # トライアル順・初期配置が従来（起動時に全軌道を生成していた頃）と同じになるようにする
+        self.bank.restore_random_state()
+
+        # ストリームを使うバンクでは、初期配置の揺らぎも刺激ごとの Generator から引く
+        self.layout_rngs = {stim_id: self.bank.layout_rng(stim_id) for stim_id in self.bank.ids}
+
         params = []
-        idx = 0
-        for dist in distances:
-            for velo in velocities:
-                for am in am_freqs:
-                    freq = velo / (1000 * dist) if dist > 1.0 else velo / (100000 * dist)
-                    num_points = 100000 if dist < 1.0 else 1000
-                    
-                    # シード値から軌道を再生成
-                    seed = seeds_data["stimuli"][idx]["seed"]
-                    random.seed(seed)
-                    np.random.seed(seed)
-                    trajectory = generate_points(dist, self.center, num_points)
-                    print(f"  Stimulus {idx}: Using seed {seed}")
-                    
-                    params.append({
-                        "id": idx,
-                        "dist": dist,
-                        "velo": velo,
-                        "am_freq": am,
-                        "stm_freq": freq,
-                        "color": "#{:06x}".format(random.randint(0, 0xFFFFFF)),
-                        "trajectory": trajectory
-                    })
-                    idx += 1
-        print(f"Generated {len(params)} stimuli with valid trajectories.")
+        for stim_id in self.bank.ids:
+            param = self.bank.params(stim_id)
+            param["trajectory"] = Trajectory(self.bank.trajectory(stim_id), self.center)
+            params.append(param)
+        print(f"Loaded {len(params)} stimuli (mode={bank_mode}).")
         return params
 
     def _create_widgets(self):
@@ -247,6 +194,7 @@ class TactileMapApp:
         self.canvas.tag_bind("token", "<ButtonPress-1>", self.on_press)
         self.canvas.tag_bind("token", "<ButtonRelease-1>", self.on_release)
         self.canvas.tag_bind("token", "<B1-Motion>", self.on_drag)
+        self.canvas.tag_bind("token", "<Enter>", self.on_hover)
 
     def load_trial(self):
         """現在のトライアルIDに基づいてキャンバスをリセット・再描画"""
@@ -299,7 +247,9 @@ class TactileMapApp:
             if item_idx in saved_positions:
                 x, y = saved_positions[item_idx]
             else:
-                angle = i * angle_step + random.uniform(-0.1, 0.1)
+                layout_rng = self.layout_rngs.get(item_idx)
+                jitter = layout_rng.uniform(-0.1, 0.1) if layout_rng else random.uniform(-0.1, 0.1)
+                angle = i * angle_step + jitter
                 # アリーナの境界付近に配置
                 x = cx + init_radius * math.cos(angle)
                 y = cy + init_radius * math.sin(angle)
@@ -341,7 +291,7 @@ class TactileMapApp:
                     "id": item["id"],
                     "x": cx,
                     "y": cy,
-                    "params": self.all_params[item["id"]]
+                    "params": {k: v for k, v in self.all_params[item["id"]].items() if k != "trajectory"}
                 })
         # インデックスを指定して保存（上書き可能にする）
         self.results[self.current_trial_idx] = trial_data
@@ -366,6 +316,7 @@ class TactileMapApp:
 
     # --- イベントハンドラ（通信エラー対策済み） ---
     def on_press(self, event):
+        press_time = time.perf_counter_ns()
         item = self.canvas.find_closest(event.x, event.y)[0]
         tags = self.canvas.gettags(item)
         
@@ -377,11 +328,19 @@ class TactileMapApp:
                 break
         
         if stim_id != -1:
+            self.latency.record(PRESS, stim_id, press_time)
             self.play_stimulus(stim_id)
             self.drag_data["item"] = item
             self.drag_data["x"] = event.x
             self.drag_data["y"] = event.y
 
+    def on_hover(self, event):
+        """カーソルが乗ったトークンの刺激を待機中のセグメントに書いておく"""
+        for tag in self.canvas.gettags("current"):
+            if tag.startswith("stim_"):
+                self.sender.post_stage(int(tag.split("_")[1]))
+                break
+
     def on_drag(self, event):
         """ドラッグ中：円の外に出ないように制限する"""
         item = self.drag_data["item"]
@@ -443,32 +402,57 @@ class TactileMapApp:
             self.drag_data["y"] = event.y
 
     def on_release(self, event):
+        self.latency.record(RELEASE)
         self.drag_data["item"] = None
-        try:
-            self.autd.send(Static(intensity=0))
-        except Exception as e:
-            print(f"Warning (Stop): Communication failed. Ignored. ({e})")
+        self.sender.post_stop()
 
     def play_stimulus(self, stim_id):
+        self.latency.record(PLAY_EVENT, stim_id)
         params = self.all_params[stim_id]
         print(f"Playing ID:{stim_id} | Dist:{params['dist']}, Velo:{params['velo']}, AM:{params['am_freq']}")
+        self.sender.post_play(stim_id)
+
+    def _report_send_errors(self):
+        """送信スレッドで起きた通信エラーを表示する（実験は続ける）"""
+        for (kind, stim_id), e in self.sender.poll_errors():
+            if kind == PLAY:
+                print(f"Warning (Play): Communication failed. Ignored. (ID:{stim_id}, {e})")
+            elif kind == STAGE:
+                print(f"Warning (Stage): Communication failed. Ignored. (ID:{stim_id}, {e})")
+            else:
+                print(f"Warning (Stop): Communication failed. Ignored. ({e})")
+        self.root.after(SEND_ERROR_POLL_MS, self._report_send_errors)
 
+    def _build_datagram(self, stim_id):
+        """刺激の (変調, STM) を作る。stream モードで再生する刺激は STM の代わりに None"""
+        params = self.all_params[stim_id]
         if params['am_freq'] == 0:
             m = Static(intensity=255)
         else:
             m = Sine(freq=params['am_freq'] * Hz, option=SineOption(intensity=255))
 
-        g = FociSTM(
-            foci=params['trajectory'],  # 事前生成した軌道を使用（再現性確保）
-            config=params['stm_freq'] * Hz,
-        )
+        if self.playback == "stream" and len(params['trajectory']) > SEGMENT_FOCI:
+            return m, None
+
+        # 事前生成した軌道をSTMバッファに収まる点数にし、速度 velo を保つ分周で再生する
+        plan = self._stm_plan(stim_id)
+        return m, make_foci_stm(plan.trajectory.to_foci(), plan.sampling_config())
 
-        try:
-            self.autd.send((m, g))
-        except Exception as e:
-             print(f"Warning (Play): Communication failed. Ignored. ({e})")
+    def _stm_plan(self, stim_id):
+        if stim_id not in self.stm_plans:
+            params = self.all_params[stim_id]
+            plan = fit_to_buffer(params['trajectory'], params['velo'])
+            print(f"  STM plan ID:{stim_id} | {plan.original_points} -> {len(plan.trajectory)} points, "
+                  f"divide={plan.divide}, speed={plan.speed:.3f}mm/s (error {plan.speed_error:+.2e})")
+            self.stm_plans[stim_id] = plan
+        return self.stm_plans[stim_id]
 
     def save_and_quit(self):
+        # 残っている送信を済ませてから送信スレッドを止める
+        self.sender.close()
+        self.output.stop_streaming()
+        if self.player is not None:
+            self.player.print_summary()
         # ファイル名に被験者名を含める
         if self.participant_name:
             filename = f"experiment_result_{self.participant_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
@@ -484,6 +468,11 @@ class TactileMapApp:
         os.makedirs(save_dir, exist_ok=True)
         
         filepath = os.path.join(save_dir, filename)
+        # 遅れの記録は隣の latency ディレクトリに latency_<結果ファイルと同じ名前の残り> で保存する
+        # （raw_results の *.json は解析スクリプトがすべて結果ファイルとして読むので、同じ場所には置かない）
+        latency_dir = os.path.join(os.path.dirname(save_dir), "latency")
+        os.makedirs(latency_dir, exist_ok=True)
+        latency_path = os.path.join(latency_dir, filename.replace("experiment_result_", "latency_", 1))
         
         # Noneを除外（万が一未実施のデータがあっても保存時にエラーにならないように）
         valid_results = [r for r in self.results if r is not None]
@@ -492,13 +481,21 @@ class TactileMapApp:
             "config": {
                 "num_items_total": len(self.all_params),
                 "items_per_trial": ITEMS_PER_TRIAL,
-                "total_trials": len(self.trial_list)
+                "total_trials": len(self.trial_list),
+                "design": self.design,
+                "design_id": self.design_id,
+                "pair_coverage": self.coverage if self.design == "balanced" else 1,
+                "stimulus_bank": self.bank.bank_id,
+                "stm_plans": {stim_id: plan.summary() for stim_id, plan in sorted(self.stm_plans.items())},
+                "segment_preload": self.player.summary() if self.player is not None else None,
+                "latency_file": os.path.relpath(latency_path, save_dir)
             },
             "trials": valid_results
         }
         
         with open(filepath, "w") as f:
             json.dump(final_export, f, indent=4)
+        print_latency_summary(self.latency.save(latency_path))
         
         messagebox.showinfo("Done", f"Experiment finished!\nSaved to {filepath}")
         self.root.destroy()
@@ -508,7 +505,22 @@ class TactileMapApp:
 if __name__ == "__main__":
     # コマンドライン引数の解析
     parser = argparse.ArgumentParser(description="Tactile Spatial Arrangement Task")
-    parser.add_argument("--name", type=str, default="", help="Participant name (included in output filename)")
+    parser.add_argument("--name", type=str, default="",
+                        help="Participant name (included in output filename; loads the pre-generated design from design_cache)")
+    parser.add_argument("--trajectory-mode", choices=MODES, default=None,
+                        help="Expected trajectory mode (must match the mode the stimulus bank was built with)")
+    parser.add_argument("--playback", choices=PLAYBACK_MODES, default="resample",
+                        help="resample: fit long trajectories into one STM buffer, stream: alternate STM segments")
+    parser.add_argument("--design", choices=DESIGN_MODES, default="greedy",
+                        help="greedy: cover every pair once, balanced: cover every pair --coverage times with even counts")
+    parser.add_argument("--coverage", type=int, default=PAIR_COVERAGE,
+                        help="Minimum presentations per pair in the balanced design")
+    parser.add_argument("--datagram-cache", choices=DATAGRAM_CACHE_MODES, default="eager",
+                        help="eager: build every stimulus in a background thread at startup, lazy: build on first press")
+    parser.add_argument("--cache-size", type=int, default=None,
+                        help="Keep at most this many stimuli (least recently used are dropped); default keeps all")
+    parser.add_argument("--segment-preload", action="store_true",
+                        help="Stage the hovered/recent stimulus in the idle STM segment so a press only swaps segments")
     args = parser.parse_args()
     
     # --- デバイス構成 (元のコードの設定を使用) ---
@@ -542,7 +554,10 @@ if __name__ == "__main__":
             autd.send(Silencer.disable())
             
             root = tk.Tk()
-            app = TactileMapApp(root, autd, participant_name=args.name)
+            app = TactileMapApp(root, autd, participant_name=args.name, trajectory_mode=args.trajectory_mode,
+                                playback=args.playback, design=args.design, coverage=args.coverage,
+                                datagram_cache=args.datagram_cache, cache_size=args.cache_size,
+                                segment_preload=args.segment_preload)
             root.mainloop()
             
     except Exception as e:
@@ -4,10 +4,11 @@ import numpy as np
 import random
 import json
 import math
-import itertools
-from collections import defaultdict
 from datetime import datetime
 
+from trajectory_engine import generate_trajectory
+from trial_generator import GreedyTrialGenerator
+
 # AUTD3関連のインポート
 from pyautd3 import (
     AUTD3, Controller, FocusOption, Hz, Silencer, Sine, SineOption,
@@ -23,86 +24,14 @@ CANVAS_SIZE = 800   # 描画領域のサイズ (ピクセル)
 ARENA_RADIUS = 350
 NODE_RADIUS = 20    # 点の大きさ
 ITEMS_PER_TRIAL = 5 # ★変更: 1回の提示数を5個に
+TRAJECTORY_MODE = "compat"  # 軌道の生成方法 ("arc" にすると棄却なしで円弧から直接サンプリング)
 
 def err_handler(idx: int, status: Status) -> None:
     pass
 
-# --- Greedy法によるトライアル生成クラス ---
-class GreedyTrialGenerator:
-    def __init__(self, num_items, items_per_trial):
-        self.num_items = num_items
-        self.items_per_trial = items_per_trial
-        self.trials = []
-        self._generate()
-
-    def _generate(self):
-        """全ペアを網羅するまでgreedyにリストを作成"""
-        all_items = list(range(self.num_items))
-        all_pairs = list(itertools.combinations(all_items, 2))
-        pair_counts = defaultdict(int)
-        
-        print(f"Generating trials for {self.num_items} items, {self.items_per_trial} per trial...")
-        
-        while True:
-            # まだ出ていないペアを探す
-            missing_pairs = [p for p in all_pairs if pair_counts[p] < 1]
-            if not missing_pairs:
-                break
-            
-            # 1. 不足ペアから1つ選んで核にする
-            target_pair = random.choice(missing_pairs)
-            current_trial_items = set(target_pair)
-            
-            # 2. 残りの枠を「未評価ペアを最も多く含むアイテム」で埋める
-            while len(current_trial_items) < self.items_per_trial:
-                best_candidate = -1
-                max_new_pairs = -1
-                
-                candidates = [i for i in all_items if i not in current_trial_items]
-                random.shuffle(candidates)
-                
-                for cand in candidates:
-                    new_pairs_count = 0
-                    for existing in current_trial_items:
-                        pair = tuple(sorted((cand, existing)))
-                        if pair_counts[pair] < 1:
-                            new_pairs_count += 1
-                    
-                    if new_pairs_count > max_new_pairs:
-                        max_new_pairs = new_pairs_count
-                        best_candidate = cand
-                
-                if best_candidate != -1:
-                    current_trial_items.add(best_candidate)
-                else:
-                    current_trial_items.add(random.choice(candidates))
-            
-            # 記録
-            trial_list = list(current_trial_items)
-            self.trials.append(trial_list)
-            
-            for p in itertools.combinations(trial_list, 2):
-                pair_counts[tuple(sorted(p))] += 1
-                
-        print(f"Generated {len(self.trials)} trials to cover all pairs.")
-
 # --- 幾何計算用の関数 ---
 def generate_points(distance, center):
-    points = []
-    # ランダムウォークの初期点
-    current_point = np.array([random.uniform(0.0, 10.0), random.uniform(0.0, 10.0), 0.0])
-    points.append(center + current_point)
-    for _ in range(999): # 1000点分
-        while True:
-            angle = random.uniform(0, 2 * np.pi)
-            next_x = current_point[0] + distance * np.cos(angle)
-            next_y = current_point[1] + distance * np.sin(angle)
-            # 1cm (10mm) 平方の範囲内に収める
-            if 0.0 <= next_x <= 10.0 and 0.0 <= next_y <= 10.0:
-                current_point = np.array([next_x, next_y, 0.0])
-                points.append(center + current_point)
-                break
-    return points
+    return generate_trajectory(distance, 1000, center=center, mode=TRAJECTORY_MODE)  # 1000点分
 
 # --- GUIアプリケーションクラス ---
 class TactileMapApp:
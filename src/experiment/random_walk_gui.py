@@ -14,6 +14,9 @@ from pyautd3 import (
 from pyautd3.link.simulator import Simulator
 from pyautd3.link.ethercrab import EtherCrab, EtherCrabOption, Status
 
+from trajectory import Trajectory
+from trajectory_engine import generate_trajectory
+
 # --- 設定値 ---
 w = AUTD3.DEVICE_WIDTH
 h = AUTD3.DEVICE_HEIGHT
@@ -26,19 +29,8 @@ def err_handler(idx: int, status: Status) -> None:
 
 # --- 幾何計算用の関数 (既存コードより) ---
 def generate_points(distance, center):
-    points = []
-    current_point = np.array([random.uniform(0.0, 10.0), random.uniform(0.0, 10.0), 0.0])
-    points.append(center + current_point)
-    for _ in range(999):
-        while True:
-            angle = random.uniform(0, 2 * np.pi)
-            next_x = current_point[0] + distance * np.cos(angle)
-            next_y = current_point[1] + distance * np.sin(angle)
-            if 0.0 <= next_x <= 10.0 and 0.0 <= next_y <= 10.0:
-                current_point = np.array([next_x, next_y, 0.0])
-                points.append(center + current_point)
-                break
-    return points
+    """ランダムウォークで1000点の軌道を生成（相対座標と中心を Trajectory にまとめる）"""
+    return Trajectory.from_points(generate_trajectory(distance, 1000), center)
 
 # --- GUIアプリケーションクラス ---
 class TactileMapApp:
@@ -186,7 +178,7 @@ class TactileMapApp:
 
         # STMの設定
         g = FociSTM(
-            foci=generate_points(params['dist'], self.center),
+            foci=generate_points(params['dist'], self.center).to_foci(),
             config=params['stm_freq'] * Hz,
         )
 
@@ -4,10 +4,14 @@ import numpy as np
 import random
 import json
 import math
-import itertools
-from collections import defaultdict
+import time
+import argparse
 from datetime import datetime
 
+from adaptive_design import TARGET_EVIDENCE, LiftTheWeakestSelector
+from trajectory_engine import generate_trajectory
+from trial_generator import GreedyTrialGenerator
+
 # AUTD3関連のインポート
 from pyautd3 import (
     AUTD3, Controller, FocusOption, Hz, Silencer, Sine, SineOption,
@@ -22,93 +26,23 @@ h = AUTD3.DEVICE_HEIGHT
 CANVAS_SIZE = 800   # 描画領域のサイズ (ピクセル)
 NODE_RADIUS = 20    # 点の大きさ（操作しやすいよう少し大きくしました）
 ITEMS_PER_TRIAL = 7 # 1回の提示数
+TRAJECTORY_MODE = "compat"  # 軌道の生成方法 ("arc" にすると棄却なしで円弧から直接サンプリング)
+DESIGN_MODES = ("fixed", "adaptive")  # fixed: 開始前に全ペアを網羅するリストを作る, adaptive: 配置結果から次のトライアルを選ぶ
 
 def err_handler(idx: int, status: Status) -> None:
     pass
 
-# --- Greedy法によるトライアル生成クラス ---
-class GreedyTrialGenerator:
-    def __init__(self, num_items, items_per_trial):
-        self.num_items = num_items
-        self.items_per_trial = items_per_trial
-        self.trials = []
-        self._generate()
-
-    def _generate(self):
-        """全ペアを網羅するまでgreedyにリストを作成"""
-        all_items = list(range(self.num_items))
-        all_pairs = list(itertools.combinations(all_items, 2))
-        pair_counts = defaultdict(int)
-        
-        print(f"Generating trials for {self.num_items} items, {self.items_per_trial} per trial...")
-        
-        while True:
-            # まだ出ていないペアを探す
-            missing_pairs = [p for p in all_pairs if pair_counts[p] < 1]
-            if not missing_pairs:
-                break
-            
-            # 1. 不足ペアから1つ選んで核にする
-            target_pair = random.choice(missing_pairs)
-            current_trial_items = set(target_pair)
-            
-            # 2. 残りの枠を「未評価ペアを最も多く含むアイテム」で埋める
-            while len(current_trial_items) < self.items_per_trial:
-                best_candidate = -1
-                max_new_pairs = -1
-                
-                candidates = [i for i in all_items if i not in current_trial_items]
-                random.shuffle(candidates)
-                
-                for cand in candidates:
-                    new_pairs_count = 0
-                    for existing in current_trial_items:
-                        pair = tuple(sorted((cand, existing)))
-                        if pair_counts[pair] < 1:
-                            new_pairs_count += 1
-                    
-                    if new_pairs_count > max_new_pairs:
-                        max_new_pairs = new_pairs_count
-                        best_candidate = cand
-                
-                if best_candidate != -1:
-                    current_trial_items.add(best_candidate)
-                else:
-                    current_trial_items.add(random.choice(candidates))
-            
-            # 記録
-            trial_list = list(current_trial_items)
-            self.trials.append(trial_list)
-            
-            for p in itertools.combinations(trial_list, 2):
-                pair_counts[tuple(sorted(p))] += 1
-                
-        print(f"Generated {len(self.trials)} trials to cover all pairs.")
-
 # --- 幾何計算用の関数 ---
 def generate_points(distance, center):
-    points = []
-    # ランダムウォークの初期点
-    current_point = np.array([random.uniform(0.0, 10.0), random.uniform(0.0, 10.0), 0.0])
-    points.append(center + current_point)
-    for _ in range(999): # 1000点分
-        while True:
-            angle = random.uniform(0, 2 * np.pi)
-            next_x = current_point[0] + distance * np.cos(angle)
-            next_y = current_point[1] + distance * np.sin(angle)
-            # 1cm (10mm) 平方の範囲内に収める
-            if 0.0 <= next_x <= 10.0 and 0.0 <= next_y <= 10.0:
-                current_point = np.array([next_x, next_y, 0.0])
-                points.append(center + current_point)
-                break
-    return points
+    return generate_trajectory(distance, 1000, center=center, mode=TRAJECTORY_MODE)  # 1000点分
 
 # --- GUIアプリケーションクラス ---
 # --- GUIアプリケーションクラス ---
 class TactileMapApp:
-    def __init__(self, root, autd_controller):
+    def __init__(self, root, autd_controller, design="fixed", target_evidence=TARGET_EVIDENCE):
         self.root = root
         self.autd = autd_controller
+        self.design = design
         self.root.title("Tactile Spatial Arrangement Task (Multi-arrangement)")
 
         # AUTD座標の中心設定
@@ -117,9 +51,14 @@ class TactileMapApp:
         # 1. 刺激パラメータの生成 (N=18)
         self.all_params = self._generate_stimuli_params()
         
-        # 2. トライアルリストの生成
-        generator = GreedyTrialGenerator(num_items=len(self.all_params), items_per_trial=ITEMS_PER_TRIAL)
-        self.trial_list = generator.trials
+        # 2. トライアルリストの生成（adaptive では1トライアルずつ選んで追加していく）
+        self.selector = None
+        if self.design == "adaptive":
+            self.selector = LiftTheWeakestSelector(len(self.all_params), ITEMS_PER_TRIAL, target_evidence=target_evidence)
+            self.trial_list = [self.selector.select()]
+        else:
+            generator = GreedyTrialGenerator(num_items=len(self.all_params), items_per_trial=ITEMS_PER_TRIAL)
+            self.trial_list = generator.trials
         self.current_trial_idx = 0
         
         # 結果保存用（行ったり来たりできるよう、あらかじめ枠を作っておく）
@@ -193,10 +132,14 @@ class TactileMapApp:
         self.canvas.delete("all")
         
         # 進捗表示更新
-        self.lbl_progress.config(text=f"Trial: {self.current_trial_idx + 1} / {len(self.trial_list)}")
+        if self.selector is not None:
+            self.lbl_progress.config(text=f"Trial: {self.current_trial_idx + 1} "
+                                          f"(min evidence {self.selector.min_evidence:.2f} / {self.selector.target_evidence})")
+        else:
+            self.lbl_progress.config(text=f"Trial: {self.current_trial_idx + 1} / {len(self.trial_list)}")
         
-        # ボタンの制御
-        if self.current_trial_idx == len(self.trial_list) - 1:
+        # ボタンの制御（adaptive では終わるかどうかは配置を見てから決まる）
+        if self.current_trial_idx == len(self.trial_list) - 1 and self.selector is None:
             self.btn_next.config(text="Finish & Save", bg="orange")
         else:
             self.btn_next.config(text="Next Trial", bg="lightblue")
@@ -287,9 +230,24 @@ class TactileMapApp:
         if self.current_trial_idx < len(self.trial_list) - 1:
             self.current_trial_idx += 1
             self.load_trial()
+        elif self.selector is not None and self._select_next_trial():
+            self.current_trial_idx += 1
+            self.load_trial()
         else:
             self.save_and_quit()
 
+    def _select_next_trial(self):
+        """これまでの配置から証拠を更新し、目標に達していなければ次のトライアルを追加する"""
+        start_time = time.perf_counter()
+        self.selector.update(self.results)
+        if self.selector.done:
+            return False
+        self.trial_list.append(self.selector.select())
+        self.results.append(None)
+        print(f"Adaptive selection: {(time.perf_counter() - start_time) * 1000:.1f} ms "
+              f"(min evidence {self.selector.min_evidence:.3f})")
+        return True
+
     def prev_trial(self):
         """前のトライアルへ（追加）"""
         self._save_current_screen() # 戻る前にも念のため現状を保存しておく（戻ってまた進んだときに維持するため）
@@ -361,14 +319,20 @@ class TactileMapApp:
         # Noneを除外（万が一未実施のデータがあっても保存時にエラーにならないように）
         valid_results = [r for r in self.results if r is not None]
 
+        if self.selector is not None:
+            self.selector.update(self.results)
         final_export = {
             "config": {
                 "num_items_total": len(self.all_params),
                 "items_per_trial": ITEMS_PER_TRIAL,
-                "total_trials": len(self.trial_list)
+                "total_trials": len(self.trial_list),
+                "design": self.design
             },
             "trials": valid_results
         }
+        if self.selector is not None:
+            final_export["config"]["target_evidence"] = self.selector.target_evidence
+            final_export["config"]["min_evidence"] = self.selector.min_evidence
         
         with open(filename, "w") as f:
             json.dump(final_export, f, indent=4)
@@ -379,6 +343,13 @@ class TactileMapApp:
 
 # --- メイン処理 ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tactile Spatial Arrangement Task (Multi-arrangement)")
+    parser.add_argument("--design", choices=DESIGN_MODES, default="fixed",
+                        help="fixed: pair-covering list made up front, adaptive: lift-the-weakest selection after each trial")
+    parser.add_argument("--target-evidence", type=float, default=TARGET_EVIDENCE,
+                        help="Adaptive design stops when every pair reaches this evidence")
+    args = parser.parse_args()
+
     # --- デバイス構成 (元のコードの設定を使用) ---
     # ※動作確認用: Simulator
     # link = Simulator("127.0.0.1:8080")
@@ -410,7 +381,7 @@ if __name__ == "__main__":
             autd.send(Silencer.disable())
             
             root = tk.Tk()
-            app = TactileMapApp(root, autd)
+            app = TactileMapApp(root, autd, design=args.design, target_evidence=args.target_evidence)
             root.mainloop()
             
     except Exception as e:
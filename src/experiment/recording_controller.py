@@ -0,0 +1,222 @@
+"""
+実機の代わりに send() されたデータグラムを記録するコントローラ
+
+gui_test.py の DummyAUTD は何もしないので、再生のタイミングを確かめられなかった。
+RecordingController は TactileMapApp などと同じ send() を受け取り、
+データグラムの種類・セグメント・大きさの目安（制御点数・変調のサンプル数）・時刻を記録する。
+FociSTM のセグメント切り替え (WithSegment / WithFiniteLoop) は時刻から再生状態を模擬し、
+出力が止まった区間（前のセグメントが終わってから次が始まるまで）を gap として数える。
+
+14台の実機 (EtherCrab) がなくても再生経路（キャッシュ・送信スレッド・セグメント先読み）を比べられるよう、
+送信の遅れは「1回あたり latency + 制御点1つあたり latency_per_focus + 0〜jitter の一様乱数」で模擬し、
+failure_rate の確率（または fail_every 回に1回）で AUTDError を投げる。
+"""
+
+import math
+import random
+import threading
+import time
+
+import numpy as np
+from pyautd3 import FociSTM, Sine, Static, SwapSegmentFociSTM, WithFiniteLoop, WithSegment
+from pyautd3.autd_error import AUTDError
+from pyautd3.native_methods.autd3capi_driver import TransitionModeTag
+
+STATIC_SAMPLES = 2  # Static は同じ強度の2サンプル
+
+
+def modulation_samples(modulation):
+    """変調のサンプル数の目安（わからない変調は None）"""
+    if isinstance(modulation, Static):
+        return STATIC_SAMPLES
+    if isinstance(modulation, Sine):
+        rate = int(modulation.option.sampling_config.freq().hz())
+        freq = modulation.freq.hz()
+        if isinstance(freq, int) and freq > 0:
+            return rate // math.gcd(rate, freq)
+    return None
+
+
+class SendRecord:
+    """1回の send() で送られたデータグラム1つ分の記録"""
+
+    __slots__ = ("kind", "segment", "transition", "loop_count", "num_foci", "sample_rate", "mod_samples",
+                 "start", "end", "failed")
+
+    def __init__(self, kind, segment, transition, loop_count, num_foci, sample_rate, mod_samples, start, end,
+                 failed=False):
+        self.kind = kind
+        self.segment = segment
+        self.transition = transition
+        self.loop_count = loop_count
+        self.num_foci = num_foci
+        self.sample_rate = sample_rate
+        self.mod_samples = mod_samples
+        self.start = start
+        self.end = end
+        self.failed = failed
+
+    @property
+    def loop_duration(self):
+        """FociSTM を1周するのにかかる時間 (s)"""
+        return self.num_foci / self.sample_rate if self.num_foci else 0.0
+
+
+def _unwrap(datagram):
+    if isinstance(datagram, (WithSegment, WithFiniteLoop)):
+        return datagram.inner
+    return datagram
+
+
+# セグメントと切り替え方は公開された getter がないので属性を直接読む。
+# 名前は pyautd3 36.0.2 / 37.0.1 で確認したもの（WithSegment は transitiom_mode という綴り、
+# SwapSegmentFociSTM は _segment / _transition_mode）。見つからなければ None として記録だけ続ける。
+_SEGMENT_ATTRS = ("segment", "_segment")
+_TRANSITION_ATTRS = ("transition_mode", "transitiom_mode", "_transition_mode")
+
+
+def _first_attr(obj, names):
+    for name in names:
+        value = getattr(obj, name, None)
+        if value is not None:
+            return value
+    return None
+
+
+def _describe(datagram, start, end, failed=False):
+    segment = transition = loop_count = None
+    inner = _unwrap(datagram)
+    if inner is not datagram or isinstance(inner, SwapSegmentFociSTM):
+        value = _first_attr(datagram, _SEGMENT_ATTRS)
+        segment = None if value is None else int(value)
+        mode = _first_attr(datagram, _TRANSITION_ATTRS)
+        tag = getattr(mode, "tag", None)
+        transition = None if tag is None else TransitionModeTag(tag).name
+        loop_count = getattr(datagram, "loop_count", None)
+    num_foci = sample_rate = None
+    if isinstance(inner, FociSTM):
+        num_foci = len(inner.foci)
+        sample_rate = inner.sampling_config().freq().hz()
+    return SendRecord(type(inner).__name__, segment, transition, loop_count, num_foci, sample_rate,
+                      modulation_samples(inner), start, end, failed)
+
+
+class RecordingController:
+    """send() を記録し、FociSTM のセグメント再生を時刻で模擬する代替コントローラ
+
+    1回の send() は latency + latency_per_focus * 制御点数 + uniform(0, jitter) 秒ブロックする。
+    failure_rate の確率、または fail_every 回に1回、待ったあとで AUTDError を投げる（記録には failed として残る）。
+    """
+
+    def __init__(self, latency=0.0, latency_per_focus=0.0, jitter=0.0, failure_rate=0.0, fail_every=None,
+                 seed=None):
+        self.latency = latency
+        self.latency_per_focus = latency_per_focus
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.fail_every = fail_every
+        self.rng = random.Random(seed)
+        self.records = []
+        self.sends = 0
+        self.failures = 0
+        self.timeline = []  # (segment, 開始時刻, 終了時刻 or None(無限ループ), 1周の時間)
+        self.gaps = []  # (開始時刻, 長さ)
+        self.overwrites = 0  # 再生中のセグメントを書き換えた回数
+        self._written = {}  # segment -> 書き込んである STM の1周の時間（SwapSegmentFociSTM 用）
+        self._lock = threading.Lock()
+
+    def _should_fail(self, count):
+        if self.fail_every and count % self.fail_every == 0:
+            return True
+        return self.failure_rate > 0 and self.rng.random() < self.failure_rate
+
+    def send(self, datagram):
+        start = time.perf_counter()
+        items = datagram if isinstance(datagram, tuple) else (datagram,)
+        with self._lock:
+            self.sends += 1
+            count = self.sends
+            failed = self._should_fail(count)
+            jitter = self.rng.uniform(0.0, self.jitter) if self.jitter > 0 else 0.0
+        num_foci = sum(len(inner.foci) for inner in map(_unwrap, items) if isinstance(inner, FociSTM))
+        delay = self.latency + self.latency_per_focus * num_foci + jitter
+        if delay > 0:
+            time.sleep(delay)
+        end = time.perf_counter()
+        with self._lock:
+            for item in items:
+                record = _describe(item, start, end, failed)
+                self.records.append(record)
+                if not failed and (record.num_foci or record.kind == "SwapSegmentFociSTM"):
+                    self._emulate_stm(record)
+            if failed:
+                self.failures += 1
+        if failed:
+            raise AUTDError(f"Injected send failure (send #{count})")
+
+    def summary(self):
+        """送信回数・失敗・データグラムの種類ごとの数・送った制御点と変調サンプルの合計・送信時間"""
+        with self._lock:
+            records = list(self.records)
+            sends, failures = self.sends, self.failures
+        kinds = {}
+        for record in records:
+            kinds[record.kind] = kinds.get(record.kind, 0) + 1
+        # 1回の send() の記録は同じ (start, end) を持つ
+        durations = np.array(sorted({(r.start, r.end) for r in records}))
+        send_ms = (durations[:, 1] - durations[:, 0]) * 1000 if len(durations) else np.zeros(0)
+        return {
+            "sends": sends,
+            "failures": failures,
+            "datagrams": kinds,
+            "foci_sent": sum(r.num_foci or 0 for r in records if not r.failed),
+            "mod_samples_sent": sum(r.mod_samples or 0 for r in records if not r.failed),
+            "send_ms_p50": float(np.percentile(send_ms, 50)) if len(send_ms) else None,
+            "send_ms_total": float(send_ms.sum()),
+        }
+
+    # --- セグメント再生の模擬 ---
+    def _active(self):
+        return self.timeline[-1] if self.timeline else None
+
+    def _emulate_stm(self, record):
+        now = record.end
+        segment = 0 if record.segment is None else record.segment
+        active = self._active()
+        if record.kind == "SwapSegmentFociSTM":
+            # 書き込み済みのセグメントに切り替えるだけ
+            loop_duration = self._written.get(segment, 0.0)
+        else:
+            loop_duration = self._written[segment] = record.loop_duration
+            if active is not None and active[0] == segment and (active[2] is None or active[2] > now):
+                self.overwrites += 1
+
+        loops = record.loop_count
+        if record.transition in (None, "Immediate"):
+            switch_time = now
+        elif record.transition == "SyncIdx" and active is not None:
+            seg, begin, finish, duration = active
+            if finish is None:
+                # 無限ループ中なら次に先頭へ戻る時刻で切り替わる
+                switch_time = begin + duration * (int((now - begin) / duration) + 1)
+            else:
+                switch_time = max(finish, now)
+                if now > finish:
+                    self.gaps.append((finish, now - finish))
+        else:
+            return  # Later などは書き込むだけ
+
+        if active is not None:
+            self.timeline[-1] = (active[0], active[1], switch_time, active[3])
+        finish = None if loops is None else switch_time + loops * loop_duration
+        self.timeline.append((segment, switch_time, finish, loop_duration))
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+            self.timeline.clear()
+            self.gaps.clear()
+            self.overwrites = 0
+            self._written.clear()
+            self.sends = 0
+            self.failures = 0
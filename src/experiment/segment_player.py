@@ -0,0 +1,200 @@
+"""
+次に押されそうな刺激を待機中のセグメントに書いておき、押したときはセグメントを切り替えるだけにするプレイヤー
+
+FociSTM 全体を押した瞬間に送るのが、トークンに触れてから刺激を感じるまでの遅れの大部分だった。
+main2.py の WithSegment(..., Segment.S1, transition_mode.Later()) と同じように、
+再生中でない方のセグメントに STM を書き込んでおけば、押したときは
+変調（短い）と SwapSegmentFociSTM だけを送ればよい。
+
+    押した刺激が待機中のセグメントにある       -> 変調を書いて STM を切り替える (hit)
+    押した刺激が再生中のセグメントにある       -> 変調だけ書き直す (resume, 離したあとにもう一度押した場合)
+    どちらにもない                             -> 待機中のセグメントに全部書いてすぐ切り替える (miss)
+
+離したときは再生中のセグメントの変調を Static(intensity=0) にするだけなので、STM は残る
+（そのため切り替えるときも変調は書き直す）。
+2つのセグメントには直前に再生した2つの刺激が残るので、何もしなくても最近使った刺激は hit になり、
+stage() を呼ぶと待機中のセグメントを指定の刺激（カーソルが乗ったトークンなど）で置き換える。
+
+    python segment_player.py    # Nop リンクで1セッション分のクリックを模擬し、毎回送る場合と比べる
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+from pyautd3 import Segment, Static, SwapSegmentFociSTM, WithSegment, transition_mode
+
+OUTCOMES = ("hit", "resume", "miss")
+
+
+def _other(segment):
+    return Segment.S1 if segment == Segment.S0 else Segment.S0
+
+
+class SegmentPlayer:
+    """S0/S1 に書いた刺激を覚えておき、押されたら切り替えるか書き込むかを選んで送る
+
+    play / stop / stage は同じスレッド（送信スレッド）から呼ぶ。
+    """
+
+    def __init__(self):
+        self.active = Segment.S0
+        self.loaded = {Segment.S0: None, Segment.S1: None}  # セグメント -> 書き込んである刺激ID
+        self.counts = {outcome: 0 for outcome in OUTCOMES}
+        self.latencies = {outcome: [] for outcome in OUTCOMES}  # play() の送信にかかった時間 (s)
+        self.stages = 0
+        self.stage_time = 0.0
+
+    @property
+    def idle(self):
+        return _other(self.active)
+
+    def play(self, autd, stim_id, m, g):
+        start_time = time.perf_counter()
+        if self.loaded[self.active] == stim_id:
+            outcome = "resume"
+            autd.send(WithSegment(m, self.active, transition_mode.Immediate()))
+        elif self.loaded[self.idle] == stim_id:
+            outcome = "hit"
+            # 待機中のセグメントの変調は前に離したときの Static(intensity=0) かもしれないので書き直す
+            autd.send((WithSegment(m, self.idle, transition_mode.Immediate()),
+                       SwapSegmentFociSTM(self.idle, transition_mode.Immediate())))
+            self.active = self.idle
+        else:
+            outcome = "miss"
+            segment = self.idle
+            # 書き込みが失敗したら中身はわからないので、先に印を消しておく
+            self.loaded[segment] = None
+            autd.send((WithSegment(m, segment, transition_mode.Immediate()),
+                       WithSegment(g, segment, transition_mode.Immediate())))
+            self.loaded[segment] = stim_id
+            self.active = segment
+        self.counts[outcome] += 1
+        self.latencies[outcome].append(time.perf_counter() - start_time)
+        return outcome
+
+    def stop(self, autd):
+        autd.send(WithSegment(Static(intensity=0), self.active, transition_mode.Immediate()))
+
+    def stage(self, autd, stim_id, g):
+        """待機中のセグメントに stim_id の STM を書いておく（どちらかにすでにあれば何もしない）"""
+        if stim_id in self.loaded.values():
+            return False
+        start_time = time.perf_counter()
+        segment = self.idle
+        self.loaded[segment] = None
+        autd.send(WithSegment(g, segment, transition_mode.Later()))
+        self.loaded[segment] = stim_id
+        self.stages += 1
+        self.stage_time += time.perf_counter() - start_time
+        return True
+
+    def invalidate(self):
+        """ほかの方法（SegmentStreamer など）でセグメントを書き換えたときに呼ぶ"""
+        self.active = Segment.S0
+        self.loaded = {Segment.S0: None, Segment.S1: None}
+
+    def summary(self):
+        presses = sum(self.counts.values())
+        latency = {}
+        for outcome in OUTCOMES:
+            if self.latencies[outcome]:
+                samples = np.array(self.latencies[outcome]) * 1000
+                latency[outcome] = {"p50_ms": float(np.percentile(samples, 50)),
+                                    "p95_ms": float(np.percentile(samples, 95)),
+                                    "max_ms": float(samples.max())}
+        return {
+            "presses": presses,
+            **self.counts,
+            "hit_rate": (self.counts["hit"] + self.counts["resume"]) / presses if presses else None,
+            "stages": self.stages,
+            "stage_time_total": self.stage_time,
+            "latency": latency,
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        if not summary["presses"]:
+            return
+        print(f"Segment preload: {summary['presses']} presses, hit {summary['hit']}, resume {summary['resume']}, "
+              f"miss {summary['miss']} (hit rate {summary['hit_rate']:.1%}), {summary['stages']} stages")
+        for outcome, stats in summary["latency"].items():
+            print(f"  {outcome:>6}: p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, "
+                  f"max {stats['max_ms']:.2f} ms")
+
+
+def simulate_session(autd, datagrams, trials, player=None, presses=12, hover_prob=0.8, seed=0):
+    """トライアルごとにトークンを presses 回押して離す。hover_prob の確率で押す前にカーソルが乗る (stage)
+
+    player=None なら従来どおり毎回 (変調, STM) を送る。押してから送信が終わるまでの時間のリストを返す。
+    """
+    rng = random.Random(seed)
+    latencies = []
+    for trial in trials:
+        for _ in range(presses):
+            stim_id = rng.choice(trial)
+            m, g = datagrams.get(stim_id)
+            if player is not None and rng.random() < hover_prob:
+                player.stage(autd, stim_id, g)
+            start_time = time.perf_counter()
+            if player is None:
+                autd.send((m, g))
+            else:
+                player.play(autd, stim_id, m, g)
+            latencies.append(time.perf_counter() - start_time)
+            if player is None:
+                autd.send(Static(intensity=0))
+            else:
+                player.stop(autd)
+    return latencies
+
+
+def run_demo(num_trials=10, presses=12, hover_prob=0.8, seed=0):
+    from pyautd3 import AUTD3, Controller, Silencer
+    from pyautd3.link.nop import Nop
+
+    from benchmark_play_latency import CENTER, NUM_DEVICES, modulation_for, open_bank
+    from datagram_cache import StimulusDatagramCache, make_foci_stm
+    from stimulus_bank import BANK_FILE
+    from stm_resampler import fit_to_buffer
+    from trajectory import Trajectory
+    from trial_generator import GreedyTrialGenerator
+
+    bank = open_bank(BANK_FILE)
+
+    def build(stim_id):
+        params = bank.params(stim_id)
+        plan = fit_to_buffer(Trajectory(bank.trajectory(stim_id), CENTER), params["velo"])
+        return modulation_for(params["am_freq"]), make_foci_stm(plan.trajectory.to_foci(), plan.sampling_config())
+
+    datagrams = StimulusDatagramCache(build).preload(bank.ids)
+    datagrams.wait()
+    trials = GreedyTrialGenerator(len(bank), 7, anchor_items=[0, 17], verbose=False,
+                                  rng=random.Random(seed)).trials[:num_trials]
+
+    w, h = AUTD3.DEVICE_WIDTH, AUTD3.DEVICE_HEIGHT
+    devices = [AUTD3(pos=[w * (i % 4), h * (i // 4), 0.0], rot=[1, 0, 0, 0]) for i in range(NUM_DEVICES)]
+    with Controller.open(devices, Nop()) as autd:
+        autd.send(Silencer.disable())
+        baseline = np.array(simulate_session(autd, datagrams, trials, None, presses, hover_prob, seed)) * 1000
+        player = SegmentPlayer()
+        preloaded = np.array(simulate_session(autd, datagrams, trials, player, presses, hover_prob, seed)) * 1000
+
+    print(f"{len(trials)} トライアル x {presses} 回, 押す前にカーソルが乗る確率 {hover_prob:.0%}")
+    for label, samples in (("毎回送る", baseline), ("セグメント先読み", preloaded)):
+        print(f"  {label}: p50 {np.percentile(samples, 50):.2f} ms, p95 {np.percentile(samples, 95):.2f} ms, "
+              f"max {samples.max():.2f} ms")
+    player.print_summary()
+    return player
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a session of presses with and without segment preloading")
+    parser.add_argument("--trials", type=int, default=10)
+    parser.add_argument("--presses", type=int, default=12, help="Presses per trial")
+    parser.add_argument("--hover-prob", type=float, default=0.8,
+                        help="Probability that the cursor enters the token (and it is staged) before the press")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run_demo(args.trials, args.presses, args.hover_prob, args.seed)
@@ -0,0 +1,162 @@
+"""
+セグメントを交互に書き換えて長い軌道を途切れなく再生するストリーミングプレイヤー
+
+main2.py の WithSegment(..., segment=S0/S1, transition_mode=Later()) の入れ替えと同じ考え方で、
+長いランダムウォーク軌道をセグメントに収まる長さのチャンクに分け、
+再生中でない方のセグメントに次のチャンクを書き込んでおく。
+各チャンクは WithFiniteLoop(loop_count=1, SyncIdx) で送るので、
+前のチャンクを1周し終えた境界で次のチャンクに切り替わる。
+元の軌道の点をそのまま（間引かずに）元の速度で再生できる。
+
+    python segment_streamer.py          # 代替コントローラで100000点の軌道を再生してタイミングを確認
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+from pyautd3 import FociSTM, SamplingConfig, Segment, WithFiniteLoop, WithSegment, transition_mode
+
+from stm_resampler import BASE_FREQ, MAX_DIVIDE, MAX_FOCI
+from trajectory import Trajectory
+
+SEGMENTS = (Segment.S0, Segment.S1)
+# 1セグメントに書き込む制御点の上限
+SEGMENT_FOCI = MAX_FOCI
+
+
+def divide_for(distance, velo):
+    """1ステップ distance (mm) を速度 velo (mm/s) で進む分周（40kHz / 分周 = velo / distance）"""
+    return int(np.clip(round(BASE_FREQ * distance / velo), 1, MAX_DIVIDE))
+
+
+class SegmentStreamer:
+    """軌道をチャンクに分け、S0/S1 に交互に書き込みながら再生する
+
+    start() で別スレッドで再生を始め、stop() で止める。loop=True なら最後のチャンクの後に先頭へ戻る。
+    """
+
+    def __init__(self, autd, trajectory, divide, modulation=None, chunk_size=SEGMENT_FOCI, loop=True):
+        self.autd = autd
+        self.trajectory = trajectory
+        self.divide = divide
+        self.modulation = modulation
+        self.loop = loop
+        # 最後だけ短いチャンクにならないよう、同じくらいの長さに分ける
+        num_chunks = max(1, -(-len(trajectory) // chunk_size))
+        self.chunks = [trajectory[int(s):int(e)] for s, e in
+                       zip(np.linspace(0, len(trajectory), num_chunks + 1)[:-1],
+                           np.linspace(0, len(trajectory), num_chunks + 1)[1:])]
+
+        self.chunks_sent = 0
+        self.late_writes = 0  # 前のチャンクが終わるまでに書き込みが間に合わなかった回数
+        self.min_margin = float("inf")  # 書き込み完了から切り替えまでの余裕の最小値 (s)
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def sample_rate(self):
+        return BASE_FREQ / self.divide
+
+    def chunk_duration(self, index):
+        return len(self.chunks[index]) / self.sample_rate
+
+    def _stm(self, index):
+        return FociSTM(foci=self.chunks[index].to_foci(), config=SamplingConfig(self.divide))
+
+    def _send(self, datagram):
+        if self.modulation is not None and self.chunks_sent == 0:
+            datagram = (self.modulation, datagram)
+        self.autd.send(datagram)
+        self.chunks_sent += 1
+
+    def run(self):
+        """再生が終わるか stop() されるまでブロックする"""
+        try:
+            # 最初のチャンクは S0 に書いてすぐ再生する
+            self._send(WithSegment(self._stm(0), SEGMENTS[0], transition_mode.Immediate()))
+            switch_time = time.perf_counter() + self.chunk_duration(0)
+            index = 0
+            count = 1
+            while not self._stop.is_set():
+                index += 1
+                if index == len(self.chunks):
+                    if not self.loop:
+                        break
+                    index = 0
+                # 再生中でない方のセグメントに次のチャンクを書き、今のチャンクの終わりで切り替える
+                segment = SEGMENTS[count % 2]
+                self._send(WithFiniteLoop(self._stm(index), segment, transition_mode.SyncIdx(), 1))
+                margin = switch_time - time.perf_counter()
+                self.min_margin = min(self.min_margin, margin)
+                if margin < 0:
+                    self.late_writes += 1
+                    switch_time = time.perf_counter()
+                count += 1
+
+                # 切り替わるまで待つ（その後は書き込んだ方が再生中になる）
+                if self._stop.wait(max(0.0, switch_time - time.perf_counter())):
+                    break
+                switch_time += self.chunk_duration(index)
+            if not self._stop.is_set():
+                # 最後のチャンクを再生し終えるまで待つ
+                self._stop.wait(max(0.0, switch_time - time.perf_counter()))
+        except Exception as e:
+            self.error = e
+            print(f"Warning (Stream): Communication failed. Stopped streaming. ({e})")
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+def run_demo(distance=0.05, velo=1000, num_points=100000, latency=0.005, chunk_size=SEGMENT_FOCI):
+    """代替コントローラに対して1周分ストリーミングし、チャンクの切り替えタイミングを表示する"""
+    from recording_controller import RecordingController
+    from trajectory_engine import generate_trajectory
+
+    trajectory = Trajectory.from_points(generate_trajectory(distance, num_points, mode="numpy", rng=0),
+                                        center=[0.0, 0.0, 150.0])
+    divide = divide_for(distance, velo)
+    controller = RecordingController(latency=latency)
+    streamer = SegmentStreamer(controller, trajectory, divide, chunk_size=chunk_size, loop=False)
+    print(f"dist={distance}mm, velo={velo}mm/s, {num_points} points -> {len(streamer.chunks)} chunks, "
+          f"divide={divide} ({streamer.sample_rate:.0f}Hz), send latency={latency * 1000:.1f}ms")
+
+    start_time = time.perf_counter()
+    streamer.run()
+    elapsed = time.perf_counter() - start_time
+    expected = len(trajectory) / streamer.sample_rate
+
+    for i, (segment, begin, finish, duration) in enumerate(controller.timeline):
+        finish_text = "-" if finish is None else f"{(finish - start_time) * 1000:9.1f}"
+        print(f"  chunk {i:2d}: S{segment} {(begin - start_time) * 1000:9.1f} -> {finish_text} ms "
+              f"({duration * 1000:.1f} ms/loop)")
+    print(f"再生時間 {elapsed:.3f}s (軌道の長さ {expected:.3f}s), 書き込みの最小余裕 {streamer.min_margin * 1000:.1f}ms")
+    print(f"途切れ: {len(controller.gaps)}, 遅れた書き込み: {streamer.late_writes}, "
+          f"再生中セグメントの上書き: {controller.overwrites}")
+    return controller
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a long trajectory through alternating STM segments")
+    parser.add_argument("--dist", type=float, default=0.05)
+    parser.add_argument("--velo", type=float, default=1000)
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--latency", type=float, default=0.005, help="Emulated send latency (s)")
+    parser.add_argument("--chunk-size", type=int, default=SEGMENT_FOCI)
+    args = parser.parse_args()
+    run_demo(args.dist, args.velo, args.points, args.latency, args.chunk_size)
@@ -0,0 +1,185 @@
+"""
+AUTD への送信を Tk のメインループから切り離す送信スレッド
+
+on_press -> play_stimulus -> autd.send((m, g)) と on_release -> autd.send(Static(intensity=0)) は
+Tk のメインループの中で送信が終わるまでブロックしていたので、EtherCAT の往復が遅いとドラッグが止まり、
+素早くクリックと離すを繰り返すと古いコマンドが後ろに溜まっていた。
+
+SendWorker は Controller を持つ専用スレッドで、GUI からは「刺激 X を再生」「停止」の意図だけを渡す。
+まだ送っていない意図は最新の1つだけを残して上書きする（latest-wins）ので、
+送信中に押して離してまた押した場合は、最後の「再生」だけが送られる。
+「次の刺激を待機中のセグメントに書いておく」(STAGE) は優先度の低い別枠で、再生・停止がないときだけ送る。
+送信の失敗は errors キューに入れ、GUI 側が poll_errors() で取り出して表示する。
+
+    python send_worker.py                  # gui_test.py の DummyAUTD で素早いクリックを模擬
+    python send_worker.py --latency 0.05   # 送信に 50 ms かかるコントローラで模擬
+"""
+
+import argparse
+import queue
+import threading
+import time
+
+from pyautd3 import Static
+
+PLAY = "play"
+STOP = "stop"
+STAGE = "stage"
+
+
+def send_stop(autd):
+    autd.send(Static(intensity=0))
+
+
+class SendWorker:
+    """意図 (PLAY, stim_id) / (STOP, None) を受け取り、別スレッドで play(autd, stim_id) / stop(autd) を呼ぶ
+
+    送る前に新しい意図が来たら古い方は捨てる (coalesced に数える)。
+    (STAGE, stim_id) は stage(autd, stim_id) を呼ぶ意図で、PLAY / STOP が残っていないときだけ送る。
+    play / stop / stage で起きた例外は (意図, 例外) として errors に入る。
+    """
+
+    def __init__(self, autd, play, stop=send_stop, stage=None):
+        self.autd = autd
+        self.play = play
+        self.stop = stop
+        self.stage = stage
+        self.errors = queue.Queue()
+        self.delivered = 0
+        self.coalesced = 0
+        self.failures = 0
+        self._pending = None
+        self._pending_stage = None
+        self._busy = False
+        self._closing = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # --- GUI スレッドから呼ぶ ---
+    def post(self, intent):
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("SendWorker is closed")
+            if intent[0] == STAGE:
+                if self.stage is None:
+                    return
+                self._pending_stage = intent
+            else:
+                if self._pending is not None:
+                    self.coalesced += 1
+                self._pending = intent
+            self._cond.notify_all()
+
+    def post_play(self, stim_id):
+        self.post((PLAY, stim_id))
+
+    def post_stop(self):
+        self.post((STOP, None))
+
+    def post_stage(self, stim_id):
+        self.post((STAGE, stim_id))
+
+    def poll_errors(self):
+        """溜まっている (意図, 例外) をすべて取り出す"""
+        errors = []
+        while True:
+            try:
+                errors.append(self.errors.get_nowait())
+            except queue.Empty:
+                return errors
+
+    def wait_idle(self, timeout=None):
+        """送っていない意図がなくなり、送信中でもなくなるまで待つ"""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._pending is None and self._pending_stage is None and not self._busy, timeout)
+
+    def close(self, timeout=None):
+        """残っている再生・停止を送ってからスレッドを止める"""
+        with self._cond:
+            self._closing = True
+            self._pending_stage = None
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {"delivered": self.delivered, "coalesced": self.coalesced, "failures": self.failures}
+
+    # --- 送信スレッド ---
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._pending is not None or self._pending_stage is not None or self._closing)
+                if self._pending is not None:
+                    intent, self._pending = self._pending, None
+                elif self._pending_stage is not None and not self._closing:
+                    intent, self._pending_stage = self._pending_stage, None
+                else:
+                    return
+                self._busy = True
+            try:
+                kind, stim_id = intent
+                if kind == PLAY:
+                    self.play(self.autd, stim_id)
+                elif kind == STAGE:
+                    self.stage(self.autd, stim_id)
+                else:
+                    self.stop(self.autd)
+            except Exception as e:
+                self.failures += 1
+                self.errors.put((intent, e))
+            finally:
+                with self._cond:
+                    self.delivered += 1
+                    self._busy = False
+                    self._cond.notify_all()
+
+
+def run_demo(latency=0.0, presses=50, hold=0.01):
+    """press (play) と release (stop) を hold 秒おきに繰り返し、GUI 側の待ち時間と送られた意図の数を表示する"""
+    if latency > 0:
+        from recording_controller import RecordingController
+        autd = RecordingController(latency=latency)
+    else:
+        from gui_test import DummyAUTD
+        autd = DummyAUTD()
+
+    sent = []
+
+    def play(autd, stim_id):
+        autd.send(Static(intensity=255))
+        sent.append((PLAY, stim_id))
+
+    def stop(autd):
+        send_stop(autd)
+        sent.append((STOP, None))
+
+    worker = SendWorker(autd, play, stop)
+    post_times = []
+    for i in range(presses):
+        for intent in ((PLAY, i % 18), (STOP, None)):
+            start_time = time.perf_counter()
+            worker.post(intent)
+            post_times.append(time.perf_counter() - start_time)
+            time.sleep(hold)
+    worker.close()
+
+    post_times.sort()
+    print(f"{type(autd).__name__} (send latency {latency * 1000:.1f} ms), {presses} press/release, hold {hold * 1000:.0f} ms")
+    print(f"  GUI 側の待ち時間: 中央値 {post_times[len(post_times) // 2] * 1e6:.1f} us, "
+          f"最大 {post_times[-1] * 1e6:.1f} us")
+    print(f"  送信 {worker.delivered}, 上書きで捨てた意図 {worker.coalesced}, 失敗 {worker.failures}")
+    print(f"  最後に送った意図: {sent[-1] if sent else None}")
+    return worker
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate fast press/release sequences through the send worker")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Emulated send latency (s); 0 uses DummyAUTD from gui_test.py")
+    parser.add_argument("--presses", type=int, default=50)
+    parser.add_argument("--hold", type=float, default=0.01, help="Seconds between press and release events")
+    args = parser.parse_args()
+    run_demo(args.latency, args.presses, args.hold)
@@ -0,0 +1,257 @@
+"""
+刺激バンク: 全刺激の定義と軌道を1つのバイナリファイルにまとめたもの
+
+これまでは各スクリプトの _generate_stimuli_params が刺激の組み合わせ
+(dist x velo x am_freq) をそれぞれハードコードし、stm_freq・点数・色・軌道を
+起動のたびに計算していた。ここでは stimuli_seeds.json から一度だけバンクを作り、
+実験アプリと解析スクリプトは同じファイルを mmap で開いてIDで刺激を引く。
+
+ファイル形式 (stimulus_bank.bin):
+    MAGIC (8 bytes) | ヘッダ長 (uint64, little endian) | ヘッダ (JSON, UTF-8)
+    | 64 bytes 境界までのパディング | 軌道データ (float32, 刺激ごとに (num_points, 2))
+
+ヘッダには刺激ごとのパラメータ・データ内の位置・妥当性の統計量と、
+生成に使った設定 (mode, master_seed, GENERATOR_VERSION, シードファイルのハッシュ) を入れる。
+軌道は中心を足す前の相対座標 (mm) で保存する。
+
+使い方:
+    python stimulus_bank.py            # stimuli_seeds.json から stimulus_bank.bin を作る
+    python stimulus_bank.py --show     # 作成済みのバンクの内容を表示
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from stimulus_rng import reproduce_stimulus, stream_rng
+from streaming_validator import StreamingValidator
+from trajectory_engine import GENERATOR_VERSION, MODES
+
+SEEDS_FILE = os.path.join(os.path.dirname(__file__), "stimuli_seeds.json")
+BANK_FILE = os.path.join(os.path.dirname(__file__), "stimulus_bank.bin")
+
+MAGIC = b"STIMBANK"
+FORMAT_VERSION = 1
+ALIGN = 64
+
+
+def num_points_for(distance):
+    """distに応じたポイント数"""
+    return 100000 if distance < 1.0 else 1000
+
+
+def stm_freq_for(distance, velo):
+    """1周 (num_points 点) を速度 velo (mm/s) で進むときのSTM周波数"""
+    return velo / (num_points_for(distance) * distance)
+
+
+def _file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _data_offset(header_len):
+    return -(-(len(MAGIC) + 8 + header_len) // ALIGN) * ALIGN
+
+
+# --- 作成 ---
+def build_bank(seeds_file=SEEDS_FILE, output=BANK_FILE, mode=None):
+    """stimuli_seeds.json の全刺激の軌道を生成してバンクに書き出す"""
+    with open(seeds_file, "r") as f:
+        seeds_data = json.load(f)
+    seeds_mode = seeds_data.get("mode", "compat")
+    mode = mode or seeds_mode
+    if mode != seeds_mode:
+        print(f"Warning: seeds were validated with mode '{seeds_mode}', building with '{mode}'.")
+
+    spec = seeds_data.get("streams")
+
+    def reproduce(stim):
+        return reproduce_stimulus(seeds_data, stim, num_points_for(stim["dist"]), mode)
+
+    if spec:
+        # 刺激ごとに独立したストリームなので、並列に作っても結果は同じ
+        with ThreadPoolExecutor() as executor:
+            reproduced = list(executor.map(reproduce, seeds_data["stimuli"]))
+    else:
+        # 従来のシードはモジュール共通の random を使うので順番に作る
+        reproduced = [reproduce(stim) for stim in seeds_data["stimuli"]]
+
+    stimuli = []
+    arrays = []
+    offset = 0
+    for stim, (trajectory, color) in zip(seeds_data["stimuli"], reproduced):
+        dist = stim["dist"]
+        num_points = num_points_for(dist)
+        offsets = np.asarray(trajectory[:, :2], dtype=np.float32)
+        validator = StreamingValidator(num_points, dist)
+        valid = validator.update(trajectory[:, :2])
+        stats = validator.stats
+        stats["centroid"] = stats["centroid"].tolist()
+
+        stimuli.append({
+            "id": stim["id"],
+            "dist": dist,
+            "velo": stim["velo"],
+            "am_freq": stim["am_freq"],
+            "stm_freq": stm_freq_for(dist, stim["velo"]),
+            "num_points": num_points,
+            "seed": stim.get("seed"),
+            "attempt": stim.get("attempt"),
+            "color": color,
+            "valid": bool(valid),
+            "stats": stats,
+            "offset": offset,
+        })
+        arrays.append(offsets)
+        offset += offsets.size
+        print(f"  Stimulus {stim['id']:2d}: dist={dist}, velo={stim['velo']}, am={stim['am_freq']}, "
+              f"points={num_points}, valid={valid}")
+
+    data = np.concatenate([a.ravel() for a in arrays]).astype("<f4")
+    # 従来は最後の刺激の色を引いた後の random の状態でトライアル順などを決めていたので、
+    # その状態も保存しておき、読み込み側で復元できるようにする
+    # （ストリームを使う場合は random に触れないので master_seed から決める）
+    version, state, gauss = random.Random(spec["master_seed"]).getstate() if spec else random.getstate()
+    header = {
+        "format_version": FORMAT_VERSION,
+        "sampling": {
+            "mode": mode,
+            "master_seed": seeds_data.get("master_seed"),
+            "generator_version": GENERATOR_VERSION,
+            "seeds_file_sha1": _file_hash(seeds_file),
+            "streams": spec,
+        },
+        "stimuli": stimuli,
+        "random_state": [version, list(state), gauss],
+    }
+    # バンクの識別子（結果ファイルに記録して、解析時に同じバンクか確認する）
+    digest = hashlib.sha1(json.dumps(header, sort_keys=True).encode())
+    digest.update(data.tobytes())
+    header["bank_id"] = digest.hexdigest()[:16]
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_offset = _data_offset(len(header_bytes))
+    tmp_path = f"{output}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (data_offset - f.tell()))
+        f.write(data.tobytes())
+    os.replace(tmp_path, output)
+    print(f"Saved {len(stimuli)} stimuli to {output} (bank_id={header['bank_id']})")
+    return output
+
+
+# --- 読み込み ---
+class StimulusBank:
+    """stimulus_bank.bin を開いて刺激をIDで引く（軌道は mmap したファイルのビュー）"""
+
+    def __init__(self, path=BANK_FILE):
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"Stimulus bank not found at {path}. "
+                "Please run stimulus_bank.py first."
+            )
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a stimulus bank file")
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+        if header["format_version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported stimulus bank version {header['format_version']} (expected {FORMAT_VERSION})")
+
+        self.path = path
+        self.bank_id = header["bank_id"]
+        self.sampling = header["sampling"]
+        self._stimuli = {stim["id"]: stim for stim in header["stimuli"]}
+        self._random_state = header["random_state"]
+        self._data = np.memmap(path, dtype="<f4", mode="r", offset=_data_offset(header_len))
+
+    def __len__(self):
+        return len(self._stimuli)
+
+    @property
+    def ids(self):
+        return sorted(self._stimuli)
+
+    def params(self, stim_id):
+        """刺激パラメータの dict（JSONにそのまま保存できる値のみ）"""
+        stim = self._stimuli[stim_id]
+        return {key: stim[key] for key in ("id", "dist", "velo", "am_freq", "stm_freq", "num_points", "seed", "color")}
+
+    def stats(self, stim_id):
+        """バンク作成時に計算した妥当性の統計量"""
+        return dict(self._stimuli[stim_id]["stats"], valid=self._stimuli[stim_id]["valid"])
+
+    def trajectory(self, stim_id):
+        """相対座標の軌道 (num_points, 2) float32（コピーしないビュー）"""
+        stim = self._stimuli[stim_id]
+        start = stim["offset"]
+        return self._data[start:start + 2 * stim["num_points"]].reshape(-1, 2)
+
+    def layout_rng(self, stim_id):
+        """初期配置用の Generator（ストリームを使わないバンクでは None）"""
+        spec = self.sampling.get("streams")
+        return stream_rng(spec, stim_id, "layout") if spec else None
+
+    def restore_random_state(self):
+        """random の状態を、全刺激を順に生成し終えた直後の状態に戻す"""
+        version, state, gauss = self._random_state
+        random.setstate((version, tuple(state), gauss))
+
+    def is_stale(self, seeds_file=SEEDS_FILE):
+        """バンク作成後に stimuli_seeds.json が変わっていれば True"""
+        return os.path.exists(seeds_file) and _file_hash(seeds_file) != self.sampling["seeds_file_sha1"]
+
+
+def load_bank(path=BANK_FILE):
+    return StimulusBank(path)
+
+
+def params_for_result(data, path=BANK_FILE):
+    """結果ファイルが記録しているバンクと同じなら {id: params} を返す（違う・無い場合は None）"""
+    bank_id = data.get("config", {}).get("stimulus_bank") if isinstance(data, dict) else None
+    if bank_id is None or not os.path.exists(path):
+        return None
+    bank = StimulusBank(path)
+    if bank.bank_id != bank_id:
+        print(f"Warning: results were recorded with stimulus bank {bank_id}, but {path} is {bank.bank_id}.")
+        return None
+    return {stim_id: bank.params(stim_id) for stim_id in bank.ids}
+
+
+def show_bank(path=BANK_FILE):
+    bank = StimulusBank(path)
+    print(f"{path} (bank_id={bank.bank_id})")
+    print(f"sampling: {bank.sampling}")
+    for stim_id in bank.ids:
+        p = bank.params(stim_id)
+        s = bank.stats(stim_id)
+        print(f"  {stim_id:2d}: dist={p['dist']}, velo={p['velo']}, am={p['am_freq']}, "
+              f"stm_freq={p['stm_freq']:.4f}Hz, points={p['num_points']}, color={p['color']}, "
+              f"centroid_dist={s['centroid_dist']:.2f}, valid={s['valid']}")
+    if bank.is_stale():
+        print("Warning: stimuli_seeds.json has changed since this bank was built.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the stimulus bank from stimuli_seeds.json")
+    parser.add_argument("--seeds", default=SEEDS_FILE, help="Seeds file to build from")
+    parser.add_argument("--output", default=BANK_FILE, help="Output bank file")
+    parser.add_argument("--mode", choices=MODES, default=None,
+                        help="Trajectory mode (default: the mode recorded in the seeds file)")
+    parser.add_argument("--show", action="store_true", help="Show the contents of an existing bank")
+    args = parser.parse_args()
+
+    if args.show:
+        show_bank(args.output)
+    else:
+        build_bank(args.seeds, args.output, args.mode)
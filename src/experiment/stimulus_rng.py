@@ -0,0 +1,65 @@
+"""
+刺激ごと・用途ごとに独立した乱数ストリームを作る
+
+これまでは刺激を作る前に random.seed(seed) / np.random.seed(seed) でモジュール共通の
+乱数を初期化し、軌道の後に色の random.randint を同じ乱数列から引いていた。
+このため刺激を並列に、あるいは順番を変えて作ると結果が変わってしまう。
+
+ここでは master_seed から numpy.random.SeedSequence の spawn_key で
+(刺激ID, 用途, 試行番号) ごとの Generator を直接作る。どの順番・どのスレッド/プロセスで
+作っても同じ値になる。用途は trajectory（軌道）, color（表示色）, layout（初期配置）。
+ストリームの仕様は stimuli_seeds.json の "streams" に記録する。
+"""
+
+import random
+
+import numpy as np
+
+from trajectory_cache import load_trajectory
+from trajectory_engine import generate_trajectory
+
+STREAM_VERSION = 1
+PURPOSES = {"trajectory": 0, "color": 1, "layout": 2}
+
+
+def make_stream_spec(master_seed):
+    """stimuli_seeds.json に保存するストリームの仕様"""
+    return {
+        "version": STREAM_VERSION,
+        "seed_sequence": "numpy.random.SeedSequence",
+        "bit_generator": "PCG64",
+        "master_seed": int(master_seed),
+        "spawn_key": ["stim_id", "purpose", "attempt"],
+        "purposes": dict(PURPOSES),
+    }
+
+
+def stream_rng(spec, stim_id, purpose, attempt=0):
+    """刺激 stim_id の用途 purpose 用の Generator（attempt は軌道のシード探索の試行番号）"""
+    if spec["version"] != STREAM_VERSION:
+        raise ValueError(f"Unsupported stream spec version {spec['version']} (expected {STREAM_VERSION})")
+    seed_seq = np.random.SeedSequence(spec["master_seed"], spawn_key=(stim_id, spec["purposes"][purpose], attempt))
+    return np.random.Generator(np.random.PCG64(seed_seq))
+
+
+def random_color(rng):
+    return "#{:06x}".format(int(rng.integers(0, 0x1000000)))
+
+
+def reproduce_stimulus(seeds_data, stim, num_points, mode=None):
+    """stimuli_seeds.json のエントリから (相対座標の軌道 (N, 3), 色) を再現する
+
+    "streams" がある場合は刺激ごとのストリームから作るので、どの順番で呼んでもよい。
+    無い場合は従来どおり random.seed(seed) してから軌道を作り、続けて色を引く。
+    """
+    mode = mode or seeds_data.get("mode", "compat")
+    spec = seeds_data.get("streams")
+    if spec is None:
+        trajectory = load_trajectory(stim["seed"], stim["dist"], num_points, mode=mode)
+        return trajectory, "#{:06x}".format(random.randint(0, 0xFFFFFF))
+
+    if mode == "compat":
+        raise ValueError("Stream-based stimuli need a numpy or arc trajectory mode")
+    rng = stream_rng(spec, stim["id"], "trajectory", stim["attempt"])
+    trajectory = generate_trajectory(stim["dist"], num_points, mode=mode, rng=rng)
+    return trajectory, random_color(stream_rng(spec, stim["id"], "color"))
@@ -0,0 +1,164 @@
+"""
+長い軌道を FociSTM のバッファに収まる点数に作り直すリサンプラー
+
+dist=0.05 の刺激は100000点をそのまま FociSTM に渡していたが、
+デバイスのSTMバッファに入る点数を大きく超えていて、送信も重かった。
+ここでは軌道を MAX_FOCI 点以下に間引き、折れ線に沿って等間隔に並べ直す。
+制御点の間隔 s と更新レート (40kHz / 分周) の積が velo (mm/s) になるよう
+分周と点数を選び、実際の速度との誤差を報告する。
+
+速度を保ったまま点数を減らすので、1周にかかる時間は元の軌道より短くなる。
+"""
+
+import numpy as np
+
+from streaming_validator import StreamingValidator
+from trajectory import Trajectory
+
+# FociSTM のバッファに入る制御点の上限（ファームウェアに合わせて変更する）
+MAX_FOCI = 8192
+# SamplingConfig の分周の基準周波数 (Hz) と分周の上限
+BASE_FREQ = 40000
+MAX_DIVIDE = 0xFFFF
+
+
+class STMPlan:
+    """FociSTM に渡す軌道と、速度 velo を保つためのサンプリング設定"""
+
+    __slots__ = ("trajectory", "velo", "divide", "decimation", "original_points")
+
+    def __init__(self, trajectory, velo, divide, decimation, original_points):
+        self.trajectory = trajectory
+        self.velo = velo
+        self.divide = divide
+        self.decimation = decimation
+        self.original_points = original_points
+
+    @property
+    def sample_rate(self):
+        """制御点の更新レート (Hz)"""
+        return BASE_FREQ / self.divide
+
+    @property
+    def step_length(self):
+        """隣り合う制御点の平均間隔 (mm)"""
+        return float(np.mean(np.linalg.norm(np.diff(self.trajectory.offsets, axis=0), axis=1)))
+
+    @property
+    def speed(self):
+        """実際の移動速度 (mm/s)"""
+        return self.step_length * self.sample_rate
+
+    @property
+    def speed_error(self):
+        """velo に対する相対誤差"""
+        return self.speed / self.velo - 1.0
+
+    @property
+    def loop_period(self):
+        """軌道を1周するのにかかる時間 (s)"""
+        return len(self.trajectory) / self.sample_rate
+
+    def sampling_config(self):
+        from pyautd3 import SamplingConfig
+
+        return SamplingConfig(self.divide)
+
+    def summary(self):
+        """結果ファイルなどに保存する概要"""
+        return {
+            "num_points": len(self.trajectory),
+            "original_points": self.original_points,
+            "decimation": self.decimation,
+            "divide": self.divide,
+            "sample_rate": self.sample_rate,
+            "speed": self.speed,
+            "speed_error": self.speed_error,
+            "loop_period": self.loop_period,
+        }
+
+
+def _nearest_divide(rate):
+    return int(np.clip(np.rint(BASE_FREQ / rate), 1, MAX_DIVIDE))
+
+
+def _mean_step(points):
+    return float(np.mean(np.linalg.norm(np.diff(points, axis=0), axis=1)))
+
+
+def _equal_chord_points(polyline, step, max_points):
+    """折れ線に沿って進み、直線距離がちょうど step ずつ離れた点を並べる
+
+    焦点は制御点の間を直線で移動するので、直線距離（弦）を揃えると速度が一定になる。
+    max_points を超えたら None を返す。
+    """
+    xs = polyline[:, 0].tolist()
+    ys = polyline[:, 1].tolist()
+    cx, cy = xs[0], ys[0]
+    out_x, out_y = [cx], [cy]
+    step_sq = step * step
+    i = 0  # 現在の点が乗っている線分の始点
+    last = len(xs) - 1
+    while True:
+        # 現在の点から step 以上離れる最初の頂点を探す（その手前の線分上で円と交わる）
+        j = i + 1
+        while j <= last and (xs[j] - cx) ** 2 + (ys[j] - cy) ** 2 < step_sq:
+            j += 1
+        if j > last:
+            break
+        ax, ay = (cx, cy) if j == i + 1 else (xs[j - 1], ys[j - 1])
+        ex, ey = xs[j] - ax, ys[j] - ay
+        dx, dy = ax - cx, ay - cy
+        ee = ex * ex + ey * ey
+        de = dx * ex + dy * ey
+        t = (-de + np.sqrt(max(de * de - ee * (dx * dx + dy * dy - step_sq), 0.0))) / ee
+        cx, cy = ax + t * ex, ay + t * ey
+        out_x.append(cx)
+        out_y.append(cy)
+        if len(out_x) > max_points:
+            return None
+        i = j - 1
+    return np.column_stack((out_x, out_y))
+
+
+def fit_to_buffer(trajectory, velo, max_points=MAX_FOCI):
+    """軌道を max_points 点以下に作り直し、速度 velo を保つ STMPlan を返す
+
+    max_points 以下の軌道はそのまま使い、分周だけを決める。
+    それより長い軌道は k 点おきに間引いた折れ線に沿って、弦の長さが
+    s = velo * 分周 / BASE_FREQ になるよう点を並べ直す（速度は s * 更新レート = velo）。
+    点数が max_points に収まる最小の分周を選ぶ。
+    """
+    offsets = np.asarray(trajectory.offsets, dtype=float)
+    num_points = len(offsets)
+
+    if num_points <= max_points:
+        divide = _nearest_divide(velo / _mean_step(offsets))
+        return STMPlan(trajectory, velo, divide, 1, num_points)
+
+    decimation = int(np.ceil((num_points - 1) / (max_points - 1)))
+    coarse = offsets[::decimation]
+    length = float(np.sum(np.linalg.norm(np.diff(coarse, axis=0), axis=1)))
+
+    # 弦は弧長より短いので、弧長で割った間隔なら必ず max_points に収まる
+    divide = int(np.ceil(BASE_FREQ * length / ((max_points - 1) * velo)))
+    points = _equal_chord_points(coarse, velo * divide / BASE_FREQ, max_points)
+    # 角を近道したぶん点が少なくなるので、収まる最小の分周を二分探索で詰める
+    low = max(1, int(np.ceil(divide * (len(points) - 1) / (max_points - 1)))) - 1
+    while divide - low > 1:
+        mid = (low + divide) // 2
+        refined = _equal_chord_points(coarse, velo * mid / BASE_FREQ, max_points)
+        if refined is None:
+            low = mid
+        else:
+            divide, points = mid, refined
+    if divide > MAX_DIVIDE:
+        raise ValueError(f"velo={velo} mm/s is too slow for a {max_points}-point STM (divide {divide} > {MAX_DIVIDE})")
+    return STMPlan(Trajectory(points, trajectory.center), velo, divide, decimation, num_points)
+
+
+def coverage_stats(trajectory):
+    """is_valid_trajectory と同じ統計量（重心距離・標準偏差・範囲）"""
+    validator = StreamingValidator(len(trajectory), 1.0)
+    validator.update(trajectory.offsets)
+    return validator.stats
@@ -0,0 +1,194 @@
+"""
+軌道の妥当性を生成しながら判定するストリーミングチェッカー
+
+is_valid_trajectory は100000点の軌道を作り終えてから判定していたが、
+不合格になる候補の多くは途中で結果が決まっている
+（例: 重心が大きく偏っていて、残りのステップでは centroid_threshold 以内に戻れない）。
+ここでは点を受け取るたびに重心・分散 (Welford法)・最小/最大を更新し、
+「残りの点がどう動いても結果が変わらない」と分かった時点で合否を確定させる。
+"""
+
+import math
+
+import numpy as np
+
+from trajectory_engine import AREA_SIZE, iter_trajectory_chunks
+
+# 境界判定で丸め誤差により結果が反転しないための余裕
+EPS = 1e-9
+# 何点ごとにまとめて統計量を更新・判定するか（小さいチャンクごとだと判定のコストが勝る）
+CHECK_INTERVAL = 4096
+
+
+def _reachable_sums(pos, distance, remaining):
+    """残り remaining 点について、各点が取りうる座標の下限/上限の和と二乗和を返す
+
+    i 点後の座標は [max(0, pos - d*i), min(AREA_SIZE, pos + d*i)] に収まる。
+    """
+    # 上限側: pos + d*i <= AREA_SIZE となる i の個数
+    m_hi = min(remaining, int(math.floor((AREA_SIZE - pos) / distance)))
+    sum_i = m_hi * (m_hi + 1) / 2
+    sum_i2 = m_hi * (m_hi + 1) * (2 * m_hi + 1) / 6
+    rest = remaining - m_hi
+    sum_hi = m_hi * pos + distance * sum_i + rest * AREA_SIZE
+    sumsq_hi = m_hi * pos ** 2 + 2 * pos * distance * sum_i + distance ** 2 * sum_i2 + rest * AREA_SIZE ** 2
+
+    # 下限側: pos - d*i >= 0 となる i の個数（それ以降は 0）
+    m_lo = min(remaining, int(math.floor(pos / distance)))
+    sum_i = m_lo * (m_lo + 1) / 2
+    sum_i2 = m_lo * (m_lo + 1) * (2 * m_lo + 1) / 6
+    sum_lo = m_lo * pos - distance * sum_i
+    sumsq_lo = m_lo * pos ** 2 - 2 * pos * distance * sum_i + distance ** 2 * sum_i2
+    return sum_lo, sum_hi, sumsq_lo, sumsq_hi
+
+
+class StreamingValidator:
+    """点を順に受け取りながら is_valid_trajectory と同じ条件を判定する
+
+    update() は合否が確定していれば True/False、未確定なら None を返す。
+    """
+
+    def __init__(self, num_points, distance, centroid_threshold=2.0, std_threshold=1.5, range_threshold=6.0):
+        self.num_points = num_points
+        self.distance = distance
+        self.centroid_threshold = centroid_threshold
+        self.std_threshold = std_threshold
+        self.range_threshold = range_threshold
+
+        self.count = 0
+        self.mean = np.zeros(2)
+        self.m2 = np.zeros(2)  # 偏差二乗和 (Welford)
+        self.min = np.full(2, np.inf)
+        self.max = np.full(2, -np.inf)
+        self.last = None
+        self.result = None
+        self.fail_reason = None
+
+    def update(self, chunk):
+        """(k, 2) の点を追加して、確定した合否（未確定なら None）を返す"""
+        if self.result is not None:
+            return self.result
+        # 軸ごとに連続した (2, k) にしておくと集計が速い
+        cols = np.ascontiguousarray(np.asarray(chunk, dtype=float)[:, :2].T)
+        n_b = cols.shape[1]
+        if n_b == 0:
+            return None
+
+        # Welford法をチャンク単位にまとめた更新 (Chan et al.)
+        mean_b = cols.mean(axis=1)
+        m2_b = ((cols - mean_b[:, None]) ** 2).sum(axis=1)
+        n_a = self.count
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * (n_b / n)
+        self.m2 = self.m2 + m2_b + delta ** 2 * (n_a * n_b / n)
+        self.count = n
+        self.min = np.minimum(self.min, cols.min(axis=1))
+        self.max = np.maximum(self.max, cols.max(axis=1))
+        self.last = cols[:, -1]
+
+        if self.count >= self.num_points:
+            self.result = self._final_result()
+        else:
+            self.result = self._early_result()
+        return self.result
+
+    # --- 判定 ---
+    def _final_result(self):
+        stats = self.stats
+        if stats["centroid_dist"] > self.centroid_threshold:
+            self.fail_reason = "centroid"
+            return False
+        if stats["std_x"] < self.std_threshold or stats["std_y"] < self.std_threshold:
+            self.fail_reason = "std"
+            return False
+        if stats["range_x"] < self.range_threshold or stats["range_y"] < self.range_threshold:
+            self.fail_reason = "range"
+            return False
+        return True
+
+    def _early_result(self):
+        """残りの点の到達可能範囲から、合否が既に決まっているかを調べる"""
+        remaining = self.num_points - self.count
+        N = self.num_points
+        total = self.mean * self.count
+        sumsq = self.m2 + self.count * self.mean ** 2
+
+        mean_lo, mean_hi = np.zeros(2), np.zeros(2)
+        var_hi = np.zeros(2)
+        range_hi = np.zeros(2)
+        for axis in range(2):
+            pos = float(self.last[axis])
+            sum_lo, sum_hi, _, sumsq_hi = _reachable_sums(pos, self.distance, remaining)
+            mean_lo[axis] = (total[axis] + sum_lo) / N
+            mean_hi[axis] = (total[axis] + sum_hi) / N
+            # 分散の上限: 二乗和は最大、平均の二乗は最小として見積もる
+            min_mean_sq = 0.0 if mean_lo[axis] <= 0.0 <= mean_hi[axis] else min(mean_lo[axis] ** 2, mean_hi[axis] ** 2)
+            var_hi[axis] = (sumsq[axis] + sumsq_hi) / N - min_mean_sq
+            reach = self.distance * remaining
+            range_hi[axis] = max(self.max[axis], min(AREA_SIZE, pos + reach)) - min(self.min[axis], max(0.0, pos - reach))
+
+        # 重心: 最終的な重心が取りうる長方形と (5, 5) の最短距離
+        nearest = np.clip(5.0, mean_lo, mean_hi)
+        if np.linalg.norm(nearest - 5.0) > self.centroid_threshold + EPS:
+            self.fail_reason = "centroid"
+            return False
+        if np.any(range_hi < self.range_threshold - EPS):
+            self.fail_reason = "range"
+            return False
+        if np.any(var_hi < self.std_threshold ** 2 - EPS):
+            self.fail_reason = "std"
+            return False
+        return None
+
+    @property
+    def stats(self):
+        """これまでに受け取った点の統計量（is_valid_trajectory の stats と同じキー）"""
+        centroid = self.mean.copy()
+        std = np.sqrt(self.m2 / max(self.count, 1))
+        spread = self.max - self.min
+        return {
+            "centroid": centroid,
+            "centroid_dist": float(np.linalg.norm(centroid - 5.0)),
+            "std_x": float(std[0]),
+            "std_y": float(std[1]),
+            "range_x": float(spread[0]),
+            "range_y": float(spread[1]),
+            "points_checked": self.count,
+        }
+
+
+def check_trajectory(distance, num_points, mode="compat", rng=None, keep_points=False, early_exit=True,
+                     **thresholds):
+    """軌道を生成しながら判定し、(is_valid, stats, points) を返す
+
+    不合格が確定した時点で生成を打ち切る（early_exit=False なら最後まで生成する）。
+    keep_points=True のときは最後まで生成した軌道の (num_points, 2) 配列を points に入れる。
+    """
+    validator = StreamingValidator(num_points, distance, **thresholds)
+    chunks = []
+    pending = []
+    pending_count = 0
+    chunk_iter = iter_trajectory_chunks(distance, num_points, mode=mode, rng=rng)
+    try:
+        for chunk in chunk_iter:
+            if keep_points:
+                chunks.append(chunk)
+            pending.append(chunk)
+            pending_count += len(chunk)
+            if pending_count < CHECK_INTERVAL and validator.count + pending_count < num_points:
+                continue
+            result = validator.update(np.concatenate(pending))
+            pending, pending_count = [], 0
+            if result is False and early_exit:
+                break
+    finally:
+        # 打ち切った場合もここで乱数の状態が書き戻される
+        chunk_iter.close()
+
+    stats = validator.stats
+    stats["fail_reason"] = validator.fail_reason
+    is_valid = validator.result is True
+    completed = validator.count >= num_points
+    points = np.concatenate(chunks) if keep_points and completed else None
+    return is_valid, stats, points
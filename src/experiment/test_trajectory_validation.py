@@ -7,8 +7,12 @@
 import numpy as np
 import random
 import time
+import argparse
 from collections import defaultdict
 
+from streaming_validator import check_trajectory
+from trajectory_engine import generate_trajectory
+
 # --- 設定 ---
 NUM_TRIALS = 50  # 各条件で何回試行するか（高ポイント数は時間かかるので少なめ）
 MAX_ATTEMPTS = 100  # 1つの有効な軌道を得るための最大試行回数
@@ -17,22 +21,14 @@ MAX_ATTEMPTS = 100  # 1つの有効な軌道を得るための最大試行回数
 DISTANCES = [0.05]  # 問題のdistのみ検証
 NUM_POINTS_LIST = [10000, 50000, 100000, 200000]  # ポイント数を増やして検証
 
+# 棄却法(compat)と円弧サンプリング(arc)の比較条件: (dist, ポイント数, 試行回数)
+MODE_COMPARISON = [(0.05, 100000, 50), (4.0, 1000, 500)]
+STAT_KEYS = ["centroid_dist", "std_x", "std_y", "range_x", "range_y"]
+STREAMING_TRIALS = 20  # ストリーミング判定の比較で各ポイント数ごとに試すシード数
+
 def generate_points(distance, num_points=1000):
     """ランダムウォークでnum_points点の軌道を生成（centerは原点基準）"""
-    points = []
-    current_point = np.array([random.uniform(0.0, 10.0), random.uniform(0.0, 10.0), 0.0])
-    points.append(current_point.copy())
-    
-    for _ in range(num_points - 1):
-        while True:
-            angle = random.uniform(0, 2 * np.pi)
-            next_x = current_point[0] + distance * np.cos(angle)
-            next_y = current_point[1] + distance * np.sin(angle)
-            if 0.0 <= next_x <= 10.0 and 0.0 <= next_y <= 10.0:
-                current_point = np.array([next_x, next_y, 0.0])
-                points.append(current_point.copy())
-                break
-    return np.array(points)
+    return generate_trajectory(distance, num_points)
 
 
 def is_valid_trajectory(points, centroid_threshold=2.0, std_threshold=1.5, range_threshold=6.0):
@@ -132,5 +128,109 @@ def run_validation_test():
     print("=" * 70)
 
 
+def compare_sampling_modes(z_threshold=3.29):
+    """棄却法(compat)と円弧サンプリング(arc)で軌道の統計量の分布が一致するかを検定する
+
+    両者は同じマルコフ連鎖（実行可能な角度上の一様分布）なので、
+    is_valid_trajectory の各統計量の平均の差は誤差の範囲に収まるはず。
+    Welchのz値 |z| < z_threshold を「一致」とみなす。
+    (2条件 x 5統計量の10検定をまとめるので、全体で有意水準1%になるようBonferroni補正した値)
+    """
+    print("=" * 70)
+    print("棄却法と円弧サンプリングの比較")
+    print("=" * 70)
+
+    # 結果が毎回同じになるよう両方の乱数を固定する
+    random.seed(0)
+    arc_rng = np.random.default_rng(0)
+    all_match = True
+    for dist, num_points, num_trials in MODE_COMPARISON:
+        print(f"\n--- dist = {dist} mm, points = {num_points}, trials = {num_trials} ---")
+
+        stats_by_mode = {}
+        for mode in ["compat", "arc"]:
+            start_time = time.time()
+            stats_list = []
+            for _ in range(num_trials):
+                if mode == "compat":
+                    trajectory = generate_points(dist, num_points)
+                else:
+                    trajectory = generate_trajectory(dist, num_points, mode="arc", rng=arc_rng)
+                _, stats = is_valid_trajectory(trajectory)
+                stats_list.append(stats)
+            elapsed_time = time.time() - start_time
+            valid_rate = np.mean([s["is_valid"] for s in stats_list]) * 100
+            print(f"{mode:>6}: 成功率 {valid_rate:5.1f}%, 1軌道あたり {elapsed_time / num_trials * 1000:.2f}ms")
+            stats_by_mode[mode] = {key: np.array([s[key] for s in stats_list]) for key in STAT_KEYS}
+
+        for key in STAT_KEYS:
+            a = stats_by_mode["compat"][key]
+            b = stats_by_mode["arc"][key]
+            se = np.sqrt(a.var(ddof=1) / len(a) + b.var(ddof=1) / len(b))
+            z = (a.mean() - b.mean()) / se if se > 0 else 0.0
+            match = abs(z) < z_threshold
+            all_match &= match
+            print(f"  {key:>13}: compat={a.mean():.3f}±{a.std():.3f}, arc={b.mean():.3f}±{b.std():.3f}, "
+                  f"z={z:+.2f} {'OK' if match else 'DIFF'}")
+
+    print("\n" + ("全統計量が一致" if all_match else "一致しない統計量あり"))
+    return all_match
+
+
+def compare_streaming_validation():
+    """全点生成してから判定する場合と、生成しながら判定する場合の時間を比較する
+
+    同じシードで両方を実行し、合否が一致すること・実際に生成した点数・所要時間を表示する。
+    """
+    print("=" * 70)
+    print("ストリーミング判定 (早期打ち切り) の比較")
+    print("=" * 70)
+
+    all_match = True
+    for dist in DISTANCES:
+        for num_points in NUM_POINTS_LIST:
+            full_time = stream_time = 0.0
+            points_generated = 0
+            mismatches = 0
+            early_exits = 0
+            for seed in range(STREAMING_TRIALS):
+                random.seed(seed)
+                start_time = time.perf_counter()
+                full_valid, _ = is_valid_trajectory(generate_points(dist, num_points))
+                full_time += time.perf_counter() - start_time
+
+                random.seed(seed)
+                start_time = time.perf_counter()
+                stream_valid, stats, _ = check_trajectory(dist, num_points)
+                stream_time += time.perf_counter() - start_time
+
+                mismatches += full_valid != stream_valid
+                points_generated += stats["points_checked"]
+                early_exits += stats["points_checked"] < num_points
+
+            all_match &= mismatches == 0
+            print(f"\n--- dist = {dist} mm, points = {num_points}, trials = {STREAMING_TRIALS} ---")
+            print(f"全点生成:     1軌道あたり {full_time / STREAMING_TRIALS * 1000:8.2f}ms")
+            print(f"ストリーミング: 1軌道あたり {stream_time / STREAMING_TRIALS * 1000:8.2f}ms "
+                  f"(x{full_time / stream_time:.2f}), 平均生成点数 {points_generated / STREAMING_TRIALS:,.0f}, "
+                  f"打ち切り {early_exits}/{STREAMING_TRIALS}")
+            print(f"合否の不一致: {mismatches}")
+
+    print("\n" + ("全試行で合否が一致" if all_match else "合否が一致しない試行あり"))
+    return all_match
+
+
 if __name__ == "__main__":
-    run_validation_test()
+    parser = argparse.ArgumentParser(description="Trajectory validation checks")
+    parser.add_argument("--compare-modes", action="store_true",
+                        help="Compare coverage stats of the rejection and arc samplers")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Compare full validation with the early-exit streaming validator")
+    args = parser.parse_args()
+
+    if args.compare_modes:
+        compare_sampling_modes()
+    elif args.streaming:
+        compare_streaming_validation()
+    else:
+        run_validation_test()
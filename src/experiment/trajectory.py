@@ -0,0 +1,65 @@
+"""
+軌道を1本の配列として持つ Trajectory クラス
+
+従来の generate_points は center + 点 の3要素 ndarray を点の数だけ並べたリストを返していて、
+100000点の軌道ではオブジェクトのオーバーヘッドがデータ本体の20倍ほどになっていた。
+Trajectory は中心からの相対座標 (N, 2) float32 を連続した配列1つと中心ベクトルだけを持ち、
+FociSTM に渡すときだけ絶対座標 (N, 3) を作る。
+"""
+
+import numpy as np
+
+
+class Trajectory:
+    """相対座標 (N, 2) float32 と中心 (3,) からなる軌道
+
+    offsets / x / y はコピーしないビューなので、描画や統計量の計算にそのまま使える。
+    スライスすると同じ配列を参照する Trajectory を返す。
+    """
+
+    __slots__ = ("offsets", "center")
+
+    def __init__(self, offsets, center=None):
+        offsets = np.asarray(offsets, dtype=np.float32)
+        if offsets.ndim != 2 or offsets.shape[1] != 2:
+            raise ValueError(f"offsets must have shape (N, 2), got {offsets.shape}")
+        self.offsets = offsets
+        self.center = np.zeros(3) if center is None else np.asarray(center, dtype=float)
+
+    @classmethod
+    def from_points(cls, points, center=None):
+        """(N, 2) または (N, 3) の相対座標から作る（3列目の z は使わない）"""
+        return cls(np.asarray(points)[:, :2], center)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Trajectory(self.offsets[index], self.center)
+        # 1点だけ取り出すときは絶対座標を返す
+        x, y = self.offsets[index]
+        return self.center + np.array([x, y, 0.0])
+
+    def __repr__(self):
+        return f"Trajectory(num_points={len(self)}, center={self.center.tolist()})"
+
+    @property
+    def x(self):
+        return self.offsets[:, 0]
+
+    @property
+    def y(self):
+        return self.offsets[:, 1]
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.center.nbytes
+
+    def to_foci(self):
+        """FociSTM に渡す絶対座標 (N, 3) を作る（呼ぶたびに新しい配列を確保する）"""
+        foci = np.empty((len(self), 3))
+        foci[:, :2] = self.offsets
+        foci[:, 2] = 0.0
+        foci += self.center
+        return foci
@@ -0,0 +1,99 @@
+"""
+生成済みの軌道をディスクに保存して再利用するキャッシュ
+
+random_walk_circle.py は起動のたびに stimuli_seeds.json の18軌道（うち9本は100000点）を
+作り直していた。ここでは軌道を .npy として保存し、次回からは mmap で開くだけにする。
+
+キーは (seed, dist, num_points, GENERATOR_VERSION, mode, center) のハッシュで、
+同じ名前の .json にキーの中身と生成直後の random の状態を保存する。
+キーが一致しない・ファイルが壊れている場合は作り直す。
+"""
+
+import hashlib
+import json
+import os
+import random
+
+import numpy as np
+
+from trajectory_engine import GENERATOR_VERSION, generate_trajectory
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "trajectory_cache")
+
+
+def cache_key(seed, distance, num_points, mode="compat", center=None):
+    """キャッシュのキー（json に保存して読み込み時に照合する）"""
+    return {
+        "seed": int(seed),
+        "dist": float(distance),
+        "num_points": int(num_points),
+        "generator_version": GENERATOR_VERSION,
+        "mode": mode,
+        "center": None if center is None else [float(c) for c in center],
+    }
+
+
+def _key_hash(key):
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _read_entry(npy_path, meta_path, key):
+    """キーが一致するエントリを mmap で開く。使えない場合は None"""
+    try:
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if meta.get("key") != key:
+            return None, None
+        trajectory = np.load(npy_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None, None
+    if trajectory.shape != (key["num_points"], 3):
+        return None, None
+    return trajectory, meta
+
+
+def _write_atomic(path, write):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def load_trajectory(seed, distance, num_points, center=None, mode="compat", cache_dir=CACHE_DIR):
+    """シード値の軌道を (num_points, 3) の読み取り専用 memmap で返す
+
+    random.seed(seed) / np.random.seed(seed) をしてから生成するのと同じ扱いで、
+    キャッシュから読んだ場合も random の状態は生成直後の状態に戻す
+    （その後の random.randint による色などが再生成した場合と一致する）。
+    """
+    key = cache_key(seed, distance, num_points, mode, center)
+    name = _key_hash(key)
+    npy_path = os.path.join(cache_dir, name + ".npy")
+    meta_path = os.path.join(cache_dir, name + ".json")
+
+    random.seed(seed)
+    np.random.seed(seed)
+    trajectory, meta = _read_entry(npy_path, meta_path, key)
+    if trajectory is not None:
+        version, state, gauss = meta["random_state"]
+        random.setstate((version, tuple(state), gauss))
+        return trajectory
+
+    rng = None if mode == "compat" else seed
+    trajectory = generate_trajectory(distance, num_points, center=center, mode=mode, rng=rng)
+    version, state, gauss = random.getstate()
+    meta = {"key": key, "random_state": [version, list(state), gauss]}
+
+    os.makedirs(cache_dir, exist_ok=True)
+    _write_atomic(npy_path, lambda f: np.save(f, trajectory))
+    _write_atomic(meta_path, lambda f: f.write(json.dumps(meta).encode()))
+    return np.load(npy_path, mmap_mode="r")
+
+
+def clear_cache(cache_dir=CACHE_DIR):
+    """キャッシュのファイルをすべて削除する"""
+    if not os.path.isdir(cache_dir):
+        return
+    for filename in os.listdir(cache_dir):
+        if filename.endswith((".npy", ".json")):
+            os.remove(os.path.join(cache_dir, filename))
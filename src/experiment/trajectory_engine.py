@@ -0,0 +1,334 @@
+"""
+ランダムウォーク軌道を生成する共通エンジン
+
+これまで各スクリプトにあった generate_points は1ステップずつPythonループで
+軌道を作っていたため、dist=0.05 (100000点) の刺激では生成に時間がかかっていた。
+ここではステップをチャンク単位でまとめてNumPyで計算する。
+
+mode:
+    "compat" : random モジュールの乱数列をそのまま使う。従来の generate_points と
+               ビット単位で同じ軌道を返し、生成後の random の状態も同じになる
+               （stimuli_seeds.json のシード値と色の乱数がそのまま再現される）
+    "numpy"  : numpy.random.Generator を使う版（乱数列は従来と異なる）
+    "arc"    : 棄却を使わず、半径 dist の円と正方形が交わる「実行可能な円弧」から
+               直接角度を引く版。1ステップにつき乱数1個で、棄却法と同じ分布になる
+"""
+
+import math
+import random
+
+import numpy as np
+
+# 軌道を収める正方形の一辺 (mm)
+AREA_SIZE = 10.0
+# 1回にまとめて引く乱数の数
+CHUNK_SIZE = 4096
+# 棄却が起きた後に試すステップ数の下限
+MIN_WINDOW = 8
+# 受理が続く長さがこれより短い間はスカラーで処理する
+SCALAR_WINDOW = 32
+
+MODES = ("compat", "numpy", "arc")
+# 生成結果が変わる変更を入れたら上げる（trajectory_cache のキャッシュが無効になる）
+GENERATOR_VERSION = 1
+TWO_PI = 2 * np.pi
+
+
+# --- 乱数源 ---
+class _CompatSource:
+    """random.Random の状態を NumPy の MT19937 に写して一括で乱数を引く
+
+    random.random() と RandomState.random_sample() は同じ53bitの変換を使うため、
+    同じ状態から引けば同じ値の列になる。
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self._state = rng.getstate()
+        self._rs = self._legacy_from_state(self._state)
+        self.used = 0
+
+    @staticmethod
+    def _legacy_from_state(state):
+        rs = np.random.RandomState()
+        key = np.array(state[1][:-1], dtype=np.uint32)
+        rs.set_state(("MT19937", key, state[1][-1]))
+        return rs
+
+    def draw(self, n):
+        return self._rs.random_sample(n)
+
+    def consume(self, n):
+        self.used += n
+
+    def sync(self):
+        """実際に使った分だけ進めた状態を random.Random 側に書き戻す"""
+        rs = self._legacy_from_state(self._state)
+        remaining = self.used
+        while remaining > 0:
+            n = min(remaining, 1 << 16)
+            rs.random_sample(n)
+            remaining -= n
+        _, key, pos = rs.get_state()[:3]
+        self.rng.setstate((self._state[0], tuple(int(k) for k in key) + (int(pos),), self._state[2]))
+
+
+class _NumpySource:
+    """numpy.random.Generator から一括で乱数を引く"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.used = 0
+
+    def draw(self, n):
+        return self.rng.random(n)
+
+    def consume(self, n):
+        self.used += n
+
+    def sync(self):
+        pass
+
+
+def _make_source(mode, rng):
+    if mode == "compat":
+        if rng is None:
+            rng = random._inst  # random.seed() で設定されるモジュール共通の状態
+        elif not isinstance(rng, random.Random):
+            rng = random.Random(rng)
+        return _CompatSource(rng)
+    if mode in ("numpy", "arc"):
+        if not isinstance(rng, np.random.Generator):
+            rng = np.random.default_rng(rng)
+        return _NumpySource(rng)
+    raise ValueError(f"Unknown trajectory mode: {mode} (expected one of {MODES})")
+
+
+# --- 軌道生成 ---
+def _rejection_walk(source, distance, num_points):
+    """棄却法のランダムウォークをチャンク単位で進め、新しい点 (k, 2) を順に返す
+
+    1ステップずつの処理と同じ順序で座標を足し合わせるため、
+    各点の値は従来のループと完全に一致する。
+    棄却が続く区間（壁際や dist が大きい場合）はスカラーで1ステップずつ処理する。
+    """
+    start = AREA_SIZE * source.draw(2)
+    source.consume(2)
+    x, y = float(start[0]), float(start[1])
+    yield np.array([[x, y]])
+
+    filled = 1
+    window = SCALAR_WINDOW
+    while filled < num_points:
+        angles = TWO_PI * source.draw(CHUNK_SIZE)
+        dx = distance * np.cos(angles)
+        dy = distance * np.sin(angles)
+        dx_list = dy_list = None
+
+        i = 0
+        consumed = 0  # このチャンクで実際に使った乱数の数
+        try:
+            while i < CHUNK_SIZE and filled < num_points:
+                if window < SCALAR_WINDOW:
+                    # --- スカラー処理: 連続して SCALAR_WINDOW 回受理されたらベクトル処理に戻る ---
+                    if dx_list is None:
+                        dx_list, dy_list = dx.tolist(), dy.tolist()
+                    xs, ys = [], []
+                    last = i
+                    run = 0
+                    while i < CHUNK_SIZE and filled + len(xs) < num_points and run < SCALAR_WINDOW:
+                        next_x = x + dx_list[i]
+                        next_y = y + dy_list[i]
+                        i += 1
+                        if 0.0 <= next_x <= AREA_SIZE and 0.0 <= next_y <= AREA_SIZE:
+                            x, y = next_x, next_y
+                            xs.append(x)
+                            ys.append(y)
+                            last = i
+                            run += 1
+                        else:
+                            run = 0
+                    if run >= SCALAR_WINDOW:
+                        window = SCALAR_WINDOW * 2
+                    if xs:
+                        filled += len(xs)
+                        consumed = last
+                        yield np.column_stack((xs, ys))
+                    consumed = i
+                    continue
+
+                # --- ベクトル処理: 棄却されるまでのステップをまとめて受理する ---
+                j = min(CHUNK_SIZE, i + min(window, num_points - filled))
+                # cumsum は先頭から順に足すので、逐次計算と同じ丸めになる
+                xs = np.cumsum(np.concatenate(([x], dx[i:j])))[1:]
+                ys = np.cumsum(np.concatenate(([y], dy[i:j])))[1:]
+                bad = np.flatnonzero((xs < 0.0) | (xs > AREA_SIZE) | (ys < 0.0) | (ys > AREA_SIZE))
+
+                if len(bad) == 0:
+                    accepted, rejected = j - i, 0
+                    window = min(CHUNK_SIZE, window * 2)
+                else:
+                    accepted, rejected = int(bad[0]), 1
+                    window = max(MIN_WINDOW, accepted * 2)
+
+                i += accepted
+                consumed = i
+                if accepted > 0:
+                    x, y = float(xs[accepted - 1]), float(ys[accepted - 1])
+                    filled += accepted
+                    yield np.column_stack((xs[:accepted], ys[:accepted]))
+                # 棄却された角度も乱数を1つ消費している
+                i += rejected
+                consumed = i
+        finally:
+            source.consume(consumed)
+
+
+def _feasible_arcs(x, y, distance):
+    """(x, y) から半径 distance で正方形内に収まる角度の区間 [(start, end), ...] を返す
+
+    各壁について、はみ出す角度は壁の法線方向を中心とする幅 2*acos(壁までの距離/distance)
+    の円弧になる。その和集合を [0, 2π) から除いた残りが実行可能な円弧。
+    """
+    excluded = []
+    for center_angle, gap in ((math.pi, x), (0.0, AREA_SIZE - x),
+                              (1.5 * math.pi, y), (0.5 * math.pi, AREA_SIZE - y)):
+        if gap < distance:
+            half = math.acos(max(gap, 0.0) / distance)
+            start = (center_angle - half) % TWO_PI
+            end = start + 2 * half
+            # 0 をまたぐ区間は2つに分ける
+            if end > TWO_PI:
+                excluded.append((start, TWO_PI))
+                excluded.append((0.0, end - TWO_PI))
+            else:
+                excluded.append((start, end))
+    if not excluded:
+        return [(0.0, TWO_PI)]
+
+    excluded.sort()
+    feasible = []
+    cursor = 0.0
+    for start, end in excluded:
+        if start > cursor:
+            feasible.append((cursor, start))
+        cursor = max(cursor, end)
+    if cursor < TWO_PI:
+        feasible.append((cursor, TWO_PI))
+    return feasible
+
+
+def _arc_step(x, y, distance, u):
+    """一様乱数 u を実行可能な円弧上の角度に写して1ステップ進める"""
+    arcs = _feasible_arcs(x, y, distance)
+    total = sum(end - start for start, end in arcs)
+    if total <= 0.0:
+        raise ValueError(f"No feasible step of length {distance} from ({x}, {y})")
+
+    t = u * total
+    angle = arcs[-1][1]
+    for start, end in arcs:
+        if t < end - start:
+            angle = start + t
+            break
+        t -= end - start
+    # 境界上の点は丸め誤差で僅かにはみ出すことがあるので正方形内に収める
+    next_x = min(max(x + distance * math.cos(angle), 0.0), AREA_SIZE)
+    next_y = min(max(y + distance * math.sin(angle), 0.0), AREA_SIZE)
+    return next_x, next_y
+
+
+def _arc_walk(source, distance, num_points):
+    """実行可能な円弧から角度を引くランダムウォーク（1ステップにつき乱数1個）
+
+    どの壁からも distance 以上離れている間は円全体が実行可能なので、
+    その区間はまとめてベクトル計算し、壁際のステップだけスカラーで処理する。
+    """
+    start = AREA_SIZE * source.draw(2)
+    source.consume(2)
+    x, y = float(start[0]), float(start[1])
+    yield np.array([[x, y]])
+
+    low, high = distance, AREA_SIZE - distance
+    filled = 1
+    while filled < num_points:
+        n = min(CHUNK_SIZE, num_points - filled)
+        u = source.draw(n)
+        source.consume(n)
+        angles = TWO_PI * u
+        dx = distance * np.cos(angles)
+        dy = distance * np.sin(angles)
+        xs = np.empty(n)
+        ys = np.empty(n)
+
+        i = 0
+        window = SCALAR_WINDOW
+        while i < n:
+            if low <= x <= high and low <= y <= high:
+                # 円全体が実行可能: 壁際に出るまでまとめて進める
+                j = min(n, i + window)
+                cx = x + np.cumsum(dx[i:j])
+                cy = y + np.cumsum(dy[i:j])
+                outside = np.flatnonzero((cx < low) | (cx > high) | (cy < low) | (cy > high))
+                if len(outside) == 0:
+                    k = j - i
+                    window = min(CHUNK_SIZE, window * 2)
+                else:
+                    k = int(outside[0]) + 1
+                    window = SCALAR_WINDOW
+                xs[i:i + k] = cx[:k]
+                ys[i:i + k] = cy[:k]
+                x, y = float(cx[k - 1]), float(cy[k - 1])
+                i += k
+            else:
+                x, y = _arc_step(x, y, distance, float(u[i]))
+                xs[i] = x
+                ys[i] = y
+                i += 1
+
+        filled += n
+        yield np.column_stack((xs, ys))
+
+
+def iter_trajectory_chunks(distance, num_points=1000, mode="compat", rng=None):
+    """軌道を (k, 2) のチャンクとして順に返すジェネレータ（中心を足す前の相対座標）
+
+    途中で打ち切った場合も、compat モードでは生成済みの分だけ random の状態が進む。
+    """
+    source = _make_source(mode, rng)
+    walk = _arc_walk if mode == "arc" else _rejection_walk
+    try:
+        yield from walk(source, distance, num_points)
+    finally:
+        source.sync()
+
+
+def generate_trajectory(distance, num_points=1000, center=None, mode="compat", rng=None):
+    """num_points 点の軌道を (num_points, 3) の配列で返す
+
+    center を指定した場合は center + [x, y, 0] の絶対座標になる。
+    rng は compat モードでは random.Random（None ならモジュール共通の random）、
+    numpy / arc モードでは numpy.random.Generator かシード値。
+    """
+    points = np.zeros((num_points, 3))
+    filled = 0
+    for chunk in iter_trajectory_chunks(distance, num_points, mode=mode, rng=rng):
+        points[filled:filled + len(chunk), :2] = chunk
+        filled += len(chunk)
+    if center is not None:
+        points = np.asarray(center, dtype=float) + points
+    return points
+
+
+def generate_trajectories(distance, num_points, seeds, center=None, mode="compat"):
+    """候補軌道をまとめて生成し (len(seeds), num_points, 3) の配列で返す
+
+    compat モードでは各シードについて random.seed(seed) した直後と同じ軌道になる。
+    """
+    batch = np.zeros((len(seeds), num_points, 3))
+    for b, seed in enumerate(seeds):
+        rng = random.Random(seed) if mode == "compat" else np.random.default_rng(seed)
+        batch[b] = generate_trajectory(distance, num_points, mode=mode, rng=rng)
+    if center is not None:
+        batch += np.asarray(center, dtype=float)
+    return batch
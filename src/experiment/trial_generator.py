@@ -0,0 +1,273 @@
+"""
+全ペアを網羅するトライアルリストを作る共通モジュール
+
+これまで各スクリプトにあった GreedyTrialGenerator は、トライアルを1つ作るたびに
+itertools.combinations で全ペアを走査し、候補の評価も tuple(sorted(...)) の辞書引きで
+行っていたため、N=18 では問題ないが 100〜300 刺激では使えなかった。
+ここではペアの提示回数を N×N の行列で持ち、候補ごとの「新しく埋まるペア数」を
+行の足し合わせで一度に計算する。
+random の呼び出し順と引数は従来と同じなので、同じシードからは同じトライアルリストになる。
+"""
+
+import random
+from collections import Counter
+
+import numpy as np
+
+BALANCE_ITERATIONS = 20000  # BalancedTrialGenerator で試す入れ替えの回数
+APPEARANCE_WEIGHT = 1.0  # 出現回数のばらつきを、ペアの回数のばらつきに対してどれだけ重視するか
+
+
+def required_pairs(num_items, anchor_items=None):
+    """網羅が必要なペアの対称マスク（アンカー2個のときのアンカー同士は毎回出るので除く）"""
+    required = ~np.eye(num_items, dtype=bool)
+    anchors = sorted(set(anchor_items)) if anchor_items else []
+    if len(anchors) == 2:
+        a, b = anchors
+        required[a, b] = required[b, a] = False
+    return required
+
+
+def pair_count_matrix(trials, num_items):
+    """各ペアの提示回数の対称行列"""
+    counts = np.zeros((num_items, num_items), dtype=np.int32)
+    for trial in trials:
+        idx = np.asarray(trial)
+        counts[np.ix_(idx, idx)] += 1
+    np.fill_diagonal(counts, 0)
+    return counts
+
+
+class GreedyTrialGenerator:
+    """全ペアを網羅するまでgreedyにトライアルを作る（anchor_items は毎回含む）
+
+    pair_counts[i, j] は生成後の各ペアの提示回数（対称行列）。
+    rng は random.Random（None ならモジュール共通の random）。
+    """
+
+    def __init__(self, num_items, items_per_trial, anchor_items=None, verbose=True, rng=None):
+        self.num_items = num_items
+        self.items_per_trial = items_per_trial
+        self.anchor_items = set(anchor_items) if anchor_items else set()
+        self.verbose = verbose
+        self.rng = rng if rng is not None else random
+        self.trials = []
+        self.pair_counts = np.zeros((num_items, num_items), dtype=np.int32)
+        self._generate()
+
+    def _generate(self):
+        """全ペアを網羅するまでgreedyにリストを作成（アンカーは毎回含む）"""
+        n = self.num_items
+        non_anchor_items = [i for i in range(n) if i not in self.anchor_items]
+
+        # uncovered[i, j]: まだ一度も出ていないペア（対称、対角は False）
+        uncovered = np.ones((n, n), dtype=bool)
+        np.fill_diagonal(uncovered, False)
+        # アンカー同士のペアは毎回出るので未カバーの候補から除外する
+        if len(self.anchor_items) == 2:
+            a, b = sorted(self.anchor_items)
+            uncovered[a, b] = uncovered[b, a] = False
+        # 行 i の未カバーペア (i, j>i) の数。combinations の順で r 番目のペアを引くのに使う
+        row_missing = np.triu(uncovered).sum(axis=1)
+
+        if self.verbose:
+            print(f"Generating trials for {n} items, {self.items_per_trial} per trial...")
+            if self.anchor_items:
+                print(f"Anchor items: {self.anchor_items} (included in every trial)")
+
+        while True:
+            num_missing = int(row_missing.sum())
+            if num_missing == 0:
+                break
+
+            # 毎回アンカーから開始
+            current_trial_items = set(self.anchor_items)
+
+            # 不足ペアから1つ選んで核にする（従来の random.choice(missing_pairs) と同じ乱数の使い方）
+            target_pair = self._missing_pair(uncovered, row_missing, self.rng.choice(range(num_missing)))
+            for item in target_pair:
+                if item not in self.anchor_items and len(current_trial_items) < self.items_per_trial:
+                    current_trial_items.add(item)
+
+            # gain[c]: 候補 c を加えたときに新しく埋まるペアの数
+            gain = uncovered[list(current_trial_items)].sum(axis=0, dtype=np.int32)
+
+            # 残り枠をGreedyで埋める
+            while len(current_trial_items) < self.items_per_trial:
+                candidates = [i for i in non_anchor_items if i not in current_trial_items]
+                if not candidates:
+                    break
+                self.rng.shuffle(candidates)
+
+                # argmax は最初の最大値を返すので、シャッフル順で最初に見つかった最良候補と一致する
+                best_candidate = candidates[int(np.argmax(gain[candidates]))]
+                current_trial_items.add(best_candidate)
+                gain += uncovered[best_candidate]
+
+            # 記録
+            trial_list = list(current_trial_items)
+            self.trials.append(trial_list)
+
+            idx = np.array(trial_list)
+            block = np.ix_(idx, idx)
+            self.pair_counts[block] += 1
+            self.pair_counts[idx, idx] -= 1  # 対角（自分自身）は数えない
+            newly = np.triu(uncovered[np.ix_(np.sort(idx), np.sort(idx))])
+            row_missing[np.sort(idx)] -= newly.sum(axis=1)
+            uncovered[block] = False
+
+        if self.verbose:
+            print(f"Generated {len(self.trials)} trials to cover all pairs.")
+
+    @staticmethod
+    def _missing_pair(uncovered, row_missing, r):
+        """combinations の順に並べた未カバーペアのうち r 番目を返す"""
+        cum = np.cumsum(row_missing)
+        i = int(np.searchsorted(cum, r, side="right"))
+        offset = r - (int(cum[i - 1]) if i > 0 else 0)
+        j = i + 1 + int(np.flatnonzero(uncovered[i, i + 1:])[offset])
+        return i, j
+
+
+class BalancedTrialGenerator:
+    """各ペアを coverage 回以上提示し、ペアと刺激の提示回数をなるべく揃えたトライアルを作る
+
+    GreedyTrialGenerator は全ペアが1回出た時点で止まるため、1回しか出ないペアと
+    何回も出るペアが混在し、RDM の精度がペアごとにばらつく。
+    ここでは不足回数の多いペアを優先する greedy で全ペアを coverage 回以上にしたあと、
+    トライアル数を変えずに要素を入れ替えて、アンカー以外の刺激同士のペアの提示回数と
+    刺激の出現回数の二乗和（= 分散）を減らす。アンカーは GreedyTrialGenerator と同じく毎回含む。
+    """
+
+    def __init__(self, num_items, items_per_trial, coverage=3, anchor_items=None, verbose=True, rng=None,
+                 iterations=BALANCE_ITERATIONS):
+        self.num_items = num_items
+        self.items_per_trial = items_per_trial
+        self.coverage = coverage
+        self.anchor_items = set(anchor_items) if anchor_items else set()
+        self.verbose = verbose
+        self.rng = rng if rng is not None else random
+        self.iterations = iterations
+        self.required = required_pairs(num_items, self.anchor_items)
+        self.free_items = [i for i in range(num_items) if i not in self.anchor_items]
+        self.trials = []
+        self.pair_counts = np.zeros((num_items, num_items), dtype=np.int32)
+        if self.verbose:
+            print(f"Generating balanced trials for {num_items} items, {items_per_trial} per trial, "
+                  f"each pair at least {coverage} times...")
+            if self.anchor_items:
+                print(f"Anchor items: {self.anchor_items} (included in every trial)")
+        self._generate()
+        self._balance()
+        if self.verbose:
+            print(self.summary())
+
+    def _add_trial(self, trial):
+        idx = np.array(trial)
+        self.pair_counts[np.ix_(idx, idx)] += 1
+        self.pair_counts[idx, idx] -= 1
+        self.trials.append(trial)
+
+    def _generate(self):
+        """不足回数の多いペアから順に、不足を最も多く埋める刺激でトライアルを作る"""
+        r = self.coverage
+        required = self.required
+        while True:
+            deficit = np.where(required, np.maximum(r - self.pair_counts, 0), 0)
+            if not deficit.any():
+                break
+            appearances = self.appearances()
+
+            trial = sorted(self.anchor_items)
+            # 不足回数が最大のペアを核にする
+            i, j = np.nonzero(np.triu(deficit == deficit.max()))
+            k = self.rng.randrange(len(i))
+            for item in (int(i[k]), int(j[k])):
+                if item not in self.anchor_items and item not in trial and len(trial) < self.items_per_trial:
+                    trial.append(item)
+
+            while len(trial) < self.items_per_trial:
+                candidates = [c for c in self.free_items if c not in trial]
+                if not candidates:
+                    break
+                self.rng.shuffle(candidates)
+                members = np.array(trial)
+                cols = np.ix_(candidates, members)
+                # 埋まる不足回数を最優先し、既に足りているペアを増やすこと・出現回数が多いことを減点する
+                filled = deficit[cols].sum(axis=1)
+                over = (required[cols] & (self.pair_counts[cols] >= r)).sum(axis=1)
+                score = filled - 0.5 * over - 0.1 * (appearances[candidates] - appearances.min())
+                trial.append(candidates[int(np.argmax(score))])
+
+            self._add_trial(trial)
+
+    def _balance(self):
+        """トライアル数を保ったまま、入れ替えで提示回数のばらつきを減らす
+
+        各ペアが coverage 回を下回る入れ替えはしない。
+        """
+        r = self.coverage
+        counts = self.pair_counts
+        free = np.zeros(self.num_items, dtype=bool)
+        free[self.free_items] = True
+        appearances = self.appearances()
+        trials = [np.array(t) for t in self.trials]
+        free_slots = [np.flatnonzero(free[t]) for t in trials]
+        if len(self.free_items) <= self.items_per_trial - len(self.anchor_items):
+            return
+
+        for _ in range(self.iterations):
+            t = self.rng.randrange(len(trials))
+            row = trials[t]
+            p = int(free_slots[t][self.rng.randrange(len(free_slots[t]))])
+            x = int(row[p])
+            y = self.free_items[self.rng.randrange(len(self.free_items))]
+            if y in row:
+                continue
+            others = np.delete(row, p)
+            # x を抜くと coverage を下回るペアがあれば不可
+            if np.any(self.required[x, others] & (counts[x, others] <= r)):
+                continue
+            # アンカー以外同士のペアの回数の二乗和と、出現回数の二乗和の増減
+            of = free[others]
+            delta = int((2 * (counts[y, others][of] - counts[x, others][of]) + 2).sum())
+            delta += APPEARANCE_WEIGHT * (2 * (appearances[y] - appearances[x]) + 2)
+            if delta > 0:
+                continue
+            counts[x, others] -= 1
+            counts[others, x] -= 1
+            counts[y, others] += 1
+            counts[others, y] += 1
+            appearances[x] -= 1
+            appearances[y] += 1
+            row[p] = y
+
+        self.trials = [[int(i) for i in t] for t in trials]
+
+    def appearances(self):
+        """各刺激がトライアルに出てくる回数"""
+        counts = np.zeros(self.num_items, dtype=np.int64)
+        for trial in self.trials:
+            counts[trial] += 1
+        return counts
+
+    def free_pair_counts(self):
+        """アンカー以外の刺激同士のペアの提示回数（アンカーとのペアの回数は出現回数と同じ）"""
+        free = np.zeros(self.num_items, dtype=bool)
+        free[self.free_items] = True
+        return self.pair_counts[np.triu(np.outer(free, free) & self.required)]
+
+    def histogram(self):
+        """提示回数ごとのペア数 {回数: ペア数}（アンカー以外の刺激同士のペア）"""
+        return dict(sorted(Counter(int(v) for v in self.free_pair_counts()).items()))
+
+    def summary(self):
+        """ペアの提示回数のヒストグラムと、ペア・刺激の提示回数のばらつきを表す文字列"""
+        free_pairs = self.free_pair_counts()
+        item_counts = self.appearances()[self.free_items]
+        hist = ", ".join(f"{count}x: {num}" for count, num in self.histogram().items())
+        return (f"Generated {len(self.trials)} trials (each pair at least {self.coverage} times).\n"
+                f"  Pair count histogram (non-anchor): {hist}\n"
+                f"  Pair counts (non-anchor): mean {free_pairs.mean():.2f}, var {free_pairs.var():.3f}\n"
+                f"  Item appearances (non-anchor): min {item_counts.min()}, max {item_counts.max()}, "
+                f"var {item_counts.var():.3f}")
@@ -2,34 +2,16 @@
 シード値から生成される全18刺激の軌道を可視化するスクリプト
 """
 
-import numpy as np
-import random
 import json
 import os
 import matplotlib.pyplot as plt
 
+from stimulus_rng import reproduce_stimulus
+
 # シード値ファイルのパス
 SEEDS_FILE = os.path.join(os.path.dirname(__file__), "stimuli_seeds.json")
 
 
-def generate_points(distance, num_points=1000):
-    """ランダムウォークでnum_points点の軌道を生成"""
-    points = []
-    current_point = np.array([random.uniform(0.0, 10.0), random.uniform(0.0, 10.0)])
-    points.append(current_point.copy())
-    
-    for _ in range(num_points - 1):
-        while True:
-            angle = random.uniform(0, 2 * np.pi)
-            next_x = current_point[0] + distance * np.cos(angle)
-            next_y = current_point[1] + distance * np.sin(angle)
-            if 0.0 <= next_x <= 10.0 and 0.0 <= next_y <= 10.0:
-                current_point = np.array([next_x, next_y])
-                points.append(current_point.copy())
-                break
-    return np.array(points)
-
-
 def visualize_all_stimuli():
     """全18刺激の軌道を可視化"""
     # シード値を読み込む
@@ -37,6 +19,7 @@ def visualize_all_stimuli():
         seeds_data = json.load(f)
     
     stimuli = seeds_data["stimuli"]
+    mode = seeds_data.get("mode", "compat")
     
     # 6列×3行のグリッドで表示（dist=0.05が上半分、dist=4.0が下半分）
     fig, axes = plt.subplots(2, 9, figsize=(20, 6))
@@ -47,13 +30,11 @@ def visualize_all_stimuli():
         dist = stim["dist"]
         velo = stim["velo"]
         am = stim["am_freq"]
-        seed = stim["seed"]
         
-        # シードを設定して軌道生成
-        random.seed(seed)
-        np.random.seed(seed)
+        # シード値（またはストリーム）から軌道を再現（キャッシュがあれば mmap で開くだけ）
         num_points = 100000 if dist < 1.0 else 1000
-        trajectory = generate_points(dist, num_points)
+        trajectory, _ = reproduce_stimulus(seeds_data, stim, num_points, mode)
+        trajectory = trajectory[:, :2]
         
         # プロット位置を決定
         row = 0 if dist < 1.0 else 1
@@ -3,10 +3,12 @@
 """
 
 import numpy as np
-import random
 import matplotlib.pyplot as plt
 import os
 
+from streaming_validator import check_trajectory
+from trajectory_engine import generate_trajectory
+
 # distに応じたポイント数
 DIST_TO_POINTS = {
     0.05: 100000,
@@ -15,20 +17,7 @@ DIST_TO_POINTS = {
 
 def generate_points(distance, num_points=1000):
     """ランダムウォークでnum_points点の軌道を生成"""
-    points = []
-    current_point = np.array([random.uniform(0.0, 10.0), random.uniform(0.0, 10.0)])
-    points.append(current_point.copy())
-    
-    for _ in range(num_points - 1):
-        while True:
-            angle = random.uniform(0, 2 * np.pi)
-            next_x = current_point[0] + distance * np.cos(angle)
-            next_y = current_point[1] + distance * np.sin(angle)
-            if 0.0 <= next_x <= 10.0 and 0.0 <= next_y <= 10.0:
-                current_point = np.array([next_x, next_y])
-                points.append(current_point.copy())
-                break
-    return np.array(points)
+    return generate_trajectory(distance, num_points)[:, :2]
 
 
 def is_valid_trajectory(points, centroid_threshold=2.0, std_threshold=1.5, range_threshold=6.0):
@@ -61,8 +50,9 @@ def generate_valid_trajectory(distance, max_attempts=20):
     num_points = DIST_TO_POINTS.get(distance, 1000)
     
     for attempt in range(max_attempts):
-        trajectory = generate_points(distance, num_points)
-        is_valid, stats = is_valid_trajectory(trajectory)
+        # 不合格が確定した候補は途中で生成を打ち切る（最後の1回だけは表示用に最後まで作る）
+        last = attempt == max_attempts - 1
+        is_valid, stats, trajectory = check_trajectory(distance, num_points, keep_points=True, early_exit=not last)
         if is_valid:
             return trajectory, stats, attempt + 1
     